@@ -8,6 +8,7 @@ Versions up from 13.05 are based on a C++ engine called CuraEngine.
 """
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
+import sys
 from optparse import OptionParser
 
 from Cura.util import profile
@@ -16,7 +17,7 @@ def main():
 	"""
 	Main Cura entry point. Parses arguments, and starts GUI or slicing process depending on the arguments.
 	"""
-	parser = OptionParser(usage="usage: %prog [options] <filename>.stl")
+	parser = OptionParser(usage="usage: %prog [options] <filename>.stl [<filename>.stl|<directory>|<manifest>.txt ...]")
 	parser.add_option("-i", "--ini", action="store", type="string", dest="profileini",
 		help="Load settings from a profile ini file")
 	parser.add_option("-r", "--print", action="store", type="string", dest="printfile",
@@ -26,7 +27,13 @@ def main():
 	parser.add_option("-s", "--slice", action="store_true", dest="slice",
 		help="Slice the given files instead of opening them in Cura")
 	parser.add_option("-o", "--output", action="store", type="string", dest="output",
-		help="path to write sliced file to")
+		help="path to write sliced file to, or the directory to write the sliced files to when slicing multiple files")
+	parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs",
+		help="Number of files to slice at the same time, defaults to the number of CPU cores")
+	parser.add_option("--summary", action="store", type="string", dest="summary",
+		help="Write a JSON or CSV (depending on the extension) summary of the sliced files")
+	parser.add_option("-z", "--compress", action="store", type="choice", choices=['gz', 'zst'], dest="compress",
+		help="Write compressed GCode files (gz or zst), named .gcode.gz or .gcode.zst. A GCode filename given with -o is compressed depending on its extension")
 	parser.add_option("--serialCommunication", action="store", type="string", dest="serialCommunication",
 		help="Start commandline serial monitor")
 
@@ -51,30 +58,14 @@ def main():
 		from Cura.gui import printWindow
 		printWindow.startPrintInterface(options.printfile)
 	elif options.slice is not None:
-		from Cura.util import sliceEngine
-		from Cura.util import objectScene
-		from Cura.util import meshLoader
-		import shutil
+		from Cura.util import sliceBatch
 
-		def commandlineProgressCallback(progress):
-			if progress >= 0:
-				#print 'Preparing: %d%%' % (progress * 100)
-				pass
-		scene = objectScene.Scene()
-		scene.updateMachineDimensions()
-		engine = sliceEngine.Engine(commandlineProgressCallback)
-		for m in meshLoader.loadMeshes(args[0]):
-			scene.add(m)
-		engine.runEngine(scene)
-		engine.wait()
-
-		if not options.output:
-			options.output = args[0] + '.gcode'
-		with open(options.output, "wb") as f:
-			f.write(engine.getResult().getGCode())
-		print 'GCode file saved : %s' % options.output
-
-		engine.cleanup()
+		compressionExtension = ''
+		if options.compress is not None:
+			compressionExtension = '.' + options.compress
+		summaryList = sliceBatch.runBatch(sliceBatch.collectFiles(args), options.output, options.jobs, options.summary, compressionExtension)
+		if len(filter(lambda summary: not summary['success'], summaryList)) > 0:
+			sys.exit(1)
 	else:
 		from Cura.gui import app
 		app.CuraApp(args).MainLoop()
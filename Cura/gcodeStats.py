@@ -0,0 +1,259 @@
+"""
+Commandline GCode statistics, for auditing a lot of GCode files without the GUI.
+Each file is parsed with the gcodeInterpreter by a pool of worker processes, and the filament use per extruder, layer count, maximum Z,
+estimated print time and the print time per path type are written as CSV or JSON while the files are done.
+Parsed files are stored in the GCode layer cache, so analysing the same files again is fast.
+
+Run it as: python -m Cura.gcodeStats [options] <filename>.gcode [<filename>.gcode|<directory>|<manifest>.txt ...]
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import time
+import math
+import csv
+import json
+import numpy
+import traceback
+import itertools
+import multiprocessing
+from optparse import OptionParser
+
+from Cura.util import profile
+from Cura.util import gcodeCompression
+
+#Settings of this worker process, set when the worker starts.
+_workerUseCache = True
+_workerProcessCount = 1
+_workerVerify = False
+
+def collectFiles(args):
+	"""
+	Expand the commandline arguments to a list of GCode files.
+	Arguments can be GCode files, directories (searched recursively for GCode files, which can be compressed) or manifests.
+	A manifest is a text file (.txt or .lst) with one GCode filename per line, relative filenames are relative to the manifest.
+	"""
+	ret = []
+	for arg in args:
+		if os.path.isdir(arg):
+			for dirname, dirnames, filenames in os.walk(arg):
+				dirnames.sort()
+				for filename in sorted(filenames):
+					if gcodeCompression.isGCodeFilename(filename):
+						ret.append(os.path.join(dirname, filename))
+		elif os.path.splitext(arg)[1].lower() in ['.txt', '.lst']:
+			with open(arg, "r") as f:
+				for line in f:
+					line = line.strip()
+					if len(line) < 1 or line.startswith('#'):
+						continue
+					ret.append(os.path.join(os.path.dirname(arg), line))
+		else:
+			ret.append(arg)
+	return ret
+
+def _initWorker(preferencePath, profileString, useCache, verify, processCount):
+	global _workerUseCache, _workerProcessCount, _workerVerify
+	#On platforms without fork the worker starts without any settings, so load them again.
+	profile.loadPreferences(preferencePath)
+	profile.setProfileFromString(profileString)
+	_workerUseCache = useCache
+	_workerProcessCount = processCount
+	_workerVerify = verify
+
+def analyseFile(filename):
+	"""
+	Parse a GCode file and collect its statistics.
+	:return: A dictionary with the statistics of this file. On failure 'success' is False and 'error' holds the reason.
+	"""
+	from Cura.util import gcodeInterpreter
+	summary = {'file': filename, 'success': False, 'error': None, 'size': 0, 'layerCount': 0, 'maxZ': None, 'filamentMM': [], 'filamentGram': [],
+		'printTimeSeconds': None, 'pathTypeSeconds': {}, 'moveCount': 0, 'cached': False, 'wallTime': 0.0}
+	t = time.time()
+	try:
+		summary['size'] = os.stat(filename).st_size
+		gcode = gcodeInterpreter.gcode(columnar = True)
+		gcode.processCount = _workerProcessCount
+		hitCount = 0
+		if _workerUseCache:
+			gcode.cache = gcodeInterpreter.getLayerCache()
+			hitCount = gcode.cache.getHitCount()
+		gcode.load(filename)
+		if gcode.cache is not None:
+			summary['cached'] = gcode.cache.getHitCount() > hitCount
+		if _workerVerify:
+			#Parse the file again in one go, the layers from the cache or from the worker processes have to be the same.
+			reference = gcodeInterpreter.gcode(columnar = True)
+			reference.load(filename)
+			difference = gcodeInterpreter.compareLayers(gcode.layerList, reference.layerList)
+			if difference is not None:
+				raise Exception('Layers differ from a load in one go, %s' % (difference))
+
+		filament = numpy.zeros(1, numpy.float64)
+		maxZ = None
+		for layer in gcode.layerList:
+			if len(layer) < 1:
+				continue
+			pathExtrusion = numpy.add.reduceat(layer.extrusion.astype(numpy.float64), layer.pathStart[:-1])
+			counts = numpy.bincount(layer.extruder, pathExtrusion)
+			if len(counts) > len(filament):
+				filament = numpy.concatenate([filament, numpy.zeros(len(counts) - len(filament), numpy.float64)])
+			filament[0:len(counts)] += counts
+			extruded = layer.extrusion > 0.0
+			if extruded.any():
+				z = float(layer.points[extruded, 2].max())
+				if maxZ is None or z > maxZ:
+					maxZ = z
+		printTime = gcode.calculatePrintTime()
+
+		radius = profile.getProfileSettingFloat('filament_diameter') / 2.0
+		density = profile.getPreferenceFloat('filament_physical_density')
+		summary['layerCount'] = len(gcode.layerList)
+		summary['maxZ'] = maxZ
+		summary['filamentMM'] = filament.tolist()
+		summary['filamentGram'] = map(lambda mm: mm * math.pi * radius * radius / (1000 * 1000 * 1000) * density * 1000.0, summary['filamentMM'])
+		summary['printTimeSeconds'] = printTime['totalTime']
+		summary['pathTypeSeconds'] = printTime['pathTypeTime']
+		summary['moveCount'] = printTime['moveCount']
+		summary['success'] = True
+	except:
+		summary['error'] = traceback.format_exc().strip().split('\n')[-1]
+	summary['wallTime'] = time.time() - t
+	return summary
+
+def _analyseJob(job):
+	return job[0], analyseFile(job[1])
+
+class _csvWriter(object):
+	""" Writes a row per file, as soon as the file is done. """
+	def __init__(self, f):
+		self._f = f
+		self._writer = csv.writer(f)
+		self._writer.writerow(['file', 'success', 'error', 'size', 'layer_count', 'max_z', 'filament_mm', 'filament_gram',
+			'print_time_seconds', 'path_type_seconds', 'move_count', 'cached', 'wall_time'])
+
+	def write(self, summary):
+		maxZ = ''
+		if summary['maxZ'] is not None:
+			maxZ = '%.3f' % (summary['maxZ'])
+		printTime = ''
+		if summary['printTimeSeconds'] is not None:
+			printTime = '%.1f' % (summary['printTimeSeconds'])
+		self._writer.writerow([summary['file'], summary['success'], summary['error'] or '', summary['size'], summary['layerCount'], maxZ,
+			' '.join(map(lambda n: '%.2f' % (n), summary['filamentMM'])), ' '.join(map(lambda n: '%.2f' % (n), summary['filamentGram'])), printTime,
+			' '.join(map(lambda item: '%s=%.1f' % item, sorted(summary['pathTypeSeconds'].items()))), summary['moveCount'], summary['cached'],
+			'%.3f' % (summary['wallTime'])])
+		self._f.flush()
+
+	def close(self):
+		pass
+
+class _jsonWriter(object):
+	""" Writes a JSON list with a dictionary per file. Each file is written as soon as it is done, so the list is only complete after close. """
+	def __init__(self, f):
+		self._f = f
+		self._count = 0
+		self._f.write('[\n')
+
+	def write(self, summary):
+		if self._count > 0:
+			self._f.write(',\n')
+		self._f.write(json.dumps(summary, sort_keys=True))
+		self._f.flush()
+		self._count += 1
+
+	def close(self):
+		self._f.write('\n]\n')
+
+def runStats(filenames, output, outputFormat = None, jobCount = None, useCache = True, verify = False):
+	"""
+	Analyse all files, using jobCount worker processes. Uses a worker per CPU core if jobCount is None.
+	A single file is parsed in this process, split over jobCount processes when it is large enough.
+	:param verify: Also parse each file in one go without the cache, and fail the file when its layers are different.
+	:param output: The file to write the results to, None to write to stdout.
+	:param outputFormat: 'csv' or 'json', None to use the extension of the output file (and CSV for stdout).
+	:return: The list of file summaries, in the order the files are done.
+	"""
+	if outputFormat is None:
+		outputFormat = 'csv'
+		if output is not None and os.path.splitext(output)[1].lower() == '.json':
+			outputFormat = 'json'
+	if jobCount is None:
+		jobCount = multiprocessing.cpu_count()
+	jobCount = max(1, jobCount)
+	jobs = map(lambda n: (n, filenames[n]), xrange(0, len(filenames)))
+
+	if output is not None:
+		f = open(output, "wb")
+	else:
+		#The results get their own copy of stdout, and stdout itself goes to stderr while the files are analysed.
+		# This keeps the messages of the GCode interpreter (like unknown M codes) out of the results, also those of worker processes.
+		sys.stdout.flush()
+		f = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+		os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+	if outputFormat == 'json':
+		writer = _jsonWriter(f)
+	else:
+		writer = _csvWriter(f)
+
+	initArgs = (profile.getPreferencePath(), profile.getProfileString(), useCache, verify)
+	summaryList = []
+	t = time.time()
+	if jobCount < 2 or len(jobs) < 2:
+		_initWorker(*(initArgs + (jobCount,)))
+		results = itertools.imap(_analyseJob, jobs)
+	else:
+		pool = multiprocessing.Pool(min(jobCount, len(jobs)), _initWorker, initArgs + (1,))
+		results = pool.imap_unordered(_analyseJob, jobs)
+	for index, summary in results:
+		summaryList.append(summary)
+		writer.write(summary)
+	if jobCount > 1 and len(jobs) > 1:
+		pool.close()
+		pool.join()
+	writer.close()
+	if output is None:
+		sys.stdout.flush()
+		os.dup2(f.fileno(), sys.stdout.fileno())
+	f.close()
+	t = time.time() - t
+
+	doneList = filter(lambda summary: summary['success'], summaryList)
+	size = sum(map(lambda summary: summary['size'], doneList)) / 1024.0 / 1024.0
+	moveCount = sum(map(lambda summary: summary['moveCount'], doneList))
+	sys.stderr.write('Analysed %d of %d files (%d from cache) in %.1fs: %.1f files/s, %.1f MB/s, %.2fM moves/s\n' % (
+		len(doneList), len(summaryList), len(filter(lambda summary: summary['cached'], doneList)), t,
+		len(summaryList) / max(t, 0.001), size / max(t, 0.001), moveCount / max(t, 0.001) / 1000000.0))
+	return summaryList
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options] <filename>.gcode [<filename>.gcode|<directory>|<manifest>.txt ...]")
+	parser.add_option("-i", "--ini", action="store", type="string", dest="profileini",
+		help="Load settings from a profile ini file, used for the filament diameter")
+	parser.add_option("-o", "--output", action="store", type="string", dest="output",
+		help="File to write the results to, defaults to stdout")
+	parser.add_option("-f", "--format", action="store", type="choice", choices=['csv', 'json'], dest="format",
+		help="Output format (csv or json), defaults to the extension of the output file or csv")
+	parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs",
+		help="Number of files to analyse at the same time, defaults to the number of CPU cores")
+	parser.add_option("--no-cache", action="store_false", dest="useCache", default=True,
+		help="Do not use or fill the GCode layer cache")
+	parser.add_option("--verify", action="store_true", dest="verify", default=False,
+		help="Check that the layers of each file are the same as when the file is parsed in one go without the cache")
+	(options, args) = parser.parse_args()
+	if len(args) < 1:
+		parser.error("No GCode files given")
+
+	profile.loadPreferences(profile.getPreferencePath())
+	if options.profileini is not None:
+		profile.loadProfile(options.profileini)
+	else:
+		profile.loadProfile(profile.getDefaultProfilePath(), True)
+
+	summaryList = runStats(collectFiles(args), options.output, options.format, options.jobs, options.useCache, options.verify)
+	if len(filter(lambda summary: not summary['success'], summaryList)) > 0:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -52,6 +52,9 @@ class preferencesDialog(wx.Dialog):
 		configBase.SettingRow(right, 'check_for_updates')
 		configBase.SettingRow(right, 'submit_slice_information')
 		configBase.SettingRow(right, 'use_youmagine')
+		configBase.SettingRow(right, 'slice_cache_size')
+		configBase.SettingRow(right, 'gcode_cache_size')
+		configBase.SettingRow(right, 'obj_split_groups')
 
 		self.okButton = wx.Button(right, -1, 'Ok')
 		right.GetSizer().Add(self.okButton, (right.GetSizer().GetRows(), 0), flag=wx.BOTTOM, border=5)
@@ -93,6 +96,8 @@ class machineSettingsDialog(wx.Dialog):
 			configBase.SettingRow(left, 'relative_extrusion', index=idx)
 			configBase.SettingRow(left, 'machine_shape', index=idx)
 			configBase.SettingRow(left, 'gcode_flavor', index=idx)
+			configBase.SettingRow(left, 'machine_acceleration', index=idx)
+			configBase.SettingRow(left, 'machine_jerk', index=idx)
 
 			configBase.TitleRow(right, _("Printer head size"))
 			configBase.SettingRow(right, 'extruder_head_size_min_x', index=idx)
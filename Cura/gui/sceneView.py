@@ -8,7 +8,6 @@ import traceback
 import threading
 import math
 import platform
-import cStringIO as StringIO
 
 import OpenGL
 OpenGL.ERROR_CHECKING = False
@@ -21,6 +20,7 @@ from Cura.util import meshLoader
 from Cura.util import objectScene
 from Cura.util import resources
 from Cura.util import sliceEngine
+from Cura.util import gcodeCompression
 from Cura.util import pluginInfo
 from Cura.util import removableStorage
 from Cura.util import explorer
@@ -54,6 +54,10 @@ class SceneView(openglGui.glGuiPanel):
 		self._platformMesh = {}
 		self._platformTexture = None
 		self._isSimpleMode = True
+		self._loaderList = []
+		self._loadedFileCount = 0
+		self._scaledDownCount = 0
+		self._loadFailedList = []
 		self._printerConnectionManager = printerConnectionManager.PrinterConnectionManager()
 
 		self._viewport = None
@@ -125,8 +129,7 @@ class SceneView(openglGui.glGuiPanel):
 		self.OnDeleteAll(None)
 		#Cheat the engine results to load a GCode file into it.
 		self._engine._result = sliceEngine.EngineResult()
-		with open(filename, "r") as f:
-			self._engine._result.setGCode(f.read())
+		self._engine._result.setGCodeFile(filename)
 		self._engine._result.setFinished(True)
 		self._engineResultView.setResult(self._engine._result)
 		self.printButton.setBottomText('')
@@ -136,13 +139,13 @@ class SceneView(openglGui.glGuiPanel):
 			self.youMagineButton.setDisabled(True)
 		self.OnViewChange()
 
-	def loadSceneFiles(self, filenames):
+	def loadSceneFiles(self, filenames, finishedCallback = None):
 		if profile.getPreference('use_youmagine') == 'True':
 			self.youMagineButton.setDisabled(False)
 		#if self.viewSelection.getValue() == 4:
 		#	self.viewSelection.setValue(0)
 		#	self.OnViewChange()
-		self.loadScene(filenames)
+		self.loadScene(filenames, finishedCallback)
 
 	def loadFiles(self, filenames):
 		mainWindow = self.GetParent().GetParent().GetParent()
@@ -152,8 +155,7 @@ class SceneView(openglGui.glGuiPanel):
 		gcodeFilename = None
 		if len(filenames) == 1:
 			filename = filenames[0]
-			ext = os.path.splitext(filename)[1].lower()
-			if ext == '.g' or ext == '.gcode':
+			if gcodeCompression.isGCodeFilename(filename):
 				gcodeFilename = filename
 				mainWindow.addToModelMRU(filename)
 		if gcodeFilename is not None:
@@ -187,12 +189,14 @@ class SceneView(openglGui.glGuiPanel):
 			mainWindow.updateProfileToAllControls()
 			# now process all the scene files
 			if scene_filenames:
-				self.loadSceneFiles(scene_filenames)
-				self._selectObject(None)
-				self.sceneUpdated()
-				newZoom = numpy.max(self._machineSize)
-				self._animView = openglGui.animation(self, self._viewTarget.copy(), numpy.array([0,0,0], numpy.float32), 0.5)
-				self._animZoom = openglGui.animation(self, self._zoom, newZoom, 0.5)
+				self.loadSceneFiles(scene_filenames, self._onLoadFilesFinished)
+
+	def _onLoadFilesFinished(self):
+		self._selectObject(None)
+		self.sceneUpdated()
+		newZoom = numpy.max(self._machineSize)
+		self._animView = openglGui.animation(self, self._viewTarget.copy(), numpy.array([0,0,0], numpy.float32), 0.5)
+		self._animZoom = openglGui.animation(self, self._zoom, newZoom, 0.5)
 
 	def reloadScene(self, e):
 		# Copy the list before DeleteAll clears it
@@ -206,13 +210,13 @@ class SceneView(openglGui.glGuiPanel):
 		if button == 1:
 			dlg=wx.FileDialog(self, _("Open 3D model"), os.path.split(profile.getPreference('lastFile'))[0], style=wx.FD_OPEN|wx.FD_FILE_MUST_EXIST|wx.FD_MULTIPLE)
 
-			wildcardList = ';'.join(map(lambda s: '*' + s, meshLoader.loadSupportedExtensions() + imageToMesh.supportedExtensions() + ['.g', '.gcode']))
+			wildcardList = ';'.join(map(lambda s: '*' + s, meshLoader.loadSupportedExtensions() + imageToMesh.supportedExtensions() + gcodeCompression.getSupportedExtensions()))
 			wildcardFilter = "All (%s)|%s;%s" % (wildcardList, wildcardList, wildcardList.upper())
 			wildcardList = ';'.join(map(lambda s: '*' + s, meshLoader.loadSupportedExtensions()))
 			wildcardFilter += "|Mesh files (%s)|%s;%s" % (wildcardList, wildcardList, wildcardList.upper())
 			wildcardList = ';'.join(map(lambda s: '*' + s, imageToMesh.supportedExtensions()))
 			wildcardFilter += "|Image files (%s)|%s;%s" % (wildcardList, wildcardList, wildcardList.upper())
-			wildcardList = ';'.join(map(lambda s: '*' + s, ['.g', '.gcode']))
+			wildcardList = ';'.join(map(lambda s: '*' + s, gcodeCompression.getSupportedExtensions()))
 			wildcardFilter += "|GCode files (%s)|%s;%s" % (wildcardList, wildcardList, wildcardList.upper())
 
 			dlg.SetWildcard(wildcardFilter)
@@ -296,7 +300,7 @@ class SceneView(openglGui.glGuiPanel):
 				connection.window = printWindow.printWindowBasic(self, connection)
 		connection.window.Show()
 		connection.window.Raise()
-		if not connection.loadGCodeData(StringIO.StringIO(self._engine.getResult().getGCode())):
+		if not connection.loadGCodeData(self._engine.getResult().getGCodeStream()):
 			if connection.isPrinting():
 				self.notification.message("Cannot start print, because other print still running.")
 			else:
@@ -308,7 +312,10 @@ class SceneView(openglGui.glGuiPanel):
 		dlg=wx.FileDialog(self, _("Save toolpath"), os.path.dirname(profile.getPreference('lastFile')), style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
 		filename = self._scene._objectList[0].getName() + '.gcode'
 		dlg.SetFilename(filename)
-		dlg.SetWildcard('Toolpath (*.gcode)|*.gcode;*.g')
+		wildcardFilter = 'Toolpath (*.gcode)|*.gcode;*.g'
+		for ext in gcodeCompression.getCompressionExtensions():
+			wildcardFilter += '|Compressed toolpath (*.gcode%s)|*.gcode%s' % (ext, ext)
+		dlg.SetWildcard(wildcardFilter)
 		if dlg.ShowModal() != wx.ID_OK:
 			dlg.Destroy()
 			return
@@ -318,18 +325,11 @@ class SceneView(openglGui.glGuiPanel):
 		threading.Thread(target=self._saveGCode,args=(filename,)).start()
 
 	def _saveGCode(self, targetFilename, ejectDrive = False):
-		data = self._engine.getResult().getGCode()
+		def progressCallback(progress):
+			self.printButton.setProgressBar(progress)
+			self._queueRefresh()
 		try:
-			size = float(len(data))
-			fsrc = StringIO.StringIO(data)
-			with open(targetFilename, 'wb') as fdst:
-				while 1:
-					buf = fsrc.read(16*1024)
-					if not buf:
-						break
-					fdst.write(buf)
-					self.printButton.setProgressBar(float(fsrc.tell()) / size)
-					self._queueRefresh()
+			self._engine.getResult().saveGCode(targetFilename, progressCallback)
 		except:
 			import sys, traceback
 			traceback.print_exc()
@@ -481,6 +481,7 @@ class SceneView(openglGui.glGuiPanel):
 		self.sceneUpdated()
 
 	def OnDeleteAll(self, e):
+		self._cancelLoading()
 		while len(self._scene.objects()) > 0:
 			self._deleteObject(self._scene.objects()[0])
 		self._animView = openglGui.animation(self, self._viewTarget.copy(), numpy.array([0,0,0], numpy.float32), 0.5)
@@ -585,30 +586,95 @@ class SceneView(openglGui.glGuiPanel):
 			self.printButton.setBottomText('')
 		self.QueueRefresh()
 
-	def loadScene(self, fileList):
+	def loadScene(self, fileList, finishedCallback = None):
+		"""
+		Load model files into the scene. The files are loaded in the background, each object is added to the scene as soon as its file is loaded.
+		:param finishedCallback: Called when all files are loaded, not when loading is cancelled.
+		"""
+		meshFileList = []
 		for filename in fileList:
-			try:
-				ext = os.path.splitext(filename)[1].lower()
-				if ext in imageToMesh.supportedExtensions():
+			ext = os.path.splitext(filename)[1].lower()
+			if ext in imageToMesh.supportedExtensions():
+				try:
 					imageToMesh.convertImageDialog(self, filename).Show()
-					objList = []
-				else:
-					objList = meshLoader.loadMeshes(filename)
-			except:
-				traceback.print_exc()
+				except:
+					traceback.print_exc()
 			else:
-				for obj in objList:
-					if self._objectLoadShader is not None:
-						obj._loadAnim = openglGui.animation(self, 1, 0, 1.5)
-					else:
-						obj._loadAnim = None
-					self._scene.add(obj)
-					if not self._scene.checkPlatform(obj):
-						self._scene.centerAll()
-					self._selectObject(obj)
-					if obj.getScale()[0] < 1.0:
+				meshFileList.append(filename)
+		if len(meshFileList) < 1:
+			if finishedCallback is not None:
+				finishedCallback()
+			return
+		if len(self._loaderList) < 1:
+			self._loadedFileCount = 0
+			self._scaledDownCount = 0
+			self._loadFailedList = []
+		loader = meshLoader.BackgroundLoader(meshFileList, lambda filename, objList: wx.CallAfter(self._onMeshesLoaded, loader, objList), lambda: wx.CallAfter(self._onLoadFinished, loader, finishedCallback))
+		self._loaderList.append(loader)
+		self._updateLoadProgress()
+		loader.start()
+
+	def _onMeshesLoaded(self, loader, objList):
+		if loader.isCancelled():
+			return
+		self._loadedFileCount += 1
+		if objList is not None:
+			for obj in objList:
+				if self._objectLoadShader is not None:
+					obj._loadAnim = openglGui.animation(self, 1, 0, 1.5)
+				else:
+					obj._loadAnim = None
+				self._scene.add(obj)
+				if not self._scene.checkPlatform(obj):
+					self._scene.centerAll()
+				#Only zoom in on a single model, zooming to each model of a batch while they come in is confusing.
+				self._selectObject(obj, self._getLoadFileCount() < 2)
+				if obj.getScale()[0] < 1.0:
+					self._scaledDownCount += 1
+					if self._getLoadFileCount() < 2:
 						self.notification.message("Warning: Object scaled down.")
-		self.sceneUpdated()
+			self.sceneUpdated()
+		self._updateLoadProgress()
+
+	def _onLoadFinished(self, loader, finishedCallback):
+		if loader.isCancelled():
+			return
+		self._loadFailedList += loader.getFailedList()
+		fileCount = self._getLoadFileCount()
+		self._loaderList.remove(loader)
+		if len(self._loaderList) < 1 and fileCount > 1:
+			text = _("Loaded %d of %d files") % (fileCount - len(self._loadFailedList), fileCount)
+			if self._scaledDownCount > 0:
+				text += _(", %d objects scaled down") % (self._scaledDownCount)
+			if len(self._loadFailedList) > 0:
+				text += _(", failed: %s") % (', '.join(map(os.path.basename, self._loadFailedList)))
+			self.notification.message(text)
+		elif len(self._loadFailedList) > 0:
+			self.notification.message(_("Failed to load %s") % (', '.join(map(os.path.basename, self._loadFailedList))))
+		if finishedCallback is not None:
+			finishedCallback()
+
+	def _getLoadFileCount(self):
+		return sum(map(lambda loader: loader.getProgress()[1], self._loaderList))
+
+	def _updateLoadProgress(self):
+		#Show the progress when more then 1 file is loaded, with a button to cancel the loading.
+		fileCount = self._getLoadFileCount()
+		if fileCount < 2:
+			return
+		text = _("Loading models: %d of %d files done") % (self._loadedFileCount, fileCount)
+		if self._loadedFileCount < 1:
+			self.notification.message(text, self._cancelLoading, 30, _("Cancel loading"))
+		else:
+			self.notification.setText(text)
+
+	def _cancelLoading(self):
+		if len(self._loaderList) < 1:
+			return
+		for loader in self._loaderList:
+			loader.cancel()
+		self._loaderList = []
+		self.notification.message(_("Loading cancelled, loaded %d files") % (self._loadedFileCount))
 
 	def _deleteObject(self, obj):
 		if obj == self._selectedObj:
@@ -18,6 +18,7 @@ class engineResultView(object):
 	def __init__(self, parent):
 		self._parent = parent
 		self._result = None
+		self._gcodeLayers = None
 		self._enabled = False
 		self._gcodeLoadProgress = 0
 		self._resultLock = threading.Lock()
@@ -44,6 +45,7 @@ class engineResultView(object):
 				self._parent.glReleaseList.append(layer[typeName])
 		self._layerVBOs = []
 		self._layer20VBOs = []
+		self._gcodeLayers = None
 		self._resultLock.release()
 
 	def setEnabled(self, enabled):
@@ -66,6 +68,10 @@ class engineResultView(object):
 		result = self._result
 		if result is not None:
 			gcodeLayers = result.getGCodeLayers(self._gcodeLoadCallback)
+			if gcodeLayers is not self._gcodeLayers:
+				#The layers are parsed while slicing, they are replaced when post-processing plugins change the GCode.
+				self._releaseGCodeVBOs()
+				self._gcodeLayers = gcodeLayers
 			if result._polygons is not None and len(result._polygons) > 0:
 				self.layerSelect.setRange(1, len(result._polygons))
 			elif gcodeLayers is not None and len(gcodeLayers) > 0:
@@ -106,10 +112,10 @@ class engineResultView(object):
 					if result._polygons is not None and n + 20 < len(result._polygons):
 						layerVBOs = self._layer20VBOs[idx]
 						for typeName, typeNameGCode, color in lineTypeList:
-							allow = typeName in result._polygons[n + 19]
+							allow = result._polygons.hasType(n + 19, typeName)
 							if typeName == 'skirt':
 								for i in xrange(0, 20):
-									if typeName in result._polygons[n + i]:
+									if result._polygons.hasType(n + i, typeName):
 										allow = True
 							if allow:
 								if typeName not in layerVBOs:
@@ -117,8 +123,8 @@ class engineResultView(object):
 										continue
 									polygons = []
 									for i in xrange(0, 20):
-										if typeName in result._polygons[n + i]:
-											polygons += result._polygons[n + i][typeName]
+										if result._polygons.hasType(n + i, typeName):
+											polygons.append(result._polygons.getPolygons(n + i, typeName))
 									layerVBOs[typeName] = self._polygonsToVBO_lines(polygons)
 									generatedVBO = True
 								glColor4f(color[0]*0.5,color[1]*0.5,color[2]*0.5,color[3])
@@ -145,11 +151,10 @@ class engineResultView(object):
 							glColor4f(0,0,c,1)
 							layerVBOs['GCODE-MOVE'].render()
 					elif n < len(result._polygons):
-						polygons = result._polygons[n]
 						for typeName, typeNameGCode, color in lineTypeList:
-							if typeName in polygons:
+							if result._polygons.hasType(n, typeName):
 								if typeName not in layerVBOs:
-									layerVBOs[typeName] = self._polygonsToVBO_lines(polygons[typeName])
+									layerVBOs[typeName] = self._polygonsToVBO_lines([result._polygons.getPolygons(n, typeName)])
 								glColor4f(color[0]*c,color[1]*c,color[2]*c,color[3])
 								layerVBOs[typeName].render()
 					n -= 1
@@ -166,18 +171,43 @@ class engineResultView(object):
 			glPopMatrix()
 		self._resultLock.release()
 
+	def _releaseGCodeVBOs(self):
+		for layer in self._layerVBOs:
+			for typeName in layer.keys():
+				if typeName.startswith('GCODE-'):
+					self._parent.glReleaseList.append(layer[typeName])
+					del layer[typeName]
+
 	def _polygonsToVBO_lines(self, polygons):
-		verts = numpy.zeros((0, 3), numpy.float32)
-		indices = numpy.zeros((0), numpy.uint32)
-		for poly in polygons:
-			if len(poly) > 2:
-				i = numpy.arange(len(verts), len(verts) + len(poly) + 1, 1, numpy.uint32)
-				i[-1] = len(verts)
-				i = numpy.dstack((i[0:-1],i[1:])).flatten()
-			else:
-				i = numpy.arange(len(verts), len(verts) + len(poly), 1, numpy.uint32)
-			indices = numpy.concatenate((indices, i), 0)
-			verts = numpy.concatenate((verts, poly), 0)
+		"""
+		Create a line VBO from layer polygons.
+		:param polygons: List of (points, offsets, z) tuples as returned by LayerPolygons.getPolygons
+		"""
+		pointCount = sum(map(lambda p: len(p[0]), polygons))
+		verts = numpy.empty((pointCount, 3), numpy.float32)
+		starts = []
+		ends = []
+		idx = 0
+		for points, offsets, z in polygons:
+			verts[idx:idx+len(points),0:2] = points
+			verts[idx:idx+len(points),2] = z
+			starts.append(offsets[:-1] + idx)
+			ends.append(offsets[1:] + idx)
+			idx += len(points)
+		if len(starts) < 1:
+			return openglHelpers.GLVBO(GL_LINES, verts, indicesArray=numpy.zeros((0), numpy.uint32))
+		starts = numpy.concatenate(starts)
+		ends = numpy.concatenate(ends)
+		#Every point is connected to the next point of its polygon, and the last point is connected back to the first.
+		# Polygons of 2 points are a single line, and single points are not drawn.
+		lengths = ends - starts
+		closed = lengths > 0
+		first = numpy.arange(0, pointCount, 1, numpy.uint32)
+		second = first + 1
+		second[ends[closed] - 1] = starts[closed]
+		keep = numpy.ones(pointCount, numpy.bool)
+		keep[ends[closed & (lengths <= 2)] - 1] = False
+		indices = numpy.dstack((first[keep], second[keep])).flatten()
 		return openglHelpers.GLVBO(GL_LINES, verts, indicesArray=indices)
 
 	def _polygonsToVBO_quads(self, polygons):
@@ -200,16 +230,15 @@ class engineResultView(object):
 			extrudeType = extrudeType[0:extrudeType.find(':')]
 		else:
 			extruder = None
-		verts = numpy.zeros((0, 3), numpy.float32)
-		indices = numpy.zeros((0), numpy.uint32)
+		verts = [numpy.zeros((0, 3), numpy.float32)]
+		indices = [numpy.zeros((0), numpy.uint32)]
+		vertCount = 0
 		for layer in gcodeLayers:
-			for path in layer:
-				if path['type'] == 'extrude' and path['pathType'] == extrudeType and (extruder is None or path['extruder'] == extruder):
-					i = numpy.arange(len(verts), len(verts) + len(path['points']), 1, numpy.uint32)
-					i = numpy.dstack((i[0:-1],i[1:])).flatten()
-					indices = numpy.concatenate((indices, i), 0)
-					verts = numpy.concatenate((verts, path['points']))
-		return openglHelpers.GLVBO(GL_LINES, verts, indicesArray=indices)
+			starts, pathIndexes = layer.getSegments(layer.getPathIndexes('extrude', extrudeType, extruder))
+			verts.append(layer.points)
+			indices.append(numpy.dstack((starts, starts + 1)).flatten().astype(numpy.uint32) + vertCount)
+			vertCount += len(layer.points)
+		return openglHelpers.GLVBO(GL_LINES, numpy.concatenate(verts), indicesArray=numpy.concatenate(indices))
 
 	def _gcodeToVBO_quads(self, gcodeLayers, extrudeType):
 		useFilamentArea = profile.getMachineSetting('gcode_flavor') == 'UltiGCode'
@@ -222,62 +251,55 @@ class engineResultView(object):
 		else:
 			extruder = None
 
-		verts = numpy.zeros((0, 3), numpy.float32)
-		indices = numpy.zeros((0), numpy.uint32)
+		verts = [numpy.zeros((0, 3), numpy.float32)]
 		for layer in gcodeLayers:
-			for path in layer:
-				if path['type'] == 'extrude' and path['pathType'] == extrudeType and (extruder is None or path['extruder'] == extruder):
-					a = path['points']
-					if extrudeType == 'FILL':
-						a[:,2] += 0.01
-
-					#Construct the normals of each line 90deg rotated on the X/Y plane
-					normals = a[1:] - a[:-1]
-					lengths = numpy.sqrt(normals[:,0]**2 + normals[:,1]**2)
-					normals[:,0], normals[:,1] = -normals[:,1] / lengths, normals[:,0] / lengths
-					normals[:,2] /= lengths
+			#All line segments of the matching extrude paths at once, each segment becomes a quad.
+			starts, pathIndexes = layer.getSegments(layer.getPathIndexes('extrude', extrudeType, extruder))
+			a0 = layer.points[starts]
+			a1 = layer.points[starts + 1]
+			if extrudeType == 'FILL':
+				a0[:,2] += 0.01
+				a1[:,2] += 0.01
 
-					ePerDist = path['extrusion'][1:] / lengths
-					if useFilamentArea:
-						lineWidth = ePerDist / path['layerThickness'] / 2.0
-					else:
-						lineWidth = ePerDist * (filamentArea / path['layerThickness'] / 2)
+			#Construct the normals of each line 90deg rotated on the X/Y plane
+			normals = a1 - a0
+			lengths = numpy.sqrt(normals[:,0]**2 + normals[:,1]**2)
+			normals[:,0], normals[:,1] = -normals[:,1] / lengths, normals[:,0] / lengths
+			normals[:,2] /= lengths
 
-					normals[:,0] *= lineWidth
-					normals[:,1] *= lineWidth
-
-					b = numpy.zeros((len(a)-1, 0), numpy.float32)
-					b = numpy.concatenate((b, a[1:] + normals), 1)
-					b = numpy.concatenate((b, a[1:] - normals), 1)
-					b = numpy.concatenate((b, a[:-1] - normals), 1)
-					b = numpy.concatenate((b, a[:-1] + normals), 1)
-					b = b.reshape((len(b) * 4, 3))
+			ePerDist = layer.extrusion[starts + 1] / lengths
+			layerThickness = layer.layerThickness[pathIndexes]
+			if useFilamentArea:
+				lineWidth = ePerDist / layerThickness / 2.0
+			else:
+				lineWidth = ePerDist * (filamentArea / layerThickness / 2)
 
-					i = numpy.arange(len(verts), len(verts) + len(b), 1, numpy.uint32)
+			normals[:,0] *= lineWidth
+			normals[:,1] *= lineWidth
 
-					verts = numpy.concatenate((verts, b))
-					indices = numpy.concatenate((indices, i))
-		return openglHelpers.GLVBO(GL_QUADS, verts, indicesArray=indices)
+			b = numpy.concatenate((a1 + normals, a1 - normals, a0 - normals, a0 + normals), 1)
+			verts.append(b.reshape((len(b) * 4, 3)).astype(numpy.float32))
+		verts = numpy.concatenate(verts)
+		return openglHelpers.GLVBO(GL_QUADS, verts, indicesArray=numpy.arange(0, len(verts), 1, numpy.uint32))
 
 	def _gcodeToVBO_lines(self, gcodeLayers):
-		verts = numpy.zeros((0,3), numpy.float32)
-		indices = numpy.zeros((0), numpy.uint32)
+		verts = [numpy.zeros((0, 3), numpy.float32)]
+		indices = [numpy.zeros((0), numpy.uint32)]
+		vertCount = 0
 		for layer in gcodeLayers:
-			for path in layer:
-				if path['type'] == 'move':
-					a = path['points'] + numpy.array([0,0,0.02], numpy.float32)
-					i = numpy.arange(len(verts), len(verts) + len(a), 1, numpy.uint32)
-					i = numpy.dstack((i[0:-1],i[1:])).flatten()
-					verts = numpy.concatenate((verts, a))
-					indices = numpy.concatenate((indices, i))
-				if path['type'] == 'retract':
-					a = path['points'] + numpy.array([0,0,0.02], numpy.float32)
-					a = numpy.concatenate((a[:-1], a[1:] + numpy.array([0,0,1], numpy.float32)), 1)
-					a = a.reshape((len(a) * 2, 3))
-					i = numpy.arange(len(verts), len(verts) + len(a), 1, numpy.uint32)
-					verts = numpy.concatenate((verts, a))
-					indices = numpy.concatenate((indices, i))
-		return openglHelpers.GLVBO(GL_LINES, verts, indicesArray=indices)
+			a = layer.points + numpy.array([0,0,0.02], numpy.float32)
+			starts, pathIndexes = layer.getSegments(layer.getPathIndexes('move'))
+			verts.append(a)
+			indices.append(numpy.dstack((starts, starts + 1)).flatten().astype(numpy.uint32) + vertCount)
+			vertCount += len(a)
+			#Retractions are drawn as a line going up from each point.
+			starts, pathIndexes = layer.getSegments(layer.getPathIndexes('retract'))
+			b = numpy.concatenate((a[starts], a[starts + 1] + numpy.array([0,0,1], numpy.float32)), 1)
+			b = b.reshape((len(b) * 2, 3))
+			verts.append(b)
+			indices.append(numpy.arange(vertCount, vertCount + len(b), 1, numpy.uint32))
+			vertCount += len(b)
+		return openglHelpers.GLVBO(GL_LINES, numpy.concatenate(verts), indicesArray=numpy.concatenate(indices))
 
 	def OnKeyChar(self, keyCode):
 		if not self._enabled:
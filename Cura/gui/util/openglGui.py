@@ -740,6 +740,12 @@ class glNotification(glFrame):
 		self._base._queueRefresh()
 		self.updateLayout()
 
+	def setText(self, text):
+		#Change the text of the message that is shown, without showing it again.
+		self._label.setLabel(text)
+		self._base._queueRefresh()
+		self.updateLayout()
+
 	def onExtraButton(self, button):
 		self.onClose(button)
 		self._extraButtonCallback()
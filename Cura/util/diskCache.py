@@ -0,0 +1,170 @@
+"""
+The diskCache module contains a simple size bounded file cache.
+Results that are expensive to calculate (like slicing results) are stored in a directory in the Cura configuration path,
+and are reused when the same input is seen again. When the cache grows beyond its maximum size the least recently used entries are removed.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import time
+import shutil
+import threading
+
+from Cura.util import profile
+
+class DiskCache(object):
+	"""
+	A least recently used cache of files on disk.
+	Each entry in the cache is identified by a key (usually a hex digest) and consists of 1 or more files named [key][suffix].
+	The modification time of the files is used to track the last use of an entry, so the LRU order survives restarts of Cura.
+	"""
+	def __init__(self, name, maxSize):
+		self._path = os.path.join(profile.getBasePath(), name)
+		self._maxSize = maxSize
+		self._hitCount = 0
+		self._missCount = 0
+		self._lock = threading.Lock()
+
+	def getPath(self):
+		return self._path
+
+	def setMaxSize(self, maxSize):
+		self._maxSize = maxSize
+		self._evict()
+
+	def getMaxSize(self):
+		return self._maxSize
+
+	def isEnabled(self):
+		return self._maxSize > 0
+
+	def getFilename(self, key, suffix):
+		return os.path.join(self._path, key + suffix)
+
+	def lookup(self, key, suffixes):
+		"""
+		Find a cache entry. Counts as a hit or a miss and marks the entry as recently used.
+		:param key: The key of the cache entry.
+		:param suffixes: List of file suffixes which all need to be present for the entry to be valid.
+		:return: A list of filenames in the same order as the suffixes, or None when the entry is not in the cache.
+		"""
+		if not self.isEnabled():
+			return None
+		filenames = map(lambda suffix: self.getFilename(key, suffix), suffixes)
+		for filename in filenames:
+			if not os.path.isfile(filename):
+				self._missCount += 1
+				return None
+		now = time.time()
+		for filename in filenames:
+			try:
+				os.utime(filename, (now, now))
+			except:
+				pass
+		self._hitCount += 1
+		return filenames
+
+	def store(self, key, suffix, data):
+		""" Store a string of data as part of the cache entry for the given key. """
+		if not self.isEnabled():
+			return
+		self._makePath()
+		tempFilename = self.getFilename(key, suffix) + '.tmp'
+		with open(tempFilename, 'wb') as f:
+			f.write(data)
+		self._commit(tempFilename, self.getFilename(key, suffix))
+
+	def storeFile(self, key, suffix, sourceFilename):
+		""" Copy an existing file into the cache as part of the cache entry for the given key. """
+		if not self.isEnabled():
+			return
+		self._makePath()
+		tempFilename = self.getFilename(key, suffix) + '.tmp'
+		shutil.copyfile(sourceFilename, tempFilename)
+		self._commit(tempFilename, self.getFilename(key, suffix))
+
+	def finishEntry(self):
+		""" Call this after all files of an entry are stored, this will evict old entries when the cache is too large. """
+		self._evict()
+
+	def remove(self, key):
+		for filename in self._listFiles():
+			if filename.startswith(key):
+				try:
+					os.unlink(os.path.join(self._path, filename))
+				except:
+					pass
+
+	def clear(self):
+		for filename in self._listFiles():
+			try:
+				os.unlink(os.path.join(self._path, filename))
+			except:
+				pass
+
+	def getHitCount(self):
+		return self._hitCount
+
+	def getMissCount(self):
+		return self._missCount
+
+	def getSize(self):
+		size = 0
+		for filename in self._listFiles():
+			try:
+				size += os.stat(os.path.join(self._path, filename)).st_size
+			except OSError:
+				pass
+		return size
+
+	def getStats(self):
+		return {'hits': self._hitCount, 'misses': self._missCount, 'size': self.getSize(), 'maxSize': self._maxSize}
+
+	def _makePath(self):
+		if not os.path.isdir(self._path):
+			try:
+				os.makedirs(self._path)
+			except OSError:
+				pass
+
+	def _commit(self, tempFilename, filename):
+		#Rename into place, so a half written file is never seen as a valid cache entry.
+		if os.path.exists(filename):
+			os.unlink(filename)
+		os.rename(tempFilename, filename)
+
+	def _listFiles(self):
+		if not os.path.isdir(self._path):
+			return []
+		return filter(lambda f: not f.endswith('.tmp'), os.listdir(self._path))
+
+	def _evict(self):
+		self._lock.acquire()
+		try:
+			entries = {}
+			totalSize = 0
+			for filename in self._listFiles():
+				key = filename.split('.', 1)[0]
+				try:
+					stat = os.stat(os.path.join(self._path, filename))
+				except OSError:
+					continue
+				if key not in entries:
+					entries[key] = [0, 0, []]
+				entries[key][0] = max(entries[key][0], stat.st_mtime)
+				entries[key][1] += stat.st_size
+				entries[key][2].append(filename)
+				totalSize += stat.st_size
+			if totalSize <= self._maxSize:
+				return
+			for lastUse, size, filenames in sorted(entries.values()):
+				for filename in filenames:
+					try:
+						os.unlink(os.path.join(self._path, filename))
+					except OSError:
+						pass
+				totalSize -= size
+				if totalSize <= self._maxSize:
+					break
+		finally:
+			self._lock.release()
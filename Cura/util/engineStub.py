@@ -0,0 +1,160 @@
+"""
+Stand-in for the CuraEngine executable, used to benchmark the Python side of slicing without a real engine.
+It understands the same commandline and socket protocol as the engine: it connects to the -g port (or unix socket path), requests
+the meshes of each object, sends synthetic layer polygons, reports progress on stderr and writes synthetic GCode on stdout.
+
+Run it as: python engineStub.py [--layers N] [--polygons N] [--points N] [--gcode-lines N] [engine arguments]
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import sys
+import os
+import math
+import socket
+import struct
+
+GUI_CMD_REQUEST_MESH = 0x01
+GUI_CMD_SEND_POLYGONS = 0x02
+GUI_CMD_FINISH_OBJECT = 0x03
+
+#The types send for each layer, with the GCode type comment used for the matching GCode.
+_polygonTypes = [('inset0', 'WALL-OUTER'), ('insetx', 'WALL-INNER'), ('skin', 'FILL')]
+
+class engineStub(object):
+	"""
+	A fake engine run. The amount of output is set by the stub options, the engine arguments are used like the real engine does.
+	"""
+	def __init__(self, args):
+		self._layerCount = 100
+		self._polygonCount = 50
+		self._pointCount = 30
+		self._gcodeLineCount = 100000
+		self._settings = {}
+		self._address = None
+		self._meshCounts = []
+		self._polygonData = None
+		self._layerGCode = None
+		self._parseArguments(args)
+
+	def _parseArguments(self, args):
+		options = {'--layers': '_layerCount', '--polygons': '_polygonCount', '--points': '_pointCount', '--gcode-lines': '_gcodeLineCount'}
+		n = 0
+		while n < len(args):
+			arg = args[n]
+			if arg in options:
+				setattr(self, options[arg], int(args[n + 1]))
+				n += 1
+			elif arg == '-s':
+				key, value = args[n + 1].split('=', 1)
+				self._settings[key] = value
+				n += 1
+			elif arg == '-g':
+				self._address = args[n + 1]
+				n += 1
+			elif arg == '-m':
+				n += 1
+			elif arg.startswith('$'):
+				self._meshCounts.append(len(arg))
+			n += 1
+
+	def _connect(self):
+		if self._address is None:
+			return None
+		if self._address.isdigit():
+			return socket.create_connection(('127.0.0.1', int(self._address)))
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.connect(self._address)
+		return sock
+
+	def _recvAll(self, sock, size):
+		data = []
+		while size > 0:
+			chunk = sock.recv(min(size, 1024 * 1024))
+			if len(chunk) < 1:
+				raise IOError('Socket closed')
+			data.append(chunk)
+			size -= len(chunk)
+		return ''.join(data)
+
+	def _requestMesh(self, sock):
+		sock.sendall(struct.pack('@i', GUI_CMD_REQUEST_MESH))
+		vertexCount = struct.unpack('@i', self._recvAll(sock, 4))[0]
+		self._recvAll(sock, vertexCount * 3 * 4)
+		return vertexCount
+
+	def _polygonPacket(self, layerNr, z, typeName):
+		#The same circles around the center of the build plate are send for every layer, coordinates in micron like the engine.
+		# They are only generated once, so the time of the stub itself does not count much in the measurements.
+		if self._polygonData is None:
+			angles = [math.pi * 2 * n / self._pointCount for n in xrange(0, self._pointCount)]
+			data = []
+			for n in xrange(0, self._polygonCount):
+				r = 5000 + n * 400
+				points = []
+				for a in angles:
+					points += [int(math.cos(a) * r) + 100000, int(math.sin(a) * r) + 100000]
+				data.append(struct.pack('@i', self._pointCount))
+				data.append(struct.pack('@%dq' % (len(points)), *points))
+			self._polygonData = ''.join(data)
+		return struct.pack('@iiiii', GUI_CMD_SEND_POLYGONS, self._polygonCount, layerNr, z, len(typeName)) + typeName + self._polygonData
+
+	def _writeLayerGCode(self, layerNr, z, lineCount):
+		if self._layerGCode is None:
+			linesPerType = max(1, lineCount / len(_polygonTypes))
+			e = 0.0
+			lines = []
+			for typeName, gcodeType in _polygonTypes:
+				lines.append(';TYPE:%s\n' % (gcodeType))
+				for n in xrange(0, linesPerType):
+					a = math.pi * 2 * n / linesPerType
+					e += 0.05
+					lines.append('G1 X%0.3f Y%0.3f E%0.5f\n' % (100.0 + math.cos(a) * 20.0, 100.0 + math.sin(a) * 20.0, e))
+			lines.append('G92 E0\n')
+			self._layerGCode = ''.join(lines)
+		sys.stdout.write(';LAYER:%d\nG0 F9000 X100.000 Y100.000 Z%0.3f\n' % (layerNr, z / 1000.0))
+		sys.stdout.write(self._layerGCode)
+
+	def run(self):
+		sock = self._connect()
+		err = sys.stderr
+		sys.stdout.write(';FLAVOR:RepRap\n;TIME:<__TIME__>\n;Generated with CuraEngine stub\n')
+		sys.stdout.write(self._settings.get('startCode', '') + '\n')
+		layerThickness = int(self._settings.get('layerThickness', '100'))
+		linesPerLayer = self._gcodeLineCount / max(1, self._layerCount * max(1, len(self._meshCounts)))
+		layerOffset = 0
+		for meshCount in self._meshCounts:
+			if sock is not None:
+				for n in xrange(0, meshCount):
+					self._requestMesh(sock)
+			err.write('Progress:process\n')
+			for layerNr in xrange(0, self._layerCount):
+				err.write('Progress:inset:%d:%d\n' % (layerNr + 1, self._layerCount))
+				if sock is not None:
+					z = layerThickness * (layerNr + 1)
+					for typeName, gcodeType in _polygonTypes:
+						sock.sendall(self._polygonPacket(layerNr, z, typeName))
+			for layerNr in xrange(0, self._layerCount):
+				err.write('Progress:skin:%d:%d\n' % (layerNr + 1, self._layerCount))
+			for layerNr in xrange(0, self._layerCount):
+				err.write('Progress:export:%d:%d\n' % (layerNr + 1, self._layerCount))
+				self._writeLayerGCode(layerOffset + layerNr, layerThickness * (layerNr + 1), linesPerLayer)
+			layerOffset += self._layerCount
+			if sock is not None:
+				sock.sendall(struct.pack('@i', GUI_CMD_FINISH_OBJECT))
+		sys.stdout.write(self._settings.get('endCode', '') + '\n')
+		sys.stdout.flush()
+		err.write('Print time:%d\n' % (self._layerCount * len(self._meshCounts) * 30))
+		err.write('Filament:%d\n' % (self._gcodeLineCount / 20))
+		err.write('Replace:<__TIME__>:%d\n' % (self._layerCount * len(self._meshCounts) * 30))
+		if sock is not None:
+			sock.close()
+
+def getCommand(layerCount = 100, polygonCount = 50, pointCount = 30, gcodeLineCount = 100000):
+	"""
+	:return: The command list to run the stub with the given amount of output, to be used with Engine.setEngineCommand.
+	"""
+	return [sys.executable, os.path.abspath(__file__.replace('.pyc', '.py')),
+		'--layers', str(layerCount), '--polygons', str(polygonCount), '--points', str(pointCount), '--gcode-lines', str(gcodeLineCount)]
+
+if __name__ == '__main__':
+	engineStub(sys.argv[1:]).run()
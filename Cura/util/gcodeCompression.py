@@ -0,0 +1,175 @@
+"""
+The gcodeCompression module opens GCode files that can be compressed. GCode compresses about 5 to 10 times, which helps for archives and network shares.
+Files ending in .gz are gzip compressed, files ending in .zst are zstd compressed (this needs the zstandard module).
+The files are (de)compressed while they are read or written, so a compressed file is never completely inflated in memory.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import zlib
+import struct
+
+try:
+	import zstandard
+except:
+	zstandard = None
+
+#Plain GCode extensions, and the extensions of the compression formats that can be added after them.
+gcodeExtensions = ['.g', '.gcode']
+_compressionExtensions = {'.gz': 'gzip', '.zst': 'zstd'}
+
+def getCompressionExtensions():
+	""" :return: The extensions of the compression formats that can be used, zstd is only available with the zstandard module. """
+	ret = ['.gz']
+	if zstandard is not None:
+		ret.append('.zst')
+	return ret
+
+def getSupportedExtensions():
+	""" :return: All GCode extensions, like .gcode and .gcode.gz """
+	ret = list(gcodeExtensions)
+	for compressionExtension in getCompressionExtensions():
+		ret += map(lambda ext: ext + compressionExtension, gcodeExtensions)
+	return ret
+
+def getCompression(filename):
+	""" :return: 'gzip' or 'zstd' when the filename has the extension of a compression format, None for plain files. """
+	return _compressionExtensions.get(os.path.splitext(filename)[1].lower())
+
+def stripCompressionExtension(filename):
+	""" :return: The filename without the extension of the compression format. """
+	if getCompression(filename) is not None:
+		return os.path.splitext(filename)[0]
+	return filename
+
+def isGCodeFilename(filename):
+	return os.path.splitext(stripCompressionExtension(filename))[1].lower() in gcodeExtensions
+
+def openGCodeFile(filename, mode = 'rb'):
+	"""
+	Open a GCode file, compressed files are decompressed while reading and compressed while writing.
+	:param mode: 'rb' to read, 'wb' to write.
+	:return: A file like object. For reading it has read, readline, iteration over the lines and close, for writing write and close.
+	"""
+	compression = getCompression(filename)
+	if compression is None:
+		return open(filename, mode)
+	if compression == 'zstd' and zstandard is None:
+		raise IOError('Reading or writing %s needs the zstandard module' % (filename))
+	if mode.startswith('w'):
+		return _compressedWriter(filename, compression)
+	return _compressedReader(filename, compression)
+
+def getUncompressedSize(filename):
+	"""
+	:return: The size of the GCode in a file after decompression, from the file header or trailer. None when the size is not stored in the file.
+	"""
+	compression = getCompression(filename)
+	size = os.stat(filename).st_size
+	if compression is None:
+		return size
+	try:
+		with open(filename, 'rb') as f:
+			if compression == 'gzip':
+				#The last 4 bytes are the size of the last member modulo 2^32, which is the whole size for the files written here.
+				f.seek(-4, 2)
+				ret = struct.unpack('<I', f.read(4))[0]
+				while ret < size:
+					ret += 1 << 32
+				return ret
+			ret = zstandard.frame_content_size(f.read(18))
+			if ret < 0:
+				return None
+			return ret
+	except:
+		return None
+
+def _newDecompressor(compression):
+	if compression == 'gzip':
+		return zlib.decompressobj(16 + zlib.MAX_WBITS)
+	return zstandard.ZstdDecompressor().decompressobj()
+
+def _newCompressor(compression):
+	if compression == 'gzip':
+		return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	return zstandard.ZstdCompressor(level=3).compressobj()
+
+class _compressedReader(object):
+	"""
+	Read-only file like object that decompresses a file in blocks while it is read. Iterating over it gives the lines, like a normal file.
+	"""
+	def __init__(self, filename, compression):
+		self._file = open(filename, 'rb')
+		self._compression = compression
+		self._decompressor = _newDecompressor(compression)
+		self._buffer = ''
+		self._offset = 0
+		self._eof = False
+
+	def __iter__(self):
+		return iter(self.readline, '')
+
+	def _fill(self):
+		#Decompress the next block of the file, returns False at the end of the file.
+		if self._eof:
+			return False
+		data = self._file.read(256 * 1024)
+		if len(data) < 1:
+			self._eof = True
+			if self._compression == 'gzip':
+				self._buffer = self._buffer[self._offset:] + self._decompressor.flush()
+				self._offset = 0
+			return False
+		data = self._decompressor.decompress(data)
+		if self._compression == 'gzip':
+			#A gzip file can have multiple members, each member needs a new decompressor.
+			while len(self._decompressor.unused_data) > 0:
+				unused = self._decompressor.unused_data
+				self._decompressor = _newDecompressor(self._compression)
+				data += self._decompressor.decompress(unused)
+		self._buffer = self._buffer[self._offset:] + data
+		self._offset = 0
+		return True
+
+	def read(self, size = -1):
+		while (size < 0 or len(self._buffer) - self._offset < size) and self._fill():
+			pass
+		if size < 0:
+			size = len(self._buffer) - self._offset
+		ret = self._buffer[self._offset:self._offset + size]
+		self._offset += len(ret)
+		return ret
+
+	def readline(self):
+		end = self._buffer.find('\n', self._offset)
+		while end < 0:
+			start = len(self._buffer) - self._offset
+			if not self._fill():
+				end = len(self._buffer) - 1
+				break
+			end = self._buffer.find('\n', start)
+		ret = self._buffer[self._offset:end + 1]
+		self._offset += len(ret)
+		return ret
+
+	def getCompressedPosition(self):
+		""" :return: The number of bytes read from the compressed file, to show the progress of reading it. """
+		return self._file.tell()
+
+	def close(self):
+		self._file.close()
+
+class _compressedWriter(object):
+	""" Write-only file like object that compresses the data while it is written. The compressed file is complete after close. """
+	def __init__(self, filename, compression):
+		self._file = open(filename, 'wb')
+		self._compressor = _newCompressor(compression)
+
+	def write(self, data):
+		self._file.write(self._compressor.compress(data))
+
+	def close(self):
+		if self._file.closed:
+			return
+		self._file.write(self._compressor.flush())
+		self._file.close()
@@ -5,14 +5,50 @@ It does this by parsing the whole GCode file. On large files this can take a whi
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
 import sys
+import re
 import math
 import os
 import time
 import numpy
 import types
+import mmap
+import hashlib
+import traceback
+import threading
+import multiprocessing
+import collections
 import cStringIO as StringIO
 
 from Cura.util import profile
+from Cura.util import diskCache
+from Cura.util import gcodeCompression
+
+#The move types of paths, the columnar layers store the index in this list per path.
+moveTypeNames = ['move', 'extrude', 'retract']
+_moveTypeIndex = {'move': 0, 'extrude': 1, 'retract': 2}
+#The path types (like WALL-OUTER and FILL) are interned, the columnar layers store the index in this list per path.
+pathTypeNames = []
+_pathTypeIndex = {}
+_pathTypeLock = threading.Lock()
+_layerCache = None
+
+def getPathTypeIndex(pathType):
+	""" :return: The index of the path type in pathTypeNames, new path types are added to the list. """
+	if pathType not in _pathTypeIndex:
+		_pathTypeLock.acquire()
+		if pathType not in _pathTypeIndex:
+			pathTypeNames.append(pathType)
+			_pathTypeIndex[pathType] = len(pathTypeNames) - 1
+		_pathTypeLock.release()
+	return _pathTypeIndex[pathType]
+
+def _getPathTypeTable(names):
+	"""
+	The path type numbers depend on the order the path types are found, so they differ per process and per run.
+	:param names: The pathTypeNames list the numbers are from.
+	:return: Array to change those numbers into the numbers of this process.
+	"""
+	return numpy.array(map(getPathTypeIndex, names), numpy.int16)
 
 def gcodePath(newType, pathType, layerThickness, startPoint):
 	"""
@@ -24,34 +60,289 @@ def gcodePath(newType, pathType, layerThickness, startPoint):
 			'pathType': pathType,
 			'layerThickness': layerThickness,
 			'points': [startPoint],
-			'extrusion': [0.0]}
+			'extrusion': [0.0],
+			'feedrate': [0.0]}
+
+def getLayerCache():
+	"""
+	:return: The disk cache for parsed GCode layers, shared by all gcode objects. Its size is the gcode_cache_size preference.
+	"""
+	global _layerCache
+	cacheSize = int(profile.getPreferenceFloat('gcode_cache_size') * 1024 * 1024)
+	if _layerCache is None:
+		_layerCache = diskCache.DiskCache('gcodecache', cacheSize)
+	elif cacheSize != _layerCache.getMaxSize():
+		_layerCache.setMaxSize(cacheSize)
+	return _layerCache
+
+class gcodeLayer(object):
+	"""
+	A layer of paths stored in columns, the compact alternative to a list of gcodePath dictionaries.
+	The points of all paths are a single (n, 3) float32 array, path n consists of the points from pathStart[n] up to pathStart[n+1].
+	Like with gcodePath, each path starts with the last point of the path before it. The extrusion and feedrate (mm/min) arrays hold
+	the amount extruded and the F value of the move to each point, these are 0.0 for the first point of a path.
+	For each path the move type (index in moveTypeNames), path type (index in pathTypeNames), extruder and layer thickness are stored in small arrays.
+	Indexing or iterating a layer gives gcodePath dictionaries with views on the arrays, so code written for lists of paths works with both formats.
+	"""
+	def __init__(self, points, extrusion, feedrate, pathStart, moveType, pathType, extruder, layerThickness):
+		self.points = points
+		self.extrusion = extrusion
+		self.feedrate = feedrate
+		self.pathStart = pathStart
+		self.moveType = moveType
+		self.pathType = pathType
+		self.extruder = extruder
+		self.layerThickness = layerThickness
+
+	def __len__(self):
+		return len(self.moveType)
+
+	def __getitem__(self, n):
+		if n < 0:
+			n += len(self.moveType)
+		if n < 0 or n >= len(self.moveType):
+			raise IndexError('path index out of range')
+		start = self.pathStart[n]
+		end = self.pathStart[n + 1]
+		return {'type': moveTypeNames[self.moveType[n]],
+				'pathType': pathTypeNames[self.pathType[n]],
+				'layerThickness': float(self.layerThickness[n]),
+				'points': self.points[start:end],
+				'extrusion': self.extrusion[start:end],
+				'feedrate': self.feedrate[start:end],
+				'extruder': int(self.extruder[n])}
+
+	def __iter__(self):
+		for n in xrange(0, len(self.moveType)):
+			yield self[n]
+
+	def getPathIndexes(self, moveType = None, pathType = None, extruder = None):
+		"""
+		Find the paths with the given move type name, path type name and extruder. None matches any value.
+		:return: Array with the indexes of the matching paths.
+		"""
+		match = numpy.ones(len(self.moveType), numpy.bool)
+		if moveType is not None:
+			match &= self.moveType == _moveTypeIndex[moveType]
+		if pathType is not None:
+			if pathType not in _pathTypeIndex:
+				return numpy.zeros(0, numpy.int64)
+			match &= self.pathType == _pathTypeIndex[pathType]
+		if extruder is not None:
+			match &= self.extruder == extruder
+		return numpy.flatnonzero(match)
+
+	def getSegments(self, pathIndexes):
+		"""
+		Get the line segments of paths, a segment goes from a point to the next point of the same path.
+		:return: Tuple with the index of the first point of each segment, and the index of the path of each segment.
+		"""
+		counts = self.pathStart[pathIndexes + 1] - self.pathStart[pathIndexes] - 1
+		ranges = numpy.zeros((len(pathIndexes), 2), numpy.int64)
+		ranges[:,0] = self.pathStart[pathIndexes]
+		ranges[:,1] = ranges[:,0] + counts
+		return _rangeIndex(ranges), numpy.repeat(pathIndexes, counts)
+
+	def getPointCount(self):
+		return len(self.points)
+
+	def getMemoryUsage(self):
+		""" :return: The number of bytes used by the arrays of this layer. """
+		return sum(map(lambda a: a.nbytes, [self.points, self.extrusion, self.feedrate, self.pathStart, self.moveType, self.pathType, self.extruder, self.layerThickness]))
+
+def compareLayers(layerListA, layerListB):
+	"""
+	Compare two lists of columnar layers of this process, like a file loaded in parts by worker processes and the same file loaded in one go.
+	:return: None when the layers are the same, else a description of the first difference.
+	"""
+	if len(layerListA) != len(layerListB):
+		return 'layer count %d != %d' % (len(layerListA), len(layerListB))
+	for n in xrange(0, len(layerListA)):
+		for name in ['points', 'extrusion', 'feedrate', 'pathStart', 'moveType', 'pathType', 'extruder', 'layerThickness']:
+			if not numpy.array_equal(getattr(layerListA[n], name), getattr(layerListB[n], name)):
+				return 'layer %d: %s differs' % (n, name)
+	return None
 
 class gcode(object):
 	"""
 	The heavy lifting GCode parser. This is most likely the hardest working python code in Cura.
 	It parses a GCode file and stores the result in layers where each layer as paths that describe the GCode.
 	"""
-	def __init__(self):
+	def __init__(self, columnar = False):
 		self.regMatch = {}
 		self.layerList = None
+		#When columnar is set, the layers are gcodeLayer objects instead of lists of gcodePath dictionaries.
+		self.columnar = columnar
+		#Number of processes used to load large GCode files. The file is split in parts at layer starts, and the parts are parsed at the same time.
+		self.processCount = 1
+		#Files of this size and up are not parsed when loaded by filename, they are indexed with loadLazy. None to always parse the whole file.
+		self.lazyLoadSize = None
+		#Disk cache for the parsed layers of files loaded by filename in the columnar format, see getLayerCache. None to not use a cache.
+		self.cache = None
 		self.extrusionAmount = 0
 		self.filename = None
 		self.progressCallback = None
+		self._printTime = None
+		self._feedLoader = None
 	
 	def load(self, data):
 		self.filename = None
+		self._printTime = None
+		self._feedLoader = None
 		if type(data) in types.StringTypes and os.path.isfile(data):
 			self.filename = data
 			self._fileSize = os.stat(data).st_size
-			gcodeFile = open(data, 'r')
-			self._load(gcodeFile)
-			gcodeFile.close()
+			#Compressed files are decompressed while they are parsed, so they can not be indexed or split in parts.
+			compressed = gcodeCompression.getCompression(data) is not None
+			if compressed:
+				self._fileSize = gcodeCompression.getUncompressedSize(data) or 0
+			elif self.lazyLoadSize is not None and self._fileSize >= self.lazyLoadSize:
+				self.loadLazy(data)
+				return
+			cacheKey = None
+			if self.cache is not None and self.cache.isEnabled() and self.columnar:
+				cacheKey = _getCacheKey(data)
+				if self._loadFromCache(cacheKey):
+					return
+			if not compressed and self.processCount > 1 and self._fileSize >= _minimalParallelSize:
+				finished = self._loadParallel(data)
+			else:
+				f = gcodeCompression.openGCodeFile(data, 'rb')
+				finished = self._load(f)
+				f.close()
+			if finished and cacheKey is not None:
+				self._saveToCache(cacheKey)
 		elif type(data) is list:
 			self._load(data)
-		else:
+		elif hasattr(data, 'getvalue'):
 			data = data.getvalue()
 			self._fileSize = len(data)
 			self._load(StringIO.StringIO(data))
+		else:
+			#A seekable file like object, like the GCode stream of an engine result. Read it as-is, without copying it into memory.
+			data.seek(0, 2)
+			self._fileSize = data.tell()
+			data.seek(0)
+			self._load(data)
+			data.close()
+
+	def loadLazy(self, filename, cacheSize = 50):
+		"""
+		Index the layers of a GCode file without parsing them. The layerList becomes a gcodeLayerIndex, which parses layers when they are used.
+		"""
+		self.filename = filename
+		self._printTime = None
+		self._fileSize = os.stat(filename).st_size
+		self.layerList = gcodeLayerIndex(filename, self.columnar, cacheSize)
+		if self.progressCallback is not None:
+			self.progressCallback(1.0)
+
+	def feed(self, data):
+		"""
+		Parse the next part of GCode that is still being written, like the output of a running engine.
+		Layers are added to the layerList as soon as they are complete, so they can be used while the rest of the GCode is coming in.
+		The data does not need to end at a line end, the last partial line is kept for the next part. Call finishFeed after the last part.
+		The progress callback is not used while feeding, as the size of the GCode is not known.
+		"""
+		if self._feedLoader is None:
+			self.filename = None
+			self._printTime = None
+			self._fileSize = 0
+			self._feedLoader = _gcodeLoader(self.columnar)
+			self._feedRest = ''
+			self._feedOffset = 0
+			self.layerList = self._feedLoader.layerList
+		end = data.rfind('\n') + 1
+		if end < 1:
+			self._feedRest += data
+			return
+		block = self._feedRest + data[0:end]
+		self._feedRest = data[end:]
+		#Large parts are processed in blocks of complete lines like a file is, processMoves handles at most a block of lines at once.
+		start = 0
+		while start < len(block):
+			end = block.rfind('\n', start, start + _blockSize) + 1
+			if end <= start:
+				end = block.find('\n', start) + 1
+			self._loadBlock(self._feedLoader, block[start:end], self._feedOffset + start)
+			start = end
+		self._feedOffset += len(block)
+
+	def finishFeed(self):
+		""" Parse the last line given to feed, and add the last layer to the layerList. """
+		if self._feedLoader is None:
+			return
+		if len(self._feedRest) > 0:
+			self._loadBlock(self._feedLoader, self._feedRest + '\n', self._feedOffset)
+		self._feedLoader.finish()
+		self._feedLoader = None
+		self._feedRest = ''
+
+	def _saveToCache(self, key):
+		"""
+		Store the layers in the cache as a single npz file, with the arrays of all layers concatenated.
+		The path starts are stored per layer (with the point count as last entry), so they can be used as-is when loading.
+		"""
+		layers = self.layerList
+		layerPointStart = numpy.zeros(len(layers) + 1, numpy.int64)
+		numpy.cumsum(map(len, map(lambda layer: layer.points, layers)), out=layerPointStart[1:])
+		layerPathStart = numpy.zeros(len(layers) + 1, numpy.int64)
+		numpy.cumsum(map(len, layers), out=layerPathStart[1:])
+		data = StringIO.StringIO()
+		numpy.savez(data,
+			points=numpy.concatenate(map(lambda layer: layer.points, layers)),
+			extrusion=numpy.concatenate(map(lambda layer: layer.extrusion, layers)),
+			feedrate=numpy.concatenate(map(lambda layer: layer.feedrate, layers)),
+			pathStart=numpy.concatenate(map(lambda layer: layer.pathStart, layers)),
+			moveType=numpy.concatenate(map(lambda layer: layer.moveType, layers)),
+			pathType=numpy.concatenate(map(lambda layer: layer.pathType, layers)),
+			extruder=numpy.concatenate(map(lambda layer: layer.extruder, layers)),
+			layerThickness=numpy.concatenate(map(lambda layer: layer.layerThickness, layers)),
+			layerPointStart=layerPointStart,
+			layerPathStart=layerPathStart,
+			pathTypeNames=numpy.array(pathTypeNames, numpy.string_),
+			extrusionAmount=numpy.array([self.extrusionAmount], numpy.float64))
+		self.cache.store(key, '.layers.npz', data.getvalue())
+		self.cache.finishEntry()
+
+	def _loadFromCache(self, key):
+		"""
+		Load the layers from the cache, each layer uses views on the arrays of the cache file.
+		:return: True when the layers are loaded from the cache.
+		"""
+		filenames = self.cache.lookup(key, ['.layers.npz'])
+		if filenames is None:
+			return False
+		try:
+			data = numpy.load(filenames[0])
+			points = data['points']
+			extrusion = data['extrusion']
+			feedrate = data['feedrate']
+			pathStart = data['pathStart']
+			moveType = data['moveType']
+			extruder = data['extruder']
+			layerThickness = data['layerThickness']
+			layerPointStart = data['layerPointStart'].tolist()
+			layerPathStart = data['layerPathStart'].tolist()
+			#The path type numbers are different each run, so they are stored as names.
+			pathType = _getPathTypeTable(data['pathTypeNames'].tolist())[data['pathType']]
+			self.extrusionAmount = float(data['extrusionAmount'][0])
+			data.close()
+		except:
+			traceback.print_exc()
+			self.cache.remove(key)
+			return False
+		self.layerList = []
+		for n in xrange(0, len(layerPathStart) - 1):
+			start = layerPathStart[n]
+			end = layerPathStart[n + 1]
+			pointStart = layerPointStart[n]
+			pointEnd = layerPointStart[n + 1]
+			self.layerList.append(gcodeLayer(points[pointStart:pointEnd], extrusion[pointStart:pointEnd], feedrate[pointStart:pointEnd],
+				pathStart[start + n:end + n + 1], moveType[start:end], pathType[start:end], extruder[start:end], layerThickness[start:end]))
+		if self.progressCallback is not None:
+			self.progressCallback(1.0)
+		return True
 
 	def calculateWeight(self):
 		#Calculates the weight of the filament in kg
@@ -70,222 +361,1079 @@ class gcode(object):
 			return "%.2f" % (self.extrusionAmount / 1000 * cost_meter)
 		return None
 	
+	def calculatePrintTime(self):
+		"""
+		Estimate the print time with the acceleration and jerk of the machine, see estimatePrintTime. The estimate is made once per load.
+		:return: The dictionary with the total time in seconds, and the time per layer and per path type.
+		"""
+		if self._printTime is None:
+			self._printTime = estimatePrintTime(self.layerList, profile.getMachineSettingFloat('machine_acceleration'), profile.getMachineSettingFloat('machine_jerk'))
+		return self._printTime
+
+	@property
+	def totalMoveTimeMinute(self):
+		return self.calculatePrintTime()['totalTime'] / 60.0
+
 	def _load(self, gcodeFile):
+		loader = _gcodeLoader(self.columnar)
+		self.layerList = loader.layerList
+		if type(gcodeFile) is list:
+			for line in gcodeFile:
+				if type(line) is tuple:
+					line = line[0]
+				loader.processLine(line)
+		elif self._loadBlocks(loader, gcodeFile, 0):
+			#Abort the loading, we can safely return as the results here will be discarded
+			gcodeFile.close()
+			return False
+		loader.finish()
+		if self.progressCallback is not None and self._fileSize > 0:
+			self.progressCallback(1.0)
+		return True
+
+	def _loadParallel(self, filename):
+		"""
+		Load a large file with a pool of worker processes, each worker parses a part of the file that starts at a ;LAYER: line.
+		A worker finds the state at the start of its part (position, modes, E, extruder) by parsing the two layers before it.
+		When that does not match the state at the end of the part before it, the part is parsed again in this process with the right state.
+		Columnar layers of a worker use the path type numbers of that worker, these are changed to the numbers of this process.
+		"""
 		self.layerList = []
-		pos = [0.0,0.0,0.0]
-		posOffset = [0.0, 0.0, 0.0]
-		currentE = 0.0
-		currentExtruder = 0
-		extrudeAmountMultiply = 1.0
-		absoluteE = True
-		scale = 1.0
-		posAbs = True
-		feedRate = 3600.0
-		moveType = 'move'
-		layerThickness = 0.1
-		pathType = 'CUSTOM'
-		currentLayer = []
-		currentPath = gcodePath('move', pathType, layerThickness, pos)
-		currentPath['extruder'] = currentExtruder
-
-		currentLayer.append(currentPath)
-		for line in gcodeFile:
-			if type(line) is tuple:
-				line = line[0]
-
-			#Parse Cura_SF comments
-			if line.startswith(';TYPE:'):
-				pathType = line[6:].strip()
-
-			if ';' in line:
-				comment = line[line.find(';')+1:].strip()
-				#Slic3r GCode comment parser
-				if comment == 'fill':
-					pathType = 'FILL'
-				elif comment == 'perimeter':
-					pathType = 'WALL-INNER'
-				elif comment == 'skirt':
-					pathType = 'SKIRT'
-				#Cura layer comments.
-				if comment.startswith('LAYER:'):
-					currentPath = gcodePath(moveType, pathType, layerThickness, currentPath['points'][-1])
-					layerThickness = 0.0
-					currentPath['extruder'] = currentExtruder
-					for path in currentLayer:
-						path['points'] = numpy.array(path['points'], numpy.float32)
-						path['extrusion'] = numpy.array(path['extrusion'], numpy.float32)
-					self.layerList.append(currentLayer)
-					if self.progressCallback is not None:
-						if self.progressCallback(float(gcodeFile.tell()) / float(self._fileSize)):
-							#Abort the loading, we can safely return as the results here will be discarded
-							gcodeFile.close()
-							return
-					currentLayer = [currentPath]
-				line = line[0:line.find(';')]
-			T = getCodeInt(line, 'T')
-			if T is not None:
-				if currentExtruder > 0:
-					posOffset[0] -= profile.getMachineSettingFloat('extruder_offset_x%d' % (currentExtruder))
-					posOffset[1] -= profile.getMachineSettingFloat('extruder_offset_y%d' % (currentExtruder))
-				currentExtruder = T
-				if currentExtruder > 0:
-					posOffset[0] += profile.getMachineSettingFloat('extruder_offset_x%d' % (currentExtruder))
-					posOffset[1] += profile.getMachineSettingFloat('extruder_offset_y%d' % (currentExtruder))
-			
-			G = getCodeInt(line, 'G')
-			if G is not None:
-				if G == 0 or G == 1:	#Move
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					e = getCodeFloat(line, 'E')
-					#f = getCodeFloat(line, 'F')
-					oldPos = pos
-					pos = pos[:]
-					if posAbs:
-						if x is not None:
-							pos[0] = x * scale + posOffset[0]
-						if y is not None:
-							pos[1] = y * scale + posOffset[1]
-						if z is not None:
-							pos[2] = z * scale + posOffset[2]
-					else:
-						if x is not None:
-							pos[0] += x * scale
-						if y is not None:
-							pos[1] += y * scale
-						if z is not None:
-							pos[2] += z * scale
-					moveType = 'move'
-					if e is not None:
-						if absoluteE:
-							e -= currentE
-						if e > 0.0:
-							moveType = 'extrude'
-						if e < 0.0:
-							moveType = 'retract'
-						currentE += e
-					else:
-						e = 0.0
-					if moveType == 'move' and oldPos[2] != pos[2]:
-						if oldPos[2] > pos[2] and abs(oldPos[2] - pos[2]) > 5.0 and pos[2] < 1.0:
-							oldPos[2] = 0.0
-						if layerThickness == 0.0:
-							layerThickness = abs(oldPos[2] - pos[2])
-					if currentPath['type'] != moveType or currentPath['pathType'] != pathType:
-						currentPath = gcodePath(moveType, pathType, layerThickness, currentPath['points'][-1])
-						currentPath['extruder'] = currentExtruder
-						currentLayer.append(currentPath)
-
-					currentPath['points'].append(pos)
-					currentPath['extrusion'].append(e * extrudeAmountMultiply)
-				elif G == 4:	#Delay
-					S = getCodeFloat(line, 'S')
-					P = getCodeFloat(line, 'P')
-				elif G == 10:	#Retract
-					currentPath = gcodePath('retract', pathType, layerThickness, currentPath['points'][-1])
-					currentPath['extruder'] = currentExtruder
-					currentLayer.append(currentPath)
-					currentPath['points'].append(currentPath['points'][0])
-				elif G == 11:	#Push back after retract
-					pass
-				elif G == 20:	#Units are inches
-					scale = 25.4
-				elif G == 21:	#Units are mm
-					scale = 1.0
-				elif G == 28:	#Home
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					center = [0.0,0.0,0.0]
-					if x is None and y is None and z is None:
-						pos = center
-					else:
-						pos = pos[:]
-						if x is not None:
-							pos[0] = center[0]
-						if y is not None:
-							pos[1] = center[1]
-						if z is not None:
-							pos[2] = center[2]
-				elif G == 90:	#Absolute position
-					posAbs = True
-				elif G == 91:	#Relative position
-					posAbs = False
-				elif G == 92:
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					e = getCodeFloat(line, 'E')
-					if e is not None:
-						currentE = e
+		with open(filename, 'rb') as f:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		parts = _splitLayers(data, self.processCount * 4)
+		data.close()
+
+		jobs = map(lambda part: (filename,) + part + (self.columnar,), parts)
+		pool = multiprocessing.Pool(min(self.processCount, len(jobs)), _initWorker, (profile.getPreferencePath(),))
+		try:
+			endState = None
+			for n, (layerList, startState, partEndState, partPathTypeNames) in enumerate(pool.imap(_loadPartJob, jobs)):
+				scanStart, start, end = parts[n]
+				if n > 0 and startState != endState:
+					with open(filename, 'rb') as f:
+						layerList, partEndState = _loadPart(f, start, end, endState, self.columnar)
+				elif self.columnar:
+					pathTypeTable = _getPathTypeTable(partPathTypeNames)
+					for layer in layerList:
+						layer.pathType = pathTypeTable[layer.pathType]
+				endState = partEndState
+				self.layerList += layerList
+				if self.progressCallback is not None and self.progressCallback(float(end) / float(self._fileSize)):
+					#Abort the loading, the results here will be discarded
+					pool.terminate()
+					return False
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		pool.join()
+		if self.progressCallback is not None:
+			self.progressCallback(1.0)
+		return True
+
+	def _loadBlocks(self, loader, gcodeFile, offset, size = None):
+		"""
+		Process a file in blocks of complete lines.
+		:param offset: The position of the file in the whole GCode, used for the progress.
+		:param size: The number of bytes to process, None to process the rest of the file.
+		:return: True when the loading is aborted by the progress callback.
+		"""
+		while size is None or size > 0:
+			if size is None:
+				data = gcodeFile.read(_blockSize)
+			else:
+				data = gcodeFile.read(min(_blockSize, size))
+			if len(data) < 1:
+				break
+			if data[-1] != '\n':
+				data += gcodeFile.readline()
+			length = len(data)
+			if size is not None:
+				size -= length
+			if data[-1] != '\n':
+				data += '\n'
+			if self._loadBlock(loader, data, offset):
+				return True
+			offset += length
+		return False
+
+	def _loadBlock(self, loader, data, offset):
+		"""
+		Process a block of complete lines. Runs of plain moves are processed with numpy, all other lines one at a time.
+		:return: True when the loading is aborted by the progress callback.
+		"""
+		lineStarts, lineEnds, simple, moveValues = _tokenizeBlock(data)
+		lineStarts = lineStarts.tolist()
+		lineEnds = lineEnds.tolist()
+		#Split the block in runs of lines that are all plain moves or all other lines.
+		changes = numpy.flatnonzero(simple[1:] != simple[:-1]) + 1
+		runStarts = [0] + changes.tolist()
+		runEnds = changes.tolist() + [len(simple)]
+		for runStart, runEnd in zip(runStarts, runEnds):
+			if simple[runStart] and runEnd - runStart >= _minimalMoveRun and loader.posAbs:
+				loader.processMoves(moveValues[runStart:runEnd])
+				continue
+			for n in xrange(runStart, runEnd):
+				if loader.processLine(data[lineStarts[n]:lineEnds[n] + 1]) and self.progressCallback is not None and self._fileSize > 0:
+					if self.progressCallback(float(offset + lineEnds[n] + 1) / float(self._fileSize)):
+						return True
+		return False
+
+class _gcodeLoader(object):
+	"""
+	The state machine that turns GCode into layers of paths.
+	While a layer is being build, the points are rows in a buffer and the paths store ranges of rows. A new path starts with the last point of the path
+	before it, and the first move after a big Z drop changes the point before it, by sharing rows these changes show up in every path that uses the point.
+	When the layer is done the paths get their part of a numpy array with the points of the whole layer, or the layer is stored as a gcodeLayer.
+	"""
+	def __init__(self, columnar = False):
+		self.layerList = []
+		self._columnar = columnar
+		self._points = numpy.zeros((4096, 3), numpy.float64)
+		self._extrusion = numpy.zeros(4096, numpy.float64)
+		self._feedrate = numpy.zeros(4096, numpy.float64)
+		#Row 0 is not used for points, its extrusion is the 0.0 at the start of each path.
+		self._pointCount = 1
+		self.feedrate = 0.0
+		self.pos = self._addPoint(0.0, 0.0, 0.0)
+		self.posOffset = [0.0, 0.0, 0.0]
+		self.currentE = 0.0
+		self.currentExtruder = 0
+		self.extrudeAmountMultiply = 1.0
+		self.absoluteE = True
+		self.scale = 1.0
+		self.posAbs = True
+		self.moveType = 'move'
+		self.layerThickness = 0.1
+		self.pathType = 'CUSTOM'
+		self.currentLayer = []
+		self.currentPath = self._newPath('move', self.pos, self.layerThickness)
+		self.currentLayer.append(self.currentPath)
+
+	def _reservePoints(self, count):
+		""" :return: The first row of count new rows in the point, extrusion and feedrate buffers. """
+		if self._pointCount + count > len(self._points):
+			size = max(self._pointCount + count, len(self._points) * 2)
+			points = numpy.zeros((size, 3), numpy.float64)
+			points[0:self._pointCount] = self._points[0:self._pointCount]
+			extrusion = numpy.zeros(size, numpy.float64)
+			extrusion[0:self._pointCount] = self._extrusion[0:self._pointCount]
+			feedrate = numpy.zeros(size, numpy.float64)
+			feedrate[0:self._pointCount] = self._feedrate[0:self._pointCount]
+			self._points = points
+			self._extrusion = extrusion
+			self._feedrate = feedrate
+		self._pointCount += count
+		return self._pointCount - count
+
+	def _addPoint(self, x, y, z, e = 0.0):
+		n = self._reservePoints(1)
+		self._points[n] = (x, y, z)
+		self._extrusion[n] = e
+		self._feedrate[n] = self.feedrate
+		return n
+
+	def _newPath(self, moveType, startPoint, layerThickness):
+		#Same as gcodePath, but with row ranges for the points and extrusion.
+		if layerThickness <= 0.0:
+			layerThickness = 0.01
+		return {'type': moveType,
+				'pathType': self.pathType,
+				'layerThickness': layerThickness,
+				'points': [[startPoint, startPoint + 1]],
+				'extrusion': [[0, 1]],
+				'extruder': self.currentExtruder}
+
+	def _finishLayer(self):
+		paths = self.currentLayer
+		pointRanges = []
+		extrusionRanges = []
+		pointRangeCounts = []
+		extrusionRangeCounts = []
+		for path in paths:
+			pointRanges += path['points']
+			extrusionRanges += path['extrusion']
+			pointRangeCounts.append(len(path['points']))
+			extrusionRangeCounts.append(len(path['extrusion']))
+		pointRanges = numpy.array(pointRanges, numpy.int64)
+		extrusionRanges = numpy.array(extrusionRanges, numpy.int64)
+		pointCounts = numpy.add.reduceat(pointRanges[:,1] - pointRanges[:,0], numpy.cumsum(pointRangeCounts) - pointRangeCounts)
+		extrusionCounts = numpy.add.reduceat(extrusionRanges[:,1] - extrusionRanges[:,0], numpy.cumsum(extrusionRangeCounts) - extrusionRangeCounts)
+		pathStart = numpy.zeros(len(paths) + 1, numpy.int64)
+		numpy.cumsum(pointCounts, out=pathStart[1:])
+		points = self._points[_rangeIndex(pointRanges)].astype(numpy.float32)
+		extrusion = self._extrusion[_rangeIndex(extrusionRanges)].astype(numpy.float32)
+		if len(extrusion) != len(points):
+			#A G10 retract path has 2 points but only the 0.0 extrusion of the start, give every point an extrusion value.
+			padded = numpy.zeros(len(points), numpy.float32)
+			ranges = numpy.zeros((len(paths), 2), numpy.int64)
+			ranges[:,0] = pathStart[:-1]
+			ranges[:,1] = pathStart[:-1] + extrusionCounts
+			padded[_rangeIndex(ranges)] = extrusion
+			extrusion = padded
+		feedrate = self._feedrate[_rangeIndex(pointRanges)].astype(numpy.float32)
+		feedrate[pathStart[:-1]] = 0.0
+
+		if self._columnar:
+			moveType = numpy.array(map(lambda path: _moveTypeIndex[path['type']], paths), numpy.int8)
+			pathType = numpy.array(map(lambda path: getPathTypeIndex(path['pathType']), paths), numpy.int16)
+			extruder = numpy.array(map(lambda path: path['extruder'], paths), numpy.int16)
+			layerThickness = numpy.array(map(lambda path: path['layerThickness'], paths), numpy.float64)
+			self.layerList.append(gcodeLayer(points, extrusion, feedrate, pathStart.astype(numpy.int32), moveType, pathType, extruder, layerThickness))
+			return
+		pathStart = pathStart.tolist()
+		extrusionCounts = extrusionCounts.tolist()
+		for n in xrange(0, len(paths)):
+			start = pathStart[n]
+			paths[n]['points'] = points[start:pathStart[n + 1]]
+			paths[n]['extrusion'] = extrusion[start:start + extrusionCounts[n]]
+			paths[n]['feedrate'] = feedrate[start:pathStart[n + 1]]
+		self.layerList.append(paths)
+
+	def _nextLayer(self):
+		path = self._newPath(self.moveType, _lastRow(self.currentPath), self.layerThickness)
+		self.layerThickness = 0.0
+		self._finishLayer()
+		#The next layer only uses the start point of the new path and the current position, move those to the start of the buffer.
+		start = _lastRow(path)
+		rows = [start, self.pos]
+		if start == self.pos:
+			rows = [start]
+		self._points[1:len(rows) + 1] = self._points[rows]
+		self._pointCount = len(rows) + 1
+		path['points'] = [[1, 2]]
+		self.pos = len(rows)
+		self.currentPath = path
+		self.currentLayer = [path]
+
+	def finish(self):
+		self._finishLayer()
+
+	def getState(self):
+		"""
+		:return: Dictionary with everything that carries over from one layer to the next, the loader can continue from it with setState.
+		"""
+		pathEnd = _lastRow(self.currentPath)
+		return {'pos': self._points[self.pos].tolist(),
+				'pathEnd': self._points[pathEnd].tolist(),
+				'pathEndIsPos': pathEnd == self.pos,
+				'posOffset': list(self.posOffset),
+				'currentE': self.currentE,
+				'feedrate': self.feedrate,
+				'currentExtruder': self.currentExtruder,
+				'extrudeAmountMultiply': self.extrudeAmountMultiply,
+				'absoluteE': self.absoluteE,
+				'scale': self.scale,
+				'posAbs': self.posAbs,
+				'moveType': self.moveType,
+				'layerThickness': self.layerThickness,
+				'pathType': self.pathType}
+
+	def setState(self, state):
+		""" Continue from a state returned by getState. Only use this on a new loader, before the ;LAYER: line the state was taken before. """
+		self._points[1] = state['pathEnd']
+		self._pointCount = 2
+		self.pos = 1
+		if not state['pathEndIsPos']:
+			self.pos = self._addPoint(*state['pos'])
+		self.posOffset = list(state['posOffset'])
+		self.currentE = state['currentE']
+		self.feedrate = state['feedrate']
+		self.currentExtruder = state['currentExtruder']
+		self.extrudeAmountMultiply = state['extrudeAmountMultiply']
+		self.absoluteE = state['absoluteE']
+		self.scale = state['scale']
+		self.posAbs = state['posAbs']
+		self.moveType = state['moveType']
+		self.layerThickness = state['layerThickness']
+		self.pathType = state['pathType']
+
+	def processLine(self, line):
+		"""
+		Process a single line of GCode.
+		:return: True when this line started a new layer.
+		"""
+		newLayer = False
+		#Parse Cura_SF comments
+		if line.startswith(';TYPE:'):
+			self.pathType = line[6:].strip()
+
+		if ';' in line:
+			comment = line[line.find(';')+1:].strip()
+			#Slic3r GCode comment parser
+			if comment == 'fill':
+				self.pathType = 'FILL'
+			elif comment == 'perimeter':
+				self.pathType = 'WALL-INNER'
+			elif comment == 'skirt':
+				self.pathType = 'SKIRT'
+			#Cura layer comments.
+			if comment.startswith('LAYER:'):
+				self._nextLayer()
+				newLayer = True
+			line = line[0:line.find(';')]
+		T = getCodeInt(line, 'T')
+		if T is not None:
+			if self.currentExtruder > 0:
+				self.posOffset[0] -= profile.getMachineSettingFloat('extruder_offset_x%d' % (self.currentExtruder))
+				self.posOffset[1] -= profile.getMachineSettingFloat('extruder_offset_y%d' % (self.currentExtruder))
+			self.currentExtruder = T
+			if self.currentExtruder > 0:
+				self.posOffset[0] += profile.getMachineSettingFloat('extruder_offset_x%d' % (self.currentExtruder))
+				self.posOffset[1] += profile.getMachineSettingFloat('extruder_offset_y%d' % (self.currentExtruder))
+
+		G = getCodeInt(line, 'G')
+		if G is not None:
+			if G == 0 or G == 1:	#Move
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				e = getCodeFloat(line, 'E')
+				f = getCodeFloat(line, 'F')
+				if f is not None:
+					self.feedrate = f
+				oldPos = self.pos
+				pos = self._points[oldPos].tolist()
+				oldZ = pos[2]
+				if self.posAbs:
 					if x is not None:
-						posOffset[0] = pos[0] - x
+						pos[0] = x * self.scale + self.posOffset[0]
 					if y is not None:
-						posOffset[1] = pos[1] - y
+						pos[1] = y * self.scale + self.posOffset[1]
 					if z is not None:
-						posOffset[2] = pos[2] - z
+						pos[2] = z * self.scale + self.posOffset[2]
 				else:
-					print "Unknown G code:" + str(G)
+					if x is not None:
+						pos[0] += x * self.scale
+					if y is not None:
+						pos[1] += y * self.scale
+					if z is not None:
+						pos[2] += z * self.scale
+				moveType = 'move'
+				if e is not None:
+					if self.absoluteE:
+						e -= self.currentE
+					if e > 0.0:
+						moveType = 'extrude'
+					if e < 0.0:
+						moveType = 'retract'
+					self.currentE += e
+				else:
+					e = 0.0
+				self.moveType = moveType
+				if moveType == 'move' and oldZ != pos[2]:
+					if oldZ > pos[2] and abs(oldZ - pos[2]) > 5.0 and pos[2] < 1.0:
+						oldZ = 0.0
+						self._points[oldPos, 2] = oldZ
+					if self.layerThickness == 0.0:
+						self.layerThickness = abs(oldZ - pos[2])
+				if self.currentPath['type'] != moveType or self.currentPath['pathType'] != self.pathType:
+					self.currentPath = self._newPath(moveType, _lastRow(self.currentPath), self.layerThickness)
+					self.currentLayer.append(self.currentPath)
+
+				self.pos = self._addPoint(pos[0], pos[1], pos[2], e * self.extrudeAmountMultiply)
+				_appendRows(self.currentPath['points'], self.pos, self.pos + 1)
+				_appendRows(self.currentPath['extrusion'], self.pos, self.pos + 1)
+			elif G == 4:	#Delay
+				S = getCodeFloat(line, 'S')
+				P = getCodeFloat(line, 'P')
+			elif G == 10:	#Retract
+				self.currentPath = self._newPath('retract', _lastRow(self.currentPath), self.layerThickness)
+				self.currentLayer.append(self.currentPath)
+				_appendRows(self.currentPath['points'], self.currentPath['points'][0][0], self.currentPath['points'][0][0] + 1)
+			elif G == 11:	#Push back after retract
+				pass
+			elif G == 20:	#Units are inches
+				self.scale = 25.4
+			elif G == 21:	#Units are mm
+				self.scale = 1.0
+			elif G == 28:	#Home
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				center = [0.0,0.0,0.0]
+				if x is None and y is None and z is None:
+					pos = center
+				else:
+					pos = self._points[self.pos].tolist()
+					if x is not None:
+						pos[0] = center[0]
+					if y is not None:
+						pos[1] = center[1]
+					if z is not None:
+						pos[2] = center[2]
+				self.pos = self._addPoint(pos[0], pos[1], pos[2])
+			elif G == 90:	#Absolute position
+				self.posAbs = True
+			elif G == 91:	#Relative position
+				self.posAbs = False
+			elif G == 92:
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				e = getCodeFloat(line, 'E')
+				pos = self._points[self.pos].tolist()
+				if e is not None:
+					self.currentE = e
+				if x is not None:
+					self.posOffset[0] = pos[0] - x
+				if y is not None:
+					self.posOffset[1] = pos[1] - y
+				if z is not None:
+					self.posOffset[2] = pos[2] - z
 			else:
-				M = getCodeInt(line, 'M')
-				if M is not None:
-					if M == 0:	#Message with possible wait (ignored)
-						pass
-					elif M == 1:	#Message with possible wait (ignored)
-						pass
-					elif M == 25:	#Stop SD printing
-						pass
-					elif M == 80:	#Enable power supply
-						pass
-					elif M == 81:	#Suicide/disable power supply
-						pass
-					elif M == 82:   #Absolute E
-						absoluteE = True
-					elif M == 83:   #Relative E
-						absoluteE = False
-					elif M == 84:	#Disable step drivers
-						pass
-					elif M == 92:	#Set steps per unit
-						pass
-					elif M == 101:	#Enable extruder
-						pass
-					elif M == 103:	#Disable extruder
-						pass
-					elif M == 104:	#Set temperature, no wait
-						pass
-					elif M == 105:	#Get temperature
-						pass
-					elif M == 106:	#Enable fan
-						pass
-					elif M == 107:	#Disable fan
-						pass
-					elif M == 108:	#Extruder RPM (these should not be in the final GCode, but they are)
-						pass
-					elif M == 109:	#Set temperature, wait
-						pass
-					elif M == 110:	#Reset N counter
-						pass
-					elif M == 113:	#Extruder PWM (these should not be in the final GCode, but they are)
-						pass
-					elif M == 117:	#LCD message
-						pass
-					elif M == 140:	#Set bed temperature
-						pass
-					elif M == 190:	#Set bed temperature & wait
-						pass
-					elif M == 221:	#Extrude amount multiplier
-						s = getCodeFloat(line, 'S')
-						if s is not None:
-							extrudeAmountMultiply = s / 100.0
-					else:
-						print "Unknown M code:" + str(M)
-		for path in currentLayer:
-			path['points'] = numpy.array(path['points'], numpy.float32)
-			path['extrusion'] = numpy.array(path['extrusion'], numpy.float32)
-		self.layerList.append(currentLayer)
-		if self.progressCallback is not None and self._fileSize > 0:
-			self.progressCallback(float(gcodeFile.tell()) / float(self._fileSize))
+				print "Unknown G code:" + str(G)
+		else:
+			M = getCodeInt(line, 'M')
+			if M is not None:
+				if M == 0:	#Message with possible wait (ignored)
+					pass
+				elif M == 1:	#Message with possible wait (ignored)
+					pass
+				elif M == 25:	#Stop SD printing
+					pass
+				elif M == 80:	#Enable power supply
+					pass
+				elif M == 81:	#Suicide/disable power supply
+					pass
+				elif M == 82:   #Absolute E
+					self.absoluteE = True
+				elif M == 83:   #Relative E
+					self.absoluteE = False
+				elif M == 84:	#Disable step drivers
+					pass
+				elif M == 92:	#Set steps per unit
+					pass
+				elif M == 101:	#Enable extruder
+					pass
+				elif M == 103:	#Disable extruder
+					pass
+				elif M == 104:	#Set temperature, no wait
+					pass
+				elif M == 105:	#Get temperature
+					pass
+				elif M == 106:	#Enable fan
+					pass
+				elif M == 107:	#Disable fan
+					pass
+				elif M == 108:	#Extruder RPM (these should not be in the final GCode, but they are)
+					pass
+				elif M == 109:	#Set temperature, wait
+					pass
+				elif M == 110:	#Reset N counter
+					pass
+				elif M == 113:	#Extruder PWM (these should not be in the final GCode, but they are)
+					pass
+				elif M == 117:	#LCD message
+					pass
+				elif M == 140:	#Set bed temperature
+					pass
+				elif M == 190:	#Set bed temperature & wait
+					pass
+				elif M == 221:	#Extrude amount multiplier
+					s = getCodeFloat(line, 'S')
+					if s is not None:
+						self.extrudeAmountMultiply = s / 100.0
+				else:
+					print "Unknown M code:" + str(M)
+		return newLayer
+
+	def processMoves(self, values):
+		"""
+		Process a run of plain G0/G1 moves at once, with the same result as processing them one by one. Only used with absolute positioning.
+		:param values: Array with a row of X, Y, Z, E and F values for each move, NaN for values the move does not have.
+		"""
+		count = len(values)
+		startPos = self._points[self.pos].copy()
+		first = self._reservePoints(count)
+		points = self._points[first:first + count]
+		given = values == values
+
+		#Every move gets the last given value of each axis and the feedrate, or the value from before the moves when there is none yet.
+		last = numpy.where(given[:,_filledColumns], _rowIndex[0:count], -1)
+		numpy.maximum.accumulate(last, axis=0, out=last)
+		position = values[:,0:3] * self.scale + self.posOffset
+		points[:] = numpy.where(last[:,0:3] > -1, position[last[:,0:3], _axisIndex], startPos)
+		feedrate = self._feedrate[first:first + count]
+		feedrate[:] = numpy.where(last[:,3] > -1, values[last[:,3], 4], self.feedrate)
+		self.feedrate = float(feedrate[-1])
+
+		e = numpy.zeros(count, numpy.float64)
+		eIndex = numpy.flatnonzero(given[:,3])
+		if len(eIndex) > 0:
+			E = values[eIndex, 3]
+			if self.absoluteE:
+				e[eIndex], self.currentE = _absoluteExtrusion(E, self.currentE)
+			else:
+				e[eIndex] = E
+				self.currentE = float(numpy.add.accumulate(numpy.concatenate(([self.currentE], E)))[-1])
+		self._extrusion[first:first + count] = e * self.extrudeAmountMultiply
+		#0 for a move, 1 for extrude, 2 for retract.
+		moveTypes = (e > 0.0) + (e < 0.0) * 2
+
+		#Travel moves that change Z set the layer thickness, a big drop to the bed sets the Z of the point before it to zero.
+		z = points[:,2]
+		oldZ = numpy.empty(count, numpy.float64)
+		oldZ[0] = startPos[2]
+		oldZ[1:] = z[:-1]
+		zMoves = (moveTypes == 0) & (oldZ != z)
+		layerThickness = self.layerThickness
+		thicknessIndex = count
+		if zMoves.any():
+			drops = numpy.flatnonzero(zMoves & (oldZ > z) & (numpy.abs(oldZ - z) > 5.0) & (z < 1.0))
+			oldZ[drops] = 0.0
+			thickness = numpy.abs(oldZ - z)
+			if layerThickness == 0.0:
+				thicknessMoves = numpy.flatnonzero(zMoves & (thickness != 0.0))
+				if len(thicknessMoves) > 0:
+					thicknessIndex = thicknessMoves[0]
+					self.layerThickness = float(thickness[thicknessIndex])
+			if len(drops) > 0:
+				rows = drops + first - 1
+				if drops[0] == 0:
+					rows[0] = self.pos
+				self._points[rows, 2] = 0.0
+
+		#A new path starts where the move type changes, or at the first move when the path type changed.
+		changes = numpy.flatnonzero(moveTypes[1:] != moveTypes[:-1]) + 1
+		changes = changes.tolist()
+		if self.currentPath['type'] != moveTypeNames[moveTypes[0]] or self.currentPath['pathType'] != self.pathType:
+			changes.insert(0, 0)
+		changes.append(count)
+		path = self.currentPath
+		start = 0
+		for change in changes:
+			if change > start:
+				#Append the rows to the path, the first rows can continue the last range of the path.
+				rows = path['points'][-1]
+				if rows[1] == first + start:
+					rows[1] = first + change
+				else:
+					path['points'].append([first + start, first + change])
+				rows = path['extrusion'][-1]
+				if rows[1] == first + start:
+					rows[1] = first + change
+				else:
+					path['extrusion'].append([first + start, first + change])
+			if change == count:
+				break
+			startRow = first + change - 1
+			if change == 0:
+				startRow = path['points'][-1][1] - 1
+			thickness = layerThickness
+			if change >= thicknessIndex:
+				thickness = self.layerThickness
+			path = self._newPath(moveTypeNames[moveTypes[change]], startRow, thickness)
+			self.currentLayer.append(path)
+			start = change
+		self.currentPath = path
+		self.pos = first + count - 1
+		self.moveType = moveTypeNames[moveTypes[-1]]
+
+class gcodeLayerIndex(object):
+	"""
+	The byte offsets of the layers in a GCode file, found with a fast scan over a memory map of the file. Layers are parsed when they
+	are requested, and the last used layers are kept in a cache. Layer n is the same as layerList[n] of a full load, so layer 0 is the
+	GCode before the first ;LAYER: line.
+	The state at the start of a layer (position, modes, E) is the state at the end of the layer before it when that one was parsed. Otherwise
+	it is worked out by parsing the two layers before it, after the lines that change modes (like G90, M83, G20, T and M221) up to there.
+	Relative positioning (G91) and moving the origin (G92 X/Y/Z) make the position depend on all moves before it, so the state of the layers
+	after the first of those lines is found by parsing all layers from that line on. The end states of these layers are kept, so this
+	is only done once per layer.
+	"""
+	def __init__(self, filename, columnar = True, cacheSize = 50):
+		self._filename = filename
+		self._columnar = columnar
+		self._cacheSize = cacheSize
+		self._cache = collections.OrderedDict()
+		self._endStates = {}
+		self._lock = threading.Lock()
+		self._file = open(filename, 'rb')
+		self._data = ''
+		if os.fstat(self._file.fileno()).st_size > 0:
+			self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		self._offsets = [0]
+		if self._data[0:7] == ';LAYER:':
+			self._offsets.append(0)
+		#The start of the lines that can change modes after the first layer, and the first of those that makes the position depend on the moves before it.
+		self._modeLines = []
+		self._relativeStart = None
+		for match in _indexPattern.finditer(self._data):
+			start = match.start() + 1
+			if self._data[start] == ';':
+				self._offsets.append(start)
+			elif len(self._offsets) > 1:
+				self._modeLines.append(start)
+				if self._relativeStart is None and self._isRelativeLine(self._data[start:self._data.find('\n', start)]):
+					self._relativeStart = start
+		self._offsets.append(len(self._data))
+
+	def __len__(self):
+		return len(self._offsets) - 1
+
+	def __getitem__(self, n):
+		if type(n) is slice:
+			return map(self.getLayer, xrange(*n.indices(len(self))))
+		if n < 0:
+			n += len(self)
+		if n < 0 or n >= len(self):
+			raise IndexError('layer index out of range')
+		return self.getLayer(n)
+
+	def __iter__(self):
+		for n in xrange(0, len(self)):
+			yield self.getLayer(n)
+
+	def getLayerOffset(self, n):
+		""" :return: The byte offset of the ;LAYER: line of layer n in the file. """
+		return self._offsets[n]
+
+	def getLayer(self, n):
+		""" :return: Layer n, as a gcodeLayer or a list of gcodePath dictionaries. """
+		self._lock.acquire()
+		try:
+			if n in self._cache:
+				layer = self._cache.pop(n)
+			else:
+				layer = self._parseLayer(n)
+			self._cache[n] = layer
+			while len(self._cache) > self._cacheSize:
+				self._cache.popitem(False)
+		finally:
+			self._lock.release()
+		return layer
+
+	def getState(self, n):
+		""" :return: The loader state at the start of layer n, see _gcodeLoader.getState. """
+		if n < 1:
+			return None
+		if n - 1 in self._endStates:
+			return self._endStates[n - 1]
+		if n == 1:
+			self._parseLayer(0)
+			return self._endStates[0]
+		if self._relativeStart is not None and self._offsets[n] > self._relativeStart:
+			#Parse the layers from the last one with a known state (or the one with the first relative line) up to this layer.
+			start = n - 1
+			while start > 1 and start - 1 not in self._endStates and self._offsets[start] > self._relativeStart:
+				start -= 1
+			for m in xrange(start, n):
+				self._parseLayer(m)
+			return self._endStates[n - 1]
+		scanStart = self._offsets[max(1, n - 2)]
+		loader = _gcodeLoader(True)
+		loader.setState(self.getState(1))
+		for start in self._modeLines:
+			if start >= scanStart:
+				break
+			loader.processLine(self._data[start:self._data.find('\n', start) + 1])
+		gcodeFile = _gcodeStream(self._data)
+		gcodeFile.seek(scanStart)
+		gcode(True)._loadBlocks(loader, gcodeFile, scanStart, self._offsets[n] - scanStart)
+		return loader.getState()
+
+	def _isRelativeLine(self, line):
+		G = getCodeInt(line, 'G')
+		if G == 91:
+			return True
+		if G == 92:
+			return getCodeFloat(line, 'X') is not None or getCodeFloat(line, 'Y') is not None or getCodeFloat(line, 'Z') is not None
+		return False
+
+	def _parseLayer(self, n):
+		state = self.getState(n)
+		gcodeFile = _gcodeStream(self._data)
+		layerList, self._endStates[n] = _loadPart(gcodeFile, self._offsets[n], self._offsets[n + 1], state, self._columnar)
+		return layerList[0]
+
+	def close(self):
+		if type(self._data) is mmap.mmap:
+			self._data.close()
+		self._file.close()
+
+class _gcodeStream(object):
+	""" A file like object to read a memory map from any position, without the mmap file position shared by all readers. """
+	def __init__(self, data):
+		self._data = data
+		self._pos = 0
+
+	def seek(self, offset):
+		self._pos = offset
+
+	def read(self, size):
+		ret = self._data[self._pos:self._pos + size]
+		self._pos += len(ret)
+		return ret
+
+	def readline(self):
+		end = self._data.find('\n', self._pos)
+		if end < 0:
+			end = len(self._data) - 1
+		ret = self._data[self._pos:end + 1]
+		self._pos += len(ret)
+		return ret
+
+def estimatePrintTime(layerList, acceleration, jerk):
+	"""
+	Estimate the print time of parsed GCode, with a planner like the one in the firmware: moves accelerate up to their feedrate and slow
+	down for the moves after them, the speed at a corner is limited by the jerk (the largest instant change in speed).
+	All moves are planned at once with numpy, in chunks of layers. Dwell (G4) and the time to heat up are not included.
+	:param layerList: The layers, as gcodeLayer objects or lists of gcodePath dictionaries.
+	:param acceleration: The acceleration of the machine in mm/s^2.
+	:param jerk: The jerk of the machine in mm/s.
+	:return: Dictionary with the total time in seconds, an array with the time of each layer, a dictionary with the time per path type
+		(travel moves and retractions are counted as 'move' and 'retract') and the number of moves.
+	"""
+	acceleration = max(acceleration, 1.0)
+	jerk = max(jerk, 0.01)
+	categoryTime = numpy.zeros(len(moveTypeNames), numpy.float64)
+	layerTime = numpy.zeros(len(layerList), numpy.float64)
+	moveCount = 0
+	pending = []
+	pendingCount = 0
+	entrySpeed2 = None
+	for layerNr in xrange(0, len(layerList)):
+		segments = _layerSegments(layerList[layerNr], layerNr)
+		if segments is None:
+			continue
+		if entrySpeed2 is None:
+			entrySpeed2 = min(segments[1][0], jerk / 2.0) ** 2
+		if pendingCount >= _planChunkSize:
+			length, speed, velocity, category, layerIdx = _joinSegments(pending)
+			exitSpeed2 = _junctionSpeed(speed[-1:], velocity[-1:], segments[1][0:1], segments[2][0:1], jerk)[0] ** 2
+			times, entrySpeed2 = _planSegments(length, speed, velocity, entrySpeed2, exitSpeed2, acceleration, jerk)
+			categoryTime = _addBins(categoryTime, category, times)
+			layerTime += numpy.bincount(layerIdx, times, len(layerTime))
+			moveCount += len(times)
+			pending = []
+			pendingCount = 0
+		pending.append(segments)
+		pendingCount += len(segments[0])
+	if pendingCount > 0:
+		length, speed, velocity, category, layerIdx = _joinSegments(pending)
+		times, entrySpeed2 = _planSegments(length, speed, velocity, entrySpeed2, min(speed[-1], jerk / 2.0) ** 2, acceleration, jerk)
+		categoryTime = _addBins(categoryTime, category, times)
+		layerTime += numpy.bincount(layerIdx, times, len(layerTime))
+		moveCount += len(times)
+	names = moveTypeNames + pathTypeNames
+	pathTypeTime = {}
+	for n in numpy.flatnonzero(categoryTime):
+		pathTypeTime[names[n]] = float(categoryTime[n])
+	return {'totalTime': float(layerTime.sum()), 'layerTime': layerTime, 'pathTypeTime': pathTypeTime, 'moveCount': moveCount}
+
+def _layerSegments(layer, layerNr):
+	"""
+	:return: Tuple with the length (mm), speed (mm/s), velocity vector (X, Y, Z and E, in mm/s), time category and layer number of each move
+		in the layer, or None when the layer has no moves. Moves without XYZ movement (retractions) use the E distance as length.
+	"""
+	if type(layer) is not gcodeLayer:
+		layer = _toColumnar(layer)
+	starts, pathIndexes = layer.getSegments(numpy.arange(len(layer)))
+	delta = layer.points[starts + 1].astype(numpy.float64) - layer.points[starts]
+	e = layer.extrusion[starts + 1].astype(numpy.float64)
+	length = numpy.sqrt((delta * delta).sum(1))
+	keep = (length > 0.0) | (e != 0.0)
+	if not keep.all():
+		starts = starts[keep]
+		pathIndexes = pathIndexes[keep]
+		delta = delta[keep]
+		e = e[keep]
+		length = length[keep]
+	if len(length) < 1:
+		return None
+	speed = layer.feedrate[starts + 1].astype(numpy.float64) / 60.0
+	speed[speed <= 0.0] = _defaultFeedrate / 60.0
+	extrudeOnly = length == 0.0
+	velocity = numpy.zeros((len(length), 4), numpy.float64)
+	velocity[:,0:3] = delta * (speed / numpy.where(extrudeOnly, 1.0, length))[:,numpy.newaxis]
+	velocity[:,3] = numpy.where(extrudeOnly, numpy.sign(e) * speed, 0.0)
+	length[extrudeOnly] = numpy.abs(e[extrudeOnly])
+	moveType = layer.moveType[pathIndexes]
+	category = numpy.where(moveType == _moveTypeIndex['extrude'], layer.pathType[pathIndexes].astype(numpy.int64) + len(moveTypeNames), moveType)
+	return length, speed, velocity, category, numpy.repeat(layerNr, len(length))
+
+def _joinSegments(segmentList):
+	return map(lambda n: numpy.concatenate(map(lambda segments: segments[n], segmentList)), xrange(0, 5))
+
+def _junctionSpeed(speed0, velocity0, speed1, velocity1, jerk):
+	""" :return: The highest speed at the corners from moves 0 to moves 1, where the change in velocity is at most the jerk. """
+	change = numpy.sqrt(((velocity1 - velocity0) ** 2).sum(1))
+	return numpy.minimum(speed0, speed1) * numpy.minimum(1.0, jerk / numpy.maximum(change, 1e-9))
+
+def _planSegments(length, speed, velocity, entrySpeed2, exitSpeed2, acceleration, jerk):
+	"""
+	Plan the speed of a list of moves, and calculate the time of each move.
+	The speed limits are squared speeds at the corners, including the start of the first move and the end of the last move.
+	With acceleration the squared speed changes at most 2*a*length over a move, so the highest reachable speed at each corner is found with a
+	running minimum over the limits, once forward (accelerating from the corners before it) and once backward (slowing down for the corners after it).
+	:return: The time in seconds of each move, and the squared speed at the end of the last move.
+	"""
+	limit = numpy.empty(len(length) + 1, numpy.float64)
+	limit[0] = min(entrySpeed2, speed[0] * speed[0])
+	limit[1:-1] = _junctionSpeed(speed[:-1], velocity[:-1], speed[1:], velocity[1:], jerk) ** 2
+	limit[-1] = min(exitSpeed2, speed[-1] * speed[-1])
+	distance = numpy.zeros(len(length) + 1, numpy.float64)
+	numpy.cumsum(2.0 * acceleration * length, out=distance[1:])
+	forward = distance + numpy.minimum.accumulate(limit - distance)
+	backward = (numpy.minimum.accumulate((limit + distance)[::-1]) - distance[::-1])[::-1]
+	speed2 = numpy.minimum(forward, backward)
+	entry = numpy.sqrt(speed2[:-1])
+	exit = numpy.sqrt(speed2[1:])
+	#Moves that reach their feedrate accelerate, cruise and slow down, the others slow down as soon as they reach their top speed.
+	speedUp = (speed * speed - speed2[:-1]) / (2.0 * acceleration)
+	slowDown = (speed * speed - speed2[1:]) / (2.0 * acceleration)
+	cruise = length - speedUp - slowDown
+	top = numpy.where(cruise >= 0.0, speed, numpy.sqrt((2.0 * acceleration * length + speed2[:-1] + speed2[1:]) / 2.0))
+	times = (2.0 * top - entry - exit) / acceleration + numpy.maximum(cruise, 0.0) / speed
+	return times, speed2[-1]
+
+def _addBins(total, index, weights):
+	counts = numpy.bincount(index, weights)
+	if len(counts) > len(total):
+		total = numpy.concatenate([total, numpy.zeros(len(counts) - len(total), numpy.float64)])
+	total[0:len(counts)] += counts
+	return total
+
+def _toColumnar(paths):
+	""" :return: A gcodeLayer with the paths of a layer in the list of gcodePath dictionaries format. """
+	pathStart = numpy.zeros(len(paths) + 1, numpy.int64)
+	numpy.cumsum(map(lambda path: len(path['points']), paths), out=pathStart[1:])
+	points = numpy.zeros((pathStart[-1], 3), numpy.float32)
+	extrusion = numpy.zeros(pathStart[-1], numpy.float32)
+	feedrate = numpy.zeros(pathStart[-1], numpy.float32)
+	for n in xrange(0, len(paths)):
+		path = paths[n]
+		start = pathStart[n]
+		points[start:pathStart[n + 1]] = path['points']
+		extrusion[start:start + len(path['extrusion'])] = path['extrusion']
+		if 'feedrate' in path:
+			feedrate[start:pathStart[n + 1]] = path['feedrate']
+	moveType = numpy.array(map(lambda path: _moveTypeIndex[path['type']], paths), numpy.int8)
+	pathType = numpy.array(map(lambda path: getPathTypeIndex(path['pathType']), paths), numpy.int16)
+	extruder = numpy.array(map(lambda path: path.get('extruder', 0), paths), numpy.int16)
+	layerThickness = numpy.array(map(lambda path: path['layerThickness'], paths), numpy.float64)
+	return gcodeLayer(points, extrusion, feedrate, pathStart, moveType, pathType, extruder, layerThickness)
+
+def _getCacheKey(filename):
+	""" :return: The cache key of a GCode file, a hash of the file size, modification time and contents. """
+	stat = os.stat(filename)
+	key = hashlib.md5()
+	key.update('%d:%r:' % (stat.st_size, stat.st_mtime))
+	with open(filename, 'rb') as f:
+		while True:
+			data = f.read(_blockSize)
+			if len(data) < 1:
+				break
+			key.update(data)
+	return key.hexdigest()
+
+def _splitLayers(data, count):
+	"""
+	Split GCode in about count parts of the same size, each part after the first starts at a ;LAYER: line.
+	:return: List of (scan start, start, end) tuples. The scan start is the start of the second layer before the part, the state at
+		the start of the part is found by parsing from there.
+	"""
+	size = len(data)
+	starts = [0]
+	for n in xrange(1, count):
+		idx = data.find('\n;LAYER:', max(starts[-1], size * n / count))
+		if idx < 0:
+			break
+		starts.append(idx + 1)
+	ret = []
+	for n in xrange(0, len(starts)):
+		scanStart = 0
+		if starts[n] > 0:
+			idx = data.rfind('\n;LAYER:', 0, starts[n] - 1)
+			if idx > -1:
+				idx = data.rfind('\n;LAYER:', 0, idx)
+			scanStart = idx + 1
+		if n + 1 < len(starts):
+			ret.append((scanStart, starts[n], starts[n + 1]))
+		else:
+			ret.append((scanStart, starts[n], size))
+	return ret
+
+def _loadPart(gcodeFile, start, end, state, columnar):
+	"""
+	Parse a part of a GCode file.
+	:param state: The loader state at the start of the part, None for the start of the file.
+	:return: The layers of the part and the loader state at the end of it.
+	"""
+	loader = _gcodeLoader(columnar)
+	if state is not None:
+		loader.setState(state)
+	gcodeFile.seek(start)
+	gcode(columnar)._loadBlocks(loader, gcodeFile, start, end - start)
+	endState = loader.getState()
+	loader.finish()
+	layerList = loader.layerList
+	if state is not None:
+		#The ;LAYER: line at the start of the part finished the empty first layer of the loader.
+		layerList = layerList[1:]
+	return layerList, endState
+
+def _loadPartJob(job):
+	filename, scanStart, start, end, columnar = job
+	with open(filename, 'rb') as f:
+		state = None
+		if start > 0:
+			loader = _gcodeLoader(True)
+			f.seek(scanStart)
+			gcode(True)._loadBlocks(loader, f, scanStart, start - scanStart)
+			state = loader.getState()
+		layerList, endState = _loadPart(f, start, end, state, columnar)
+	return layerList, state, endState, pathTypeNames
+
+def _initWorker(preferencePath):
+	#Without fork the workers start without any settings, tool changes need the extruder offsets of the machine.
+	if sys.platform.startswith('win'):
+		profile.loadPreferences(preferencePath)
+
+def _appendRows(rows, start, end):
+	if rows[-1][1] == start:
+		rows[-1][1] = end
+	else:
+		rows.append([start, end])
+
+def _lastRow(path):
+	return path['points'][-1][1] - 1
+
+def _rangeIndex(ranges):
+	""" :return: Array with the indexes of all rows in the [start, end] ranges. """
+	ranges = numpy.array(ranges, numpy.int64).reshape((-1, 2))
+	lengths = ranges[:,1] - ranges[:,0]
+	offsets = numpy.cumsum(lengths) - lengths
+	return numpy.repeat(ranges[:,0] - offsets, lengths) + numpy.arange(lengths.sum())
+
+def _absoluteExtrusion(values, currentE):
+	"""
+	Turn absolute E values into extrusion amounts, like 'e -= currentE; currentE += e' for each value.
+	Mostly currentE ends up exactly at the E value, so all amounts are calculated from the previous E value at once.
+	Where rounding makes currentE differ from the E value, the amounts are calculated one by one until it is back in sync.
+	:return: The extrusion amounts and the new currentE.
+	"""
+	previous = numpy.empty(len(values), numpy.float64)
+	previous[0] = currentE
+	previous[1:] = values[:-1]
+	amounts = values - previous
+	after = previous + amounts
+	done = -1
+	for n in numpy.flatnonzero(after != values).tolist():
+		if n <= done:
+			continue
+		currentE = float(after[n])
+		n += 1
+		while n < len(values):
+			amounts[n] = float(values[n]) - currentE
+			currentE += float(amounts[n])
+			after[n] = currentE
+			if currentE == values[n]:
+				break
+			n += 1
+		done = n
+	return amounts, float(after[-1])
+
+def _tokenizeBlock(data):
+	"""
+	Find the plain move lines in a block of GCode lines, and parse their values with numpy.
+	A plain move line is a G0 or G1 followed by single space separated X, Y, Z, E and F values, each used once, without comments or anything else.
+	For these lines the position of each letter is the start of its value, so the values are the same as getCodeFloat would give.
+	:param data: String with complete lines, ending in a newline.
+	:return: The start and end (the newline) of each line, a boolean per line if it is a plain move, and a row with the X, Y, Z, E and F values per line (NaN if not given).
+	"""
+	chars = numpy.frombuffer(data, numpy.uint8)
+	padded = numpy.frombuffer(data + ' ' * (_maxValueLength + 2), numpy.uint8)
+	lineEnds = numpy.flatnonzero(chars == 10)
+	lineStarts = numpy.empty_like(lineEnds)
+	lineStarts[0] = 0
+	lineStarts[1:] = lineEnds[:-1] + 1
+	moveValues = numpy.empty((len(lineEnds), 5), numpy.float64)
+	moveValues.fill(numpy.nan)
+
+	#Only lines that start with G0 or G1 followed by a space or the end of the line can be plain moves.
+	second = padded[lineStarts + 1]
+	third = padded[lineStarts + 2]
+	simple = (chars[lineStarts] == ord('G')) & ((second == ord('0')) | (second == ord('1')))
+	simple &= (third == ord(' ')) | (third == ord('\n')) | (third == ord('\r'))
+	#The letters E, F and G, and X, Y and Z are next to each other in ASCII.
+	letterPos = numpy.flatnonzero(((chars - ord('E')) < 3) | ((chars - ord('X')) < 3))
+	tokenLine = numpy.searchsorted(lineEnds, letterPos)
+	keep = simple[tokenLine]
+	letterPos = letterPos[keep]
+	tokenLine = tokenLine[keep]
+	if len(letterPos) < 1:
+		return lineStarts, lineEnds, simple, moveValues
+
+	#Parse the value after each letter one character at a time for all letters at once.
+	#A value is an optional sign followed by digits with at most one dot, it ends at the first other character.
+	mantissa = numpy.zeros(len(letterPos), numpy.float64)
+	length = numpy.zeros(len(letterPos), numpy.int32)
+	dotCount = numpy.zeros(len(letterPos), numpy.int32)
+	dotIndex = numpy.zeros(len(letterPos), numpy.int32)
+	for n in xrange(0, _maxValueLength):
+		char = padded[letterPos + (n + 1)]
+		digit = char - ord('0')
+		isDigit = digit < 10
+		isDot = char == ord('.')
+		if n == 0:
+			negative = char == ord('-')
+			active = isDigit | isDot | negative | (char == ord('+'))
+			if not active.any():
+				break
+		else:
+			active &= isDigit | isDot
+			if not active.any():
+				break
+		isDigit &= active
+		mantissa = numpy.where(isDigit, mantissa * 10.0 + digit, mantissa)
+		length += active
+		isDot &= active
+		dotCount += isDot
+		dotIndex += isDot * n
+	digitCount = length - dotCount - (negative | (padded[letterPos + 1] == ord('+')))
+	valueEnd = letterPos + 1 + length
+	endChar = padded[valueEnd]
+	valid = (digitCount > 0) & (dotCount < 2) & (length < _maxValueLength)
+	#Each value is followed by a single space and the next letter, or it is at the end of the line.
+	followed = numpy.zeros(len(letterPos), numpy.bool_)
+	followed[:-1] = (endChar[:-1] == ord(' ')) & (letterPos[1:] == valueEnd[:-1] + 1)
+	lineEnd = lineEnds[tokenLine]
+	valid &= followed | (valueEnd == lineEnd) | ((endChar == ord('\r')) & (valueEnd + 1 == lineEnd))
+	simple[tokenLine[~valid]] = False
+	tokenLetter = _letterCode[chars[letterPos]]
+	simple[numpy.bincount(tokenLine * 8 + tokenLetter, minlength=len(lineEnds) * 8).reshape(len(lineEnds), 8).max(axis=1) > 1] = False
+
+	#value = digits / 10 ** (digits after the dot). Both are exact in a float, so the division rounds the same as float() does.
+	values = mantissa / _powersOfTen[numpy.where(dotCount > 0, length - 1 - dotIndex, 0)]
+	values[negative] *= -1
+	mask = simple[tokenLine] & (tokenLetter < 6)
+	moveValues[tokenLine[mask], tokenLetter[mask] - 1] = values[mask]
+	return lineStarts, lineEnds, simple, moveValues
+
+#The letters of plain moves, X, Y, Z, E and F are numbered in the order of the values returned by _tokenizeBlock.
+_letterCode = numpy.zeros(256, numpy.int64)
+for _n, _letter in enumerate('XYZEFG'):
+	_letterCode[ord(_letter)] = _n + 1
+#Values with more characters are left to the normal line parser, all digits of shorter values fit in the mantissa of a float.
+_maxValueLength = 16
+_powersOfTen = 10.0 ** numpy.arange(0, _maxValueLength)
+
+_rowIndex = numpy.arange(0, 1024 * 1024)[:,numpy.newaxis]
+_axisIndex = numpy.arange(0, 3)
+#The move value columns that are filled forward in processMoves: X, Y, Z and F.
+_filledColumns = [0, 1, 2, 4]
+#Blocks of GCode that are tokenized at once, and the minimal number of plain moves in a row to process them with numpy.
+_blockSize = 1024 * 1024
+_minimalMoveRun = 16
+#The lines a layer index looks for: layer starts, and the lines that can change modes (G90, G91, G92, G20, G21, M82, M83, M221 and T).
+_indexPattern = re.compile(r'\n(?:;LAYER:|G9|G2|M8|M2|T)')
+#Smaller files are not worth starting worker processes for.
+_minimalParallelSize = 4 * 1024 * 1024
+#The print time is planned for this many moves at a time, and moves without F use the default feedrate of the firmware in mm/min.
+_planChunkSize = 1024 * 1024
+_defaultFeedrate = 1500.0
 
 def getCodeInt(line, code):
 	n = line.find(code) + 1
@@ -0,0 +1,172 @@
+"""
+The layerPolygons module stores the layer polygons that the engine sends while slicing.
+The polygons are stored in columns: per type (inset0, skin, support...) one contiguous float32 buffer with the XY coordinates of all points,
+with arrays of offsets to find the polygons in it. The Z height is stored once per layer instead of for every point.
+This uses a lot less memory than a numpy array per polygon, and the polygons of a layer can be used as a slice of the buffer without copying.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import numpy
+
+class _typeBuffer(object):
+	"""
+	The points and polygon offsets of a single polygon type.
+	Polygon n consists of the points from polygonStart[n] up to polygonStart[n+1], the entry after the last polygon holds the point count.
+	"""
+	def __init__(self):
+		self.points = numpy.zeros((1024, 2), numpy.float32)
+		self.pointCount = 0
+		self.polygonStart = numpy.zeros(256, numpy.int64)
+		self.polygonCount = 0
+
+	def append(self, points, lengths):
+		if self.pointCount + len(points) > len(self.points):
+			self.points = self._grow(self.points, self.pointCount + len(points))
+		if self.polygonCount + len(lengths) + 1 > len(self.polygonStart):
+			self.polygonStart = self._grow(self.polygonStart, self.polygonCount + len(lengths) + 1)
+		self.points[self.pointCount:self.pointCount + len(points)] = points
+		self.polygonStart[self.polygonCount + 1:self.polygonCount + len(lengths) + 1] = numpy.cumsum(lengths) + self.pointCount
+		self.polygonStart[self.polygonCount] = self.pointCount
+		self.pointCount += len(points)
+		self.polygonCount += len(lengths)
+
+	def compact(self):
+		self.points = self.points[0:self.pointCount].copy()
+		self.polygonStart = self.polygonStart[0:self.polygonCount + 1].copy()
+
+	def getMemoryUsage(self):
+		return self.points.nbytes + self.polygonStart.nbytes
+
+	def _grow(self, data, size):
+		#Double the capacity, so appending polygons one layer at a time takes linear time.
+		ret = numpy.zeros((max(size, len(data) * 2),) + data.shape[1:], data.dtype)
+		ret[0:len(data)] = data
+		return ret
+
+class LayerPolygons(object):
+	"""
+	The polygons of all layers, as received from the engine.
+	For each layer the Z height is stored, and per type the range of polygons in the buffer of that type.
+	"""
+	def __init__(self):
+		self._types = {}
+		self._layerZ = []
+		self._layerRanges = []
+
+	def __len__(self):
+		return len(self._layerRanges)
+
+	def addPolygons(self, layerNr, z, typeName, points, lengths):
+		"""
+		Add polygons to a layer.
+		:param z: The Z height of the layer in mm.
+		:param points: (n, 2) array with the XY coordinates in mm of the points of all polygons.
+		:param lengths: The number of points of each polygon.
+		"""
+		while len(self._layerRanges) < layerNr + 1:
+			self._layerRanges.append({})
+			self._layerZ.append(z)
+		self._layerZ[layerNr] = z
+		if typeName not in self._types:
+			self._types[typeName] = _typeBuffer()
+		typeBuffer = self._types[typeName]
+		first = typeBuffer.polygonCount
+		typeBuffer.append(points, lengths)
+		ranges = self._layerRanges[layerNr].setdefault(typeName, [])
+		if len(ranges) > 0 and ranges[-1][1] == first:
+			ranges[-1][1] = typeBuffer.polygonCount
+		else:
+			ranges.append([first, typeBuffer.polygonCount])
+
+	def extend(self, other):
+		""" Add all layers of another LayerPolygons after the layers of this one. """
+		layerOffset = len(self._layerRanges)
+		for layerNr in xrange(0, len(other)):
+			for typeName in other._layerRanges[layerNr].keys():
+				points, offsets, z = other.getPolygons(layerNr, typeName)
+				self.addPolygons(layerNr + layerOffset, z, typeName, points, offsets[1:] - offsets[:-1])
+			if len(self._layerRanges) < layerNr + layerOffset + 1:
+				self._layerRanges.append({})
+				self._layerZ.append(other._layerZ[layerNr])
+
+	def getLayerZ(self, layerNr):
+		return self._layerZ[layerNr]
+
+	def getTypeNames(self, layerNr):
+		return self._layerRanges[layerNr].keys()
+
+	def hasType(self, layerNr, typeName):
+		return typeName in self._layerRanges[layerNr]
+
+	def getPolygons(self, layerNr, typeName):
+		"""
+		Get the polygons of a single type in a layer.
+		:return: A tuple of the (n, 2) XY points, the offsets of the polygons in the points (with the point count as last entry) and the Z height.
+			The points are a view into the buffer when the polygons are stored as a single block, which is the normal case.
+		"""
+		z = self._layerZ[layerNr]
+		ranges = self._layerRanges[layerNr].get(typeName, [])
+		if len(ranges) < 1:
+			return numpy.zeros((0, 2), numpy.float32), numpy.zeros(1, numpy.int64), z
+		typeBuffer = self._types[typeName]
+		if len(ranges) == 1:
+			first, end = ranges[0]
+			start = typeBuffer.polygonStart[first]
+			return typeBuffer.points[start:typeBuffer.polygonStart[end]], typeBuffer.polygonStart[first:end + 1] - start, z
+		points = []
+		offsets = [numpy.zeros(1, numpy.int64)]
+		pointCount = 0
+		for first, end in ranges:
+			start = typeBuffer.polygonStart[first]
+			points.append(typeBuffer.points[start:typeBuffer.polygonStart[end]])
+			offsets.append(typeBuffer.polygonStart[first + 1:end + 1] - start + pointCount)
+			pointCount += len(points[-1])
+		return numpy.concatenate(points), numpy.concatenate(offsets), z
+
+	def getPolygonList(self, layerNr, typeName):
+		"""
+		:return: The polygons of a single type in a layer, as a list of (n, 3) arrays with the Z height filled in.
+		"""
+		points, offsets, z = self.getPolygons(layerNr, typeName)
+		ret = []
+		for n in xrange(0, len(offsets) - 1):
+			poly = numpy.empty((offsets[n + 1] - offsets[n], 3), numpy.float32)
+			poly[:,0:2] = points[offsets[n]:offsets[n + 1]]
+			poly[:,2] = z
+			ret.append(poly)
+		return ret
+
+	def getPolygonCount(self):
+		return sum(map(lambda typeBuffer: typeBuffer.polygonCount, self._types.values()))
+
+	def getPointCount(self):
+		return sum(map(lambda typeBuffer: typeBuffer.pointCount, self._types.values()))
+
+	def getMemoryUsage(self):
+		""" :return: The number of bytes used by the point and offset buffers. """
+		return sum(map(lambda typeBuffer: typeBuffer.getMemoryUsage(), self._types.values()))
+
+	def compact(self):
+		""" Release the unused space at the end of the buffers. Call this when no more polygons are added. """
+		for typeBuffer in self._types.values():
+			typeBuffer.compact()
+
+	def __getstate__(self):
+		self.compact()
+		return self.__dict__
+
+def fromLayerList(layerList):
+	"""
+	Convert polygons in the old format, a list of layers with a dictionary of type names to lists of (n, 3) arrays.
+	"""
+	ret = LayerPolygons()
+	for layerNr in xrange(0, len(layerList)):
+		for typeName, polygons in layerList[layerNr].items():
+			if len(polygons) < 1:
+				continue
+			points = numpy.concatenate(polygons)
+			ret.addPolygons(layerNr, float(points[0][2]), typeName, points[:,0:2], map(len, polygons))
+		if len(ret) < layerNr + 1:
+			ret._layerRanges.append({})
+			ret._layerZ.append(0.0)
+	return ret
@@ -5,7 +5,13 @@ Depending on the file extension the proper meshLoader is called to load the file
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
 import os
+import sys
+import traceback
+import threading
+import itertools
+import multiprocessing
 
+from Cura.util import profile
 from Cura.util.meshLoaders import stl
 from Cura.util.meshLoaders import obj
 from Cura.util.meshLoaders import dae
@@ -51,3 +57,96 @@ def saveMeshes(filename, objects):
 		amf.saveScene(filename, objects)
 		return
 	print 'Error: Unknown model extension: %s' % (ext)
+
+def _initWorker(preferencePath):
+	#Without fork the workers start without any settings, the OBJ and AMF loaders use the preferences.
+	if sys.platform.startswith('win'):
+		profile.loadPreferences(preferencePath)
+
+def _loadMeshesJob(filename):
+	#The objects are pickled to send them back from a worker process, which sends the meshes as numpy buffers.
+	try:
+		return filename, loadMeshes(filename), None
+	except:
+		return filename, None, traceback.format_exc()
+
+class BackgroundLoader(object):
+	"""
+	Loads model files in a background thread, so the GUI keeps running while large files or a lot of files are loaded.
+	Multiple files are loaded in parallel by a pool of worker processes. Each worker parses a file and does the post processing of its objects,
+	and the objects are passed to the loadedCallback as soon as the file is done, in the order the files finish.
+	Both callbacks are called from the loader thread.
+	"""
+	def __init__(self, filenames, loadedCallback, finishedCallback = None, processCount = None):
+		"""
+		:param loadedCallback: Called with the filename and the list of loaded objects for each file, the list is None when loading failed.
+		:param finishedCallback: Called when all files are loaded, or when loading is cancelled.
+		:param processCount: The number of files that are loaded at the same time, None for a worker per CPU core.
+		"""
+		self._filenames = filenames
+		self._loadedCallback = loadedCallback
+		self._finishedCallback = finishedCallback
+		if processCount is None:
+			processCount = multiprocessing.cpu_count()
+		self._processCount = max(1, min(processCount, len(filenames)))
+		self._doneCount = 0
+		self._failedList = []
+		self._cancelled = False
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+
+	def start(self):
+		self._thread.start()
+
+	def cancel(self):
+		"""
+		Stop loading. Files that are being loaded by the worker processes are aborted, no callbacks are called for them.
+		With a single worker the file that is being loaded is finished first.
+		"""
+		self._cancelled = True
+
+	def isCancelled(self):
+		return self._cancelled
+
+	def join(self):
+		self._thread.join()
+
+	def getProgress(self):
+		""" :return: The number of files that are done (loaded or failed) and the total number of files. """
+		return self._doneCount, len(self._filenames)
+
+	def getFailedList(self):
+		return self._failedList
+
+	def _run(self):
+		pool = None
+		if self._processCount < 2:
+			results = itertools.imap(_loadMeshesJob, self._filenames)
+		else:
+			pool = multiprocessing.Pool(self._processCount, _initWorker, (profile.getPreferencePath(),))
+			results = pool.imap_unordered(_loadMeshesJob, self._filenames)
+		try:
+			while self._doneCount < len(self._filenames) and not self._cancelled:
+				if pool is None:
+					filename, objList, error = results.next()
+				else:
+					#Wait with a timeout, so cancelling does not wait for the workers.
+					try:
+						filename, objList, error = results.next(0.1)
+					except multiprocessing.TimeoutError:
+						continue
+				self._doneCount += 1
+				if error is not None:
+					print error
+					self._failedList.append(filename)
+				if not self._cancelled:
+					self._loadedCallback(filename, objList)
+		finally:
+			if pool is not None:
+				if self._cancelled:
+					pool.terminate()
+				else:
+					pool.close()
+				pool.join()
+		if self._finishedCallback is not None:
+			self._finishedCallback()
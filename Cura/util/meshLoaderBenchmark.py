@@ -0,0 +1,445 @@
+"""
+The meshLoaderBenchmark module measures how fast model files are loaded.
+For each format a file with random triangles is written, and the time to load it with the meshLoader is compared with the time to read the
+file from disk (the file is read once before, so it comes from the disk cache) and with the time of the reference loader, which loads the
+file one face at a time like the loaders did before they were vectorized. The loaded vertexes of both loaders are compared as well.
+
+Run it as: python -m Cura.util.meshLoaderBenchmark [--format stl-binary|stl-ascii|obj|amf|dae] [--faces 200000] [--no-reference]
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import time
+import struct
+import tempfile
+import zipfile
+import numpy
+try:
+	from xml.etree import cElementTree as ElementTree
+except:
+	from xml.etree import ElementTree
+from optparse import OptionParser
+from xml.parsers.expat import ParserCreate
+
+from Cura.util import printableObject
+from Cura.util import meshLoader
+
+def _writeBinaryStl(filename, vertexes):
+	data = numpy.zeros(len(vertexes) / 3, numpy.dtype([('normal', '<f4', (3,)), ('vertexes', '<f4', (3, 3)), ('attribute', '<u2')]))
+	data['vertexes'] = vertexes.reshape((-1, 3, 3))
+	with open(filename, 'wb') as f:
+		f.write('CURA BENCHMARK'.ljust(80, '\000'))
+		f.write(struct.pack('<I', len(data)))
+		data.tofile(f)
+
+def _loadBinaryStlPerFace(filename):
+	obj = printableObject.printableObject(filename)
+	m = obj._addMesh()
+	with open(filename, 'rb') as f:
+		f.read(80)
+		faceCount = struct.unpack('<I', f.read(4))[0]
+		m._prepareFaceCount(faceCount)
+		for idx in xrange(0, faceCount):
+			data = struct.unpack("<ffffffffffffH", f.read(50))
+			m._addFace(data[3], data[4], data[5], data[6], data[7], data[8], data[9], data[10], data[11])
+	obj._postProcessAfterLoad()
+	return [obj]
+
+def _writeAsciiStl(filename, vertexes):
+	#Windows newlines and an exponent format, like a lot of CAD exports.
+	with open(filename, 'wb') as f:
+		f.write('solid benchmark\r\n')
+		for n in xrange(0, len(vertexes), 3):
+			f.write('  facet normal 0.000000e+00 0.000000e+00 1.000000e+00\r\n    outer loop\r\n')
+			f.write(''.join(map(lambda v: '      vertex %e %e %e\r\n' % (v[0], v[1], v[2]), vertexes[n:n+3])))
+			f.write('    endloop\r\n  endfacet\r\n')
+		f.write('endsolid benchmark\r\n')
+
+def _loadAsciiStlPerLine(filename):
+	obj = printableObject.printableObject(filename)
+	m = obj._addMesh()
+	with open(filename, 'rb') as f:
+		cnt = 0
+		for lines in f:
+			for line in lines.split('\r'):
+				if 'vertex' in line:
+					cnt += 1
+		m._prepareFaceCount(int(cnt) / 3)
+		f.seek(5, os.SEEK_SET)
+		cnt = 0
+		data = [None,None,None]
+		for lines in f:
+			for line in lines.split('\r'):
+				if 'vertex' in line:
+					data[cnt] = line.split()[1:]
+					cnt += 1
+					if cnt == 3:
+						m._addFace(float(data[0][0]), float(data[0][1]), float(data[0][2]), float(data[1][0]), float(data[1][1]), float(data[1][2]), float(data[2][0]), float(data[2][1]), float(data[2][2]))
+						cnt = 0
+	obj._postProcessAfterLoad()
+	return [obj]
+
+def _writeObj(filename, vertexes):
+	#Every face has its own vertexes, with texture and normal indexes like most exports.
+	with open(filename, 'wb') as f:
+		f.write('# Cura benchmark\n')
+		f.write(''.join(map(lambda v: 'v %f %f %f\n' % (v[0], v[1], v[2]), vertexes)))
+		f.write('vn 0 0 1\n')
+		f.write(''.join(map(lambda n: 'f %d/%d/1 %d/%d/1 %d/%d/1\n' % (n + 1, n + 1, n + 2, n + 2, n + 3, n + 3), xrange(0, len(vertexes), 3))))
+
+def _loadObjPerFace(filename):
+	obj = printableObject.printableObject(filename)
+	m = obj._addMesh()
+	vertexList = []
+	faceList = []
+	with open(filename, 'r') as f:
+		for line in f:
+			parts = line.split()
+			if len(parts) < 1:
+				continue
+			if parts[0] == 'v':
+				vertexList.append([float(parts[1]), float(parts[2]), float(parts[3])])
+			if parts[0] == 'f':
+				parts = map(lambda p: p.split('/')[0], parts)
+				for idx in xrange(1, len(parts)-2):
+					faceList.append([int(parts[1]), int(parts[idx+1]), int(parts[idx+2])])
+	m._prepareFaceCount(len(faceList))
+	for f in faceList:
+		i = f[0] - 1
+		j = f[1] - 1
+		k = f[2] - 1
+		if i < 0 or i >= len(vertexList):
+			i = 0
+		if j < 0 or j >= len(vertexList):
+			j = 0
+		if k < 0 or k >= len(vertexList):
+			k = 0
+		m._addFace(vertexList[i][0], vertexList[i][1], vertexList[i][2], vertexList[j][0], vertexList[j][1], vertexList[j][2], vertexList[k][0], vertexList[k][1], vertexList[k][2])
+	obj._postProcessAfterLoad()
+	return [obj]
+
+def _writeAmf(filename, vertexes):
+	#A zipped AMF file with a single volume, with the layout of the AMF files that Cura saves.
+	xml = ['<?xml version="1.0" encoding="utf-8"?>\n<amf unit="millimeter" version="1.1">\n  <object id="1">\n    <mesh>\n      <vertices>\n']
+	xml += map(lambda v: '        <vertex>\n          <coordinates>\n            <x>%f</x>\n            <y>%f</y>\n            <z>%f</z>\n          </coordinates>\n        </vertex>\n' % (v[0], v[1], v[2]), vertexes)
+	xml.append('      </vertices>\n      <volume materialid="1">\n')
+	xml += map(lambda n: '        <triangle>\n          <v1>%i</v1>\n          <v2>%i</v2>\n          <v3>%i</v3>\n        </triangle>\n' % (n, n + 1, n + 2), xrange(0, len(vertexes), 3))
+	xml.append('      </volume>\n    </mesh>\n  </object>\n</amf>\n')
+	zfile = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+	zfile.writestr(os.path.basename(filename), ''.join(xml))
+	zfile.close()
+
+def _loadAmfTree(filename):
+	zfile = zipfile.ZipFile(filename)
+	amf = ElementTree.fromstring(zfile.read(zfile.namelist()[0]))
+	zfile.close()
+	ret = []
+	for amfObj in amf.iter('object'):
+		obj = printableObject.printableObject(filename)
+		for amfMesh in amfObj.iter('mesh'):
+			vertexList = []
+			for vertices in amfMesh.iter('vertices'):
+				for vertex in vertices.iter('vertex'):
+					for coordinates in vertex.iter('coordinates'):
+						v = [0.0,0.0,0.0]
+						for t in coordinates:
+							if t.tag == 'x':
+								v[0] = float(t.text)
+							elif t.tag == 'y':
+								v[1] = float(t.text)
+							elif t.tag == 'z':
+								v[2] = float(t.text)
+						vertexList.append(v)
+			for volume in amfMesh.iter('volume'):
+				m = obj._addMesh()
+				count = 0
+				for triangle in volume.iter('triangle'):
+					count += 1
+				m._prepareFaceCount(count)
+				for triangle in volume.iter('triangle'):
+					for t in triangle:
+						if t.tag == 'v1':
+							v1 = vertexList[int(t.text)]
+						elif t.tag == 'v2':
+							v2 = vertexList[int(t.text)]
+						elif t.tag == 'v3':
+							v3 = vertexList[int(t.text)]
+							m._addFace(v1[0], v1[1], v1[2], v2[0], v2[1], v2[2], v3[0], v3[1], v3[2])
+		obj._postProcessAfterLoad()
+		ret.append(obj)
+	return ret
+
+class _daeTreeLoader(object):
+	#The COLLADA loader that builds a dictionary tree of the whole file, and converts each instance on its own.
+	def __init__(self, filename):
+		self.obj = printableObject.printableObject(filename)
+		self.mesh = self.obj._addMesh()
+
+		r = ParserCreate()
+		r.StartElementHandler = self._StartElementHandler
+		r.EndElementHandler = self._EndElementHandler
+		r.CharacterDataHandler = self._CharacterDataHandler
+
+		self._base = {}
+		self._cur = self._base
+		self._idMap = {}
+		self._geometryList = []
+		self._faceCount = 0
+		r.ParseFile(open(filename, "r"))
+
+		self.vertexCount = 0
+		for instance_visual_scene in self._base['collada'][0]['scene'][0]['instance_visual_scene']:
+			for node in self._idMap[instance_visual_scene['_url']]['node']:
+				self._ProcessNode1(node)
+		self.mesh._prepareFaceCount(self._faceCount)
+		for instance_visual_scene in self._base['collada'][0]['scene'][0]['instance_visual_scene']:
+			for node in self._idMap[instance_visual_scene['_url']]['node']:
+				self._ProcessNode2(node)
+
+		scale = float(self._base['collada'][0]['asset'][0]['unit'][0]['_meter']) * 1000
+		self.mesh.vertexes *= scale
+
+		self._base = None
+		self._cur = None
+		self._idMap = None
+
+		self.obj._postProcessAfterLoad()
+
+	def _ProcessNode1(self, node):
+		if 'node' in node:
+			for n in node['node']:
+				self._ProcessNode1(n)
+		if 'instance_geometry' in node:
+			for instance_geometry in node['instance_geometry']:
+				mesh = self._idMap[instance_geometry['_url']]['mesh'][0]
+				if 'triangles' in mesh:
+					for triangles in mesh['triangles']:
+						self._faceCount += int(triangles['_count'])
+				elif 'lines' in mesh:
+					pass #Ignore lines
+				else:
+					print mesh.keys()
+		if 'instance_node' in node:
+			for instance_node in node['instance_node']:
+				self._ProcessNode1(self._idMap[instance_node['_url']])
+
+	def _ProcessNode2(self, node, matrix = None):
+		if 'matrix' in node:
+			oldMatrix = matrix
+			matrix = map(float, node['matrix'][0]['__data'].split())
+			if oldMatrix is not None:
+				newMatrix = [0]*16
+				newMatrix[0] = oldMatrix[0] * matrix[0] + oldMatrix[1] * matrix[4] + oldMatrix[2] * matrix[8] + oldMatrix[3] * matrix[12]
+				newMatrix[1] = oldMatrix[0] * matrix[1] + oldMatrix[1] * matrix[5] + oldMatrix[2] * matrix[9] + oldMatrix[3] * matrix[13]
+				newMatrix[2] = oldMatrix[0] * matrix[2] + oldMatrix[1] * matrix[6] + oldMatrix[2] * matrix[10] + oldMatrix[3] * matrix[14]
+				newMatrix[3] = oldMatrix[0] * matrix[3] + oldMatrix[1] * matrix[7] + oldMatrix[2] * matrix[11] + oldMatrix[3] * matrix[15]
+				newMatrix[4] = oldMatrix[4] * matrix[0] + oldMatrix[5] * matrix[4] + oldMatrix[6] * matrix[8] + oldMatrix[7] * matrix[12]
+				newMatrix[5] = oldMatrix[4] * matrix[1] + oldMatrix[5] * matrix[5] + oldMatrix[6] * matrix[9] + oldMatrix[7] * matrix[13]
+				newMatrix[6] = oldMatrix[4] * matrix[2] + oldMatrix[5] * matrix[6] + oldMatrix[6] * matrix[10] + oldMatrix[7] * matrix[14]
+				newMatrix[7] = oldMatrix[4] * matrix[3] + oldMatrix[5] * matrix[7] + oldMatrix[6] * matrix[11] + oldMatrix[7] * matrix[15]
+				newMatrix[8] = oldMatrix[8] * matrix[0] + oldMatrix[9] * matrix[4] + oldMatrix[10] * matrix[8] + oldMatrix[11] * matrix[12]
+				newMatrix[9] = oldMatrix[8] * matrix[1] + oldMatrix[9] * matrix[5] + oldMatrix[10] * matrix[9] + oldMatrix[11] * matrix[13]
+				newMatrix[10] = oldMatrix[8] * matrix[2] + oldMatrix[9] * matrix[6] + oldMatrix[10] * matrix[10] + oldMatrix[11] * matrix[14]
+				newMatrix[11] = oldMatrix[8] * matrix[3] + oldMatrix[9] * matrix[7] + oldMatrix[10] * matrix[11] + oldMatrix[11] * matrix[15]
+				newMatrix[12] = oldMatrix[12] * matrix[0] + oldMatrix[13] * matrix[4] + oldMatrix[14] * matrix[8] + oldMatrix[15] * matrix[12]
+				newMatrix[13] = oldMatrix[12] * matrix[1] + oldMatrix[13] * matrix[5] + oldMatrix[14] * matrix[9] + oldMatrix[15] * matrix[13]
+				newMatrix[14] = oldMatrix[12] * matrix[2] + oldMatrix[13] * matrix[6] + oldMatrix[14] * matrix[10] + oldMatrix[15] * matrix[14]
+				newMatrix[15] = oldMatrix[12] * matrix[3] + oldMatrix[13] * matrix[7] + oldMatrix[14] * matrix[11] + oldMatrix[15] * matrix[15]
+				matrix = newMatrix
+		if 'node' in node:
+			for n in node['node']:
+				self._ProcessNode2(n, matrix)
+		if 'instance_geometry' in node:
+			for instance_geometry in node['instance_geometry']:
+				mesh = self._idMap[instance_geometry['_url']]['mesh'][0]
+
+				if 'triangles' in mesh:
+					for triangles in mesh['triangles']:
+						for input in triangles['input']:
+							if input['_semantic'] == 'VERTEX':
+								vertices = self._idMap[input['_source']]
+						for input in vertices['input']:
+							if input['_semantic'] == 'POSITION':
+								vertices = self._idMap[input['_source']]
+						indexList = map(int, triangles['p'][0]['__data'].split())
+						positionList = map(float, vertices['float_array'][0]['__data'].split())
+
+						faceCount = int(triangles['_count'])
+						stepSize = len(indexList) / (faceCount * 3)
+						for i in xrange(0, faceCount):
+							idx0 = indexList[((i * 3) + 0) * stepSize]
+							idx1 = indexList[((i * 3) + 1) * stepSize]
+							idx2 = indexList[((i * 3) + 2) * stepSize]
+							x0 = positionList[idx0*3]
+							y0 = positionList[idx0*3+1]
+							z0 = positionList[idx0*3+2]
+							x1 = positionList[idx1*3]
+							y1 = positionList[idx1*3+1]
+							z1 = positionList[idx1*3+2]
+							x2 = positionList[idx2*3]
+							y2 = positionList[idx2*3+1]
+							z2 = positionList[idx2*3+2]
+							if matrix is not None:
+								self.mesh._addFace(
+									x0 * matrix[0] + y0 * matrix[1] + z0 * matrix[2] + matrix[3], x0 * matrix[4] + y0 * matrix[5] + z0 * matrix[6] + matrix[7], x0 * matrix[8] + y0 * matrix[9] + z0 * matrix[10] + matrix[11],
+									x1 * matrix[0] + y1 * matrix[1] + z1 * matrix[2] + matrix[3], x1 * matrix[4] + y1 * matrix[5] + z1 * matrix[6] + matrix[7], x1 * matrix[8] + y1 * matrix[9] + z1 * matrix[10] + matrix[11],
+									x2 * matrix[0] + y2 * matrix[1] + z2 * matrix[2] + matrix[3], x2 * matrix[4] + y2 * matrix[5] + z2 * matrix[6] + matrix[7], x2 * matrix[8] + y2 * matrix[9] + z2 * matrix[10] + matrix[11]
+								)
+							else:
+								self.mesh._addFace(x0, y0, z0, x1, y1, z1, x2, y2, z2)
+		if 'instance_node' in node:
+			for instance_node in node['instance_node']:
+				self._ProcessNode2(self._idMap[instance_node['_url']], matrix)
+
+	def _StartElementHandler(self, name, attributes):
+		name = name.lower()
+		if not name in self._cur:
+			self._cur[name] = []
+		new = {'__name': name, '__parent': self._cur}
+		self._cur[name].append(new)
+		self._cur = new
+		for k in attributes.keys():
+			self._cur['_' + k] = attributes[k]
+
+		if 'id' in attributes:
+			self._idMap['#' + attributes['id']] = self._cur
+
+	def _EndElementHandler(self, name):
+		self._cur = self._cur['__parent']
+
+	def _CharacterDataHandler(self, data):
+		if len(data.strip()) < 1:
+			return
+		if '__data' in self._cur:
+			self._cur['__data'] += data
+		else:
+			self._cur['__data'] = data
+
+	def _GetWithKey(self, item, basename, key, value):
+		input = basename
+		while input in item:
+			if item[basename]['_'+key] == value:
+				return self._idMap[item[input]['_source']]
+			basename += "!"
+
+def _writeDae(filename, vertexes):
+	#Like a SketchUp export: a component in the node library that is instanced a 100 times with a matrix, in inches.
+	# Only the faces of the first instance are used from the vertexes, the other instances are moved copies of it.
+	instanceCount = 100
+	vertexes = vertexes[0:max(1, len(vertexes) / 3 / instanceCount) * 3].astype(numpy.float64)
+	with open(filename, 'wb') as f:
+		f.write('<?xml version="1.0" encoding="utf-8"?>\n<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">\n')
+		f.write('<asset><unit meter="0.0254" name="inch"/><up_axis>Z_UP</up_axis></asset>\n')
+		f.write('<library_geometries><geometry id="component-mesh"><mesh>\n')
+		f.write('<source id="component-position"><float_array id="component-position-array" count="%d">%s</float_array></source>\n' % (vertexes.size, ' '.join(map(repr, vertexes.flatten().tolist()))))
+		f.write('<source id="component-uv"><float_array id="component-uv-array" count="2">0 0</float_array></source>\n')
+		f.write('<vertices id="component-vertex"><input semantic="POSITION" source="#component-position"/></vertices>\n')
+		f.write('<triangles count="%d"><input semantic="VERTEX" source="#component-vertex" offset="0"/><input semantic="TEXCOORD" source="#component-uv" offset="1"/>\n' % (len(vertexes) / 3))
+		f.write('<p>%s</p></triangles>\n</mesh></geometry></library_geometries>\n' % (' '.join(map(lambda n: '%d 0' % (n), xrange(0, len(vertexes))))))
+		f.write('<library_nodes><node id="component"><instance_geometry url="#component-mesh"/></node></library_nodes>\n')
+		f.write('<library_visual_scenes><visual_scene id="scene"><node name="model"><matrix>1 0 0 0 0 1 0 0 0 0 1 0 0 0 0 1</matrix>\n')
+		for n in xrange(0, instanceCount):
+			f.write('<node><matrix>1 0 0 %d 0 1 0 %d 0 0 1 0 0 0 0 1</matrix><instance_node url="#component"/></node>\n' % ((n % 10) * 100, (n / 10) * 100))
+		f.write('</node></visual_scene></library_visual_scenes>\n<scene><instance_visual_scene url="#scene"/></scene>\n</COLLADA>\n')
+
+def _loadDaeTree(filename):
+	loader = _daeTreeLoader(filename)
+	return [loader.obj]
+
+#For each format: the file extension, the function to write a file with the given vertexes, and the reference loader.
+benchmarkFormats = {
+	'stl-binary': ('.stl', _writeBinaryStl, _loadBinaryStlPerFace),
+	'stl-ascii': ('.stl', _writeAsciiStl, _loadAsciiStlPerLine),
+	'obj': ('.obj', _writeObj, _loadObjPerFace),
+	'amf': ('.amf', _writeAmf, _loadAmfTree),
+	'dae': ('.dae', _writeDae, _loadDaeTree),
+}
+benchmarkFormatOrder = ['stl-binary', 'stl-ascii', 'obj', 'amf', 'dae']
+
+def _getVertexes(objects):
+	return numpy.concatenate(map(lambda m: m.vertexes[0:m.vertexCount], sum(map(lambda obj: obj._meshList, objects), [])))
+
+def _timeLoad(loader, filename, repeat):
+	#:return: The fastest load time and the loaded objects of the last run.
+	best = None
+	for n in xrange(0, repeat):
+		t = time.time()
+		objects = loader(filename)
+		t = time.time() - t
+		if best is None or t < best:
+			best = t
+	return best, objects
+
+def _timeRead(filename, repeat):
+	best = None
+	for n in xrange(0, repeat + 1):
+		t = time.time()
+		with open(filename, 'rb') as f:
+			while len(f.read(1024 * 1024)) > 0:
+				pass
+		t = time.time() - t
+		if best is None or t < best:
+			best = t
+	return best
+
+def runBenchmark(formatName, faceCount, repeat = 3, reference = True):
+	"""
+	Write a file with random faces and load it.
+	:return: Dictionary with the file size in bytes, the read time, the load time and the reference load time (None when not measured) in seconds,
+		and if the vertexes of both loaders are the same.
+	"""
+	extension, writer, referenceLoader = benchmarkFormats[formatName]
+	vertexes = (numpy.random.rand(faceCount * 3, 3) * 100.0).astype(numpy.float32)
+	f = tempfile.NamedTemporaryFile(prefix='CuraBenchmark', suffix=extension, delete=False)
+	f.close()
+	try:
+		writer(f.name, vertexes)
+		ret = {'size': os.stat(f.name).st_size, 'read': _timeRead(f.name, repeat), 'reference': None, 'equal': None}
+		ret['load'], objects = _timeLoad(meshLoader.loadMeshes, f.name, repeat)
+		if reference:
+			ret['reference'], referenceObjects = _timeLoad(referenceLoader, f.name, 1)
+			ret['equal'] = numpy.array_equal(_getVertexes(objects), _getVertexes(referenceObjects))
+	finally:
+		os.unlink(f.name)
+	return ret
+
+def printResult(formatName, faceCount, result):
+	size = result['size'] / 1024.0 / 1024.0
+	line = '%-12s %9d faces %8.1fMB  read %7.3fs (%7.1fMB/s)  load %7.3fs (%7.1fMB/s)' % (formatName, faceCount, size,
+		result['read'], size / max(result['read'], 0.000001), result['load'], size / max(result['load'], 0.000001))
+	if result['reference'] is not None:
+		line += '  reference %8.3fs (%5.1fx faster, %s)' % (result['reference'], result['reference'] / max(result['load'], 0.000001),
+			'same vertexes' if result['equal'] else 'DIFFERENT VERTEXES')
+	print line
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options]")
+	parser.add_option("--format", action="append", type="choice", choices=benchmarkFormatOrder, dest="formats",
+		help="File format to benchmark, can be given multiple times. Defaults to all formats")
+	parser.add_option("--faces", action="append", type="int", dest="faces",
+		help="Number of faces in the file, can be given multiple times. Defaults to 20000 and 200000")
+	parser.add_option("--repeat", action="store", type="int", dest="repeat", default=3,
+		help="Number of loads per file, the fastest load is used")
+	parser.add_option("--no-reference", action="store_false", dest="reference", default=True,
+		help="Do not run the reference loaders, these are slow on large files")
+	(options, args) = parser.parse_args()
+
+	formats = options.formats
+	if formats is None:
+		formats = benchmarkFormatOrder
+	faces = options.faces
+	if faces is None:
+		faces = [20000, 200000]
+	failed = False
+	for formatName in formats:
+		for faceCount in faces:
+			result = runBenchmark(formatName, faceCount, options.repeat, options.reference)
+			printResult(formatName, faceCount, result)
+			if result['equal'] is False:
+				failed = True
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
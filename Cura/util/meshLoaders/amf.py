@@ -10,6 +10,8 @@ __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AG
 import cStringIO as StringIO
 import zipfile
 import os
+import array
+import numpy
 try:
 	from xml.etree import cElementTree as ElementTree
 except:
@@ -18,71 +20,87 @@ except:
 from Cura.util import printableObject
 from Cura.util import profile
 
+#The units of the AMF standard.
+_units = ['millimeter', 'meter', 'inch', 'feet', 'micron']
+#The elements with the coordinates of a vertex and the vertex indexes of a triangle, with their index in the vertex or triangle.
+_coordinateIndex = {'x': 0, 'y': 1, 'z': 2}
+_triangleIndex = {'v1': 0, 'v2': 1, 'v3': 2}
+
+def _addVolumes(obj, vertexes, volumes):
+	#Create a mesh for each volume, with a single gather of the vertexes of all its triangles.
+	vertexes = numpy.frombuffer(vertexes, numpy.float32).reshape((-1, 3))
+	for indexes in volumes:
+		m = obj._addMesh()
+		m._prepareFaceCount(len(indexes) / 3)
+		m._addFaces(vertexes[numpy.frombuffer(indexes, numpy.int32)])
+
 def loadScene(filename):
+	"""
+	Load all objects of an AMF file.
+	The XML is parsed while it is read (and unzipped), and elements are cleared as soon as they are used, so large files do not need to
+	fit in memory as a tree. Coordinates and triangle indexes are collected in typed arrays, which grow like a list but store 4 bytes per value.
+	"""
 	try:
 		zfile = zipfile.ZipFile(filename)
-		xml = zfile.read(zfile.namelist()[0])
-		zfile.close()
+		f = zfile.open(zfile.namelist()[0])
 	except zipfile.BadZipfile:
-		f = open(filename, "r")
-		xml = f.read()
-		f.close()
-	amf = ElementTree.fromstring(xml)
-	if 'unit' in amf.attrib:
-		unit = amf.attrib['unit'].lower()
-	else:
-		unit = 'millimeter'
-	if unit == 'millimeter':
-		scale = 1.0
-	elif unit == 'meter':
-		scale = 1000.0
-	elif unit == 'inch':
-		scale = 25.4
-	elif unit == 'feet':
-		scale = 304.8
-	elif unit == 'micron':
-		scale = 0.001
-	else:
-		print "Unknown unit in amf: %s" % (unit)
-		scale = 1.0
+		zfile = None
+		f = open(filename, "rb")
 
 	ret = []
-	for amfObj in amf.iter('object'):
-		obj = printableObject.printableObject(filename)
-		for amfMesh in amfObj.iter('mesh'):
-			vertexList = []
-			for vertices in amfMesh.iter('vertices'):
-				for vertex in vertices.iter('vertex'):
-					for coordinates in vertex.iter('coordinates'):
-						v = [0.0,0.0,0.0]
-						for t in coordinates:
-							if t.tag == 'x':
-								v[0] = float(t.text)
-							elif t.tag == 'y':
-								v[1] = float(t.text)
-							elif t.tag == 'z':
-								v[2] = float(t.text)
-						vertexList.append(v)
-
-			for volume in amfMesh.iter('volume'):
-				m = obj._addMesh()
-				count = 0
-				for triangle in volume.iter('triangle'):
-					count += 1
-				m._prepareFaceCount(count)
-
-				for triangle in volume.iter('triangle'):
-					for t in triangle:
-						if t.tag == 'v1':
-							v1 = vertexList[int(t.text)]
-						elif t.tag == 'v2':
-							v2 = vertexList[int(t.text)]
-						elif t.tag == 'v3':
-							v3 = vertexList[int(t.text)]
-							m._addFace(v1[0], v1[1], v1[2], v2[0], v2[1], v2[2], v3[0], v3[1], v3[2])
-		obj._postProcessAfterLoad()
-		ret.append(obj)
-
+	obj = None
+	vertexes = array.array('f')
+	coordinates = [0.0, 0.0, 0.0]
+	volumes = []
+	triangles = array.array('i')
+	triangle = [0, 0, 0]
+	try:
+		#Only end events are used, the text of an element is complete at its end.
+		for event, elem in ElementTree.iterparse(f):
+			tag = elem.tag
+			if tag in _coordinateIndex:
+				coordinates[_coordinateIndex[tag]] = float(elem.text)
+			elif tag in _triangleIndex:
+				triangle[_triangleIndex[tag]] = int(elem.text)
+				if tag == 'v3':
+					triangles.extend(triangle)
+			elif tag == 'coordinates':
+				vertexes.extend(coordinates)
+				coordinates = [0.0, 0.0, 0.0]
+			elif tag == 'vertex' or tag == 'triangle':
+				#The empty element stays in its parent until the parent is cleared.
+				elem.clear()
+			elif tag == 'vertices':
+				elem.clear()
+			elif tag == 'volume':
+				volumes.append(triangles)
+				triangles = array.array('i')
+				elem.clear()
+			elif tag == 'mesh':
+				if obj is None:
+					obj = printableObject.printableObject(filename)
+				_addVolumes(obj, vertexes, volumes)
+				vertexes = array.array('f')
+				volumes = []
+				elem.clear()
+			elif tag == 'object':
+				if obj is None:
+					obj = printableObject.printableObject(filename)
+				obj._postProcessAfterLoad()
+				ret.append(obj)
+				obj = None
+				elem.clear()
+			elif tag == 'amf':
+				if 'unit' in elem.attrib:
+					unit = elem.attrib['unit'].lower()
+				else:
+					unit = 'millimeter'
+				if unit not in _units:
+					print "Unknown unit in amf: %s" % (unit)
+	finally:
+		f.close()
+		if zfile is not None:
+			zfile.close()
 	return ret
 
 def saveScene(filename, objects):
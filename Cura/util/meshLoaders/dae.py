@@ -9,6 +9,7 @@ __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AG
 
 from  xml.parsers.expat import ParserCreate
 import os
+import numpy
 
 from Cura.util import printableObject
 
@@ -16,12 +17,21 @@ def loadScene(filename):
 	loader = daeLoader(filename)
 	return [loader.obj]
 
+class _daeNode(object):
+	""" A node of the scene, with the transformation matrix of the node, its child nodes and the geometries and nodes that are instanced in it. """
+	def __init__(self):
+		self.matrix = None
+		self.children = []
+		self.geometryUrls = []
+		self.nodeUrls = []
+
 class daeLoader(object):
 	"""
-	COLLADA object loader. This class is a bit of a mess, COLLADA files are complex beasts, and this code has only been tweaked to accept
-	the COLLADA files exported from SketchUp.
+	COLLADA object loader. COLLADA files are complex beasts, and this code has only been tweaked to accept the COLLADA files exported from SketchUp.
 
-	Parts of this class can be cleaned up and improved by using more numpy.
+	While parsing only the data needed for the geometry is kept: the float arrays of the sources, the triangles of the meshes, and the nodes
+	with their matrix and instances. Float arrays and index lists are converted with numpy. The triangles of each geometry are gathered once,
+	and then transformed for each instance of the geometry.
 	"""
 	def __init__(self, filename):
 		self.obj = printableObject.printableObject(filename)
@@ -32,144 +42,133 @@ class daeLoader(object):
 		r.EndElementHandler = self._EndElementHandler
 		r.CharacterDataHandler = self._CharacterDataHandler
 
-		self._base = {}
-		self._cur = self._base
-		self._idMap = {}
-		self._geometryList = []
-		self._faceCount = 0
-		r.ParseFile(open(filename, "r"))
-		
-		self.vertexCount = 0
-		for instance_visual_scene in self._base['collada'][0]['scene'][0]['instance_visual_scene']:
-			for node in self._idMap[instance_visual_scene['_url']]['node']:
-				self._ProcessNode1(node)
-		self.mesh._prepareFaceCount(self._faceCount)
-		for instance_visual_scene in self._base['collada'][0]['scene'][0]['instance_visual_scene']:
-			for node in self._idMap[instance_visual_scene['_url']]['node']:
-				self._ProcessNode2(node)
-
-		scale = float(self._base['collada'][0]['asset'][0]['unit'][0]['_meter']) * 1000
-		self.mesh.vertexes *= scale
-		
-		self._base = None
-		self._cur = None
-		self._idMap = None
-		
+		self._meter = 1.0
+		self._floatArrays = {}
+		self._positionSources = {}
+		self._geometries = {}
+		self._nodes = {}
+		self._visualScenes = {}
+		self._sceneUrls = []
+		self._triangleVertexes = {}
+		#The names of the open elements, the open nodes, and the text of the element that is read.
+		self._path = []
+		self._nodeStack = []
+		self._text = None
+		self._id = {}
+		self._triangles = None
+		f = open(filename, "rb")
+		r.ParseFile(f)
+		f.close()
+
+		instances = []
+		for url in self._sceneUrls:
+			if url in self._visualScenes:
+				self._ProcessNode(self._visualScenes[url], None, instances)
+		instanceVertexes = map(lambda instance: self._GetTriangleVertexes(instance[0]), instances)
+		self.mesh._prepareFaceCount(sum(map(len, instanceVertexes)) / 3)
+		for n in xrange(0, len(instances)):
+			matrix = instances[n][1]
+			vertexes = instanceVertexes[n]
+			if matrix is not None:
+				vertexes = numpy.dot(vertexes, matrix[0:3,0:3].transpose()) + matrix[0:3,3]
+			self.mesh._addFaces(vertexes)
+		self.mesh.vertexes *= self._meter * 1000
+
+		self._floatArrays = None
+		self._geometries = None
+		self._nodes = None
+		self._visualScenes = None
+		self._triangleVertexes = None
+
 		self.obj._postProcessAfterLoad()
 
-	def _ProcessNode1(self, node):
-		if 'node' in node:
-			for n in node['node']:
-				self._ProcessNode1(n)
-		if 'instance_geometry' in node:
-			for instance_geometry in node['instance_geometry']:
-				mesh = self._idMap[instance_geometry['_url']]['mesh'][0]
-				if 'triangles' in mesh:
-					for triangles in mesh['triangles']:
-						self._faceCount += int(triangles['_count'])
-				elif 'lines' in mesh:
-					pass #Ignore lines
-				else:
-					print mesh.keys()
-		if 'instance_node' in node:
-			for instance_node in node['instance_node']:
-				self._ProcessNode1(self._idMap[instance_node['_url']])
-
-	def _ProcessNode2(self, node, matrix = None):
-		if 'matrix' in node:
-			oldMatrix = matrix
-			matrix = map(float, node['matrix'][0]['__data'].split())
-			if oldMatrix is not None:
-				newMatrix = [0]*16
-				newMatrix[0] = oldMatrix[0] * matrix[0] + oldMatrix[1] * matrix[4] + oldMatrix[2] * matrix[8] + oldMatrix[3] * matrix[12]
-				newMatrix[1] = oldMatrix[0] * matrix[1] + oldMatrix[1] * matrix[5] + oldMatrix[2] * matrix[9] + oldMatrix[3] * matrix[13]
-				newMatrix[2] = oldMatrix[0] * matrix[2] + oldMatrix[1] * matrix[6] + oldMatrix[2] * matrix[10] + oldMatrix[3] * matrix[14]
-				newMatrix[3] = oldMatrix[0] * matrix[3] + oldMatrix[1] * matrix[7] + oldMatrix[2] * matrix[11] + oldMatrix[3] * matrix[15]
-				newMatrix[4] = oldMatrix[4] * matrix[0] + oldMatrix[5] * matrix[4] + oldMatrix[6] * matrix[8] + oldMatrix[7] * matrix[12]
-				newMatrix[5] = oldMatrix[4] * matrix[1] + oldMatrix[5] * matrix[5] + oldMatrix[6] * matrix[9] + oldMatrix[7] * matrix[13]
-				newMatrix[6] = oldMatrix[4] * matrix[2] + oldMatrix[5] * matrix[6] + oldMatrix[6] * matrix[10] + oldMatrix[7] * matrix[14]
-				newMatrix[7] = oldMatrix[4] * matrix[3] + oldMatrix[5] * matrix[7] + oldMatrix[6] * matrix[11] + oldMatrix[7] * matrix[15]
-				newMatrix[8] = oldMatrix[8] * matrix[0] + oldMatrix[9] * matrix[4] + oldMatrix[10] * matrix[8] + oldMatrix[11] * matrix[12]
-				newMatrix[9] = oldMatrix[8] * matrix[1] + oldMatrix[9] * matrix[5] + oldMatrix[10] * matrix[9] + oldMatrix[11] * matrix[13]
-				newMatrix[10] = oldMatrix[8] * matrix[2] + oldMatrix[9] * matrix[6] + oldMatrix[10] * matrix[10] + oldMatrix[11] * matrix[14]
-				newMatrix[11] = oldMatrix[8] * matrix[3] + oldMatrix[9] * matrix[7] + oldMatrix[10] * matrix[11] + oldMatrix[11] * matrix[15]
-				newMatrix[12] = oldMatrix[12] * matrix[0] + oldMatrix[13] * matrix[4] + oldMatrix[14] * matrix[8] + oldMatrix[15] * matrix[12]
-				newMatrix[13] = oldMatrix[12] * matrix[1] + oldMatrix[13] * matrix[5] + oldMatrix[14] * matrix[9] + oldMatrix[15] * matrix[13]
-				newMatrix[14] = oldMatrix[12] * matrix[2] + oldMatrix[13] * matrix[6] + oldMatrix[14] * matrix[10] + oldMatrix[15] * matrix[14]
-				newMatrix[15] = oldMatrix[12] * matrix[3] + oldMatrix[13] * matrix[7] + oldMatrix[14] * matrix[11] + oldMatrix[15] * matrix[15]
-				matrix = newMatrix
-		if 'node' in node:
-			for n in node['node']:
-				self._ProcessNode2(n, matrix)
-		if 'instance_geometry' in node:
-			for instance_geometry in node['instance_geometry']:
-				mesh = self._idMap[instance_geometry['_url']]['mesh'][0]
-				
-				if 'triangles' in mesh:
-					for triangles in mesh['triangles']:
-						for input in triangles['input']:
-							if input['_semantic'] == 'VERTEX':
-								vertices = self._idMap[input['_source']]
-						for input in vertices['input']:
-							if input['_semantic'] == 'POSITION':
-								vertices = self._idMap[input['_source']]
-						indexList = map(int, triangles['p'][0]['__data'].split())
-						positionList = map(float, vertices['float_array'][0]['__data'].split())
-
-						faceCount = int(triangles['_count'])
-						stepSize = len(indexList) / (faceCount * 3)
-						for i in xrange(0, faceCount):
-							idx0 = indexList[((i * 3) + 0) * stepSize]
-							idx1 = indexList[((i * 3) + 1) * stepSize]
-							idx2 = indexList[((i * 3) + 2) * stepSize]
-							x0 = positionList[idx0*3]
-							y0 = positionList[idx0*3+1]
-							z0 = positionList[idx0*3+2]
-							x1 = positionList[idx1*3]
-							y1 = positionList[idx1*3+1]
-							z1 = positionList[idx1*3+2]
-							x2 = positionList[idx2*3]
-							y2 = positionList[idx2*3+1]
-							z2 = positionList[idx2*3+2]
-							if matrix is not None:
-								self.mesh._addFace(
-									x0 * matrix[0] + y0 * matrix[1] + z0 * matrix[2] + matrix[3], x0 * matrix[4] + y0 * matrix[5] + z0 * matrix[6] + matrix[7], x0 * matrix[8] + y0 * matrix[9] + z0 * matrix[10] + matrix[11],
-									x1 * matrix[0] + y1 * matrix[1] + z1 * matrix[2] + matrix[3], x1 * matrix[4] + y1 * matrix[5] + z1 * matrix[6] + matrix[7], x1 * matrix[8] + y1 * matrix[9] + z1 * matrix[10] + matrix[11],
-									x2 * matrix[0] + y2 * matrix[1] + z2 * matrix[2] + matrix[3], x2 * matrix[4] + y2 * matrix[5] + z2 * matrix[6] + matrix[7], x2 * matrix[8] + y2 * matrix[9] + z2 * matrix[10] + matrix[11]
-								)
-							else:
-								self.mesh._addFace(x0, y0, z0, x1, y1, z1, x2, y2, z2)
-		if 'instance_node' in node:
-			for instance_node in node['instance_node']:
-				self._ProcessNode2(self._idMap[instance_node['_url']], matrix)
-	
+	def _ProcessNode(self, node, matrix, instances):
+		#Collect the (geometry url, matrix) of each geometry instance below this node, in the order of the file.
+		if node.matrix is not None:
+			if matrix is None:
+				matrix = node.matrix
+			else:
+				matrix = numpy.dot(matrix, node.matrix)
+		for child in node.children:
+			self._ProcessNode(child, matrix, instances)
+		for url in node.geometryUrls:
+			instances.append((url, matrix))
+		for url in node.nodeUrls:
+			if url in self._nodes:
+				self._ProcessNode(self._nodes[url], matrix, instances)
+
+	def _GetTriangleVertexes(self, url):
+		#The 3 vertexes of each triangle of a geometry after each other, this is only gathered once for geometries with multiple instances.
+		if url in self._triangleVertexes:
+			return self._triangleVertexes[url]
+		parts = [numpy.zeros((0, 3), numpy.float64)]
+		for triangles in self._geometries.get(url, []):
+			count = triangles['count']
+			indexes = triangles['indexes']
+			if count < 1 or indexes is None:
+				continue
+			positions = self._floatArrays[self._positionSources[triangles['source']]]
+			positions = positions[0:len(positions) / 3 * 3].reshape((-1, 3))
+			#The index list has an index for each input of each vertex, the vertex index is at the offset of the VERTEX input.
+			stepSize = len(indexes) / (count * 3)
+			parts.append(positions[indexes[triangles['offset']::stepSize][0:count * 3]])
+		self._triangleVertexes[url] = numpy.concatenate(parts)
+		return self._triangleVertexes[url]
+
 	def _StartElementHandler(self, name, attributes):
 		name = name.lower()
-		if not name in self._cur:
-			self._cur[name] = []
-		new = {'__name': name, '__parent': self._cur}
-		self._cur[name].append(new)
-		self._cur = new
-		for k in attributes.keys():
-			self._cur['_' + k] = attributes[k]
-		
+		parent = None
+		if len(self._path) > 0:
+			parent = self._path[-1]
+		self._path.append(name)
 		if 'id' in attributes:
-			self._idMap['#' + attributes['id']] = self._cur
-		
+			self._id[name] = '#' + attributes['id']
+
+		if name == 'float_array' or name == 'matrix' or name == 'p':
+			if (name == 'float_array' and parent == 'source') or (name == 'matrix' and parent == 'node') or (name == 'p' and parent == 'triangles'):
+				self._text = []
+		elif name == 'input':
+			if parent == 'vertices' and attributes.get('semantic') == 'POSITION':
+				self._positionSources[self._id['vertices']] = attributes['source']
+			elif parent == 'triangles' and attributes.get('semantic') == 'VERTEX':
+				self._triangles['source'] = attributes['source']
+				self._triangles['offset'] = int(attributes.get('offset', 0))
+		elif name == 'triangles' and parent == 'mesh':
+			self._triangles = {'count': int(attributes.get('count', 0)), 'source': None, 'offset': 0, 'indexes': None}
+			self._geometries.setdefault(self._id['geometry'], []).append(self._triangles)
+		elif name == 'node' or name == 'visual_scene':
+			node = _daeNode()
+			if name == 'visual_scene':
+				self._visualScenes['#' + attributes.get('id', '')] = node
+			else:
+				if 'id' in attributes:
+					self._nodes['#' + attributes['id']] = node
+				if len(self._nodeStack) > 0:
+					self._nodeStack[-1].children.append(node)
+			self._nodeStack.append(node)
+		elif name == 'instance_geometry' and parent == 'node':
+			self._nodeStack[-1].geometryUrls.append(attributes['url'])
+		elif name == 'instance_node' and parent == 'node':
+			self._nodeStack[-1].nodeUrls.append(attributes['url'])
+		elif name == 'instance_visual_scene' and parent == 'scene':
+			self._sceneUrls.append(attributes['url'])
+		elif name == 'unit' and self._path == ['collada', 'asset', 'unit'] and 'meter' in attributes:
+			self._meter = float(attributes['meter'])
+
 	def _EndElementHandler(self, name):
-		self._cur = self._cur['__parent']
+		name = self._path.pop()
+		if self._text is not None:
+			data = ''.join(self._text)
+			self._text = None
+			if name == 'float_array':
+				self._floatArrays[self._id['source']] = numpy.fromstring(data, numpy.float64, sep=' ')
+			elif name == 'p':
+				self._triangles['indexes'] = numpy.fromstring(data, numpy.int64, sep=' ')
+			elif name == 'matrix' and self._nodeStack[-1].matrix is None:
+				self._nodeStack[-1].matrix = numpy.fromstring(data, numpy.float64, sep=' ').reshape((4, 4))
+		elif name == 'node' or name == 'visual_scene':
+			self._nodeStack.pop()
 
 	def _CharacterDataHandler(self, data):
-		if len(data.strip()) < 1:
-			return
-		if '__data' in self._cur:
-			self._cur['__data'] += data
-		else:
-			self._cur['__data'] = data
-	
-	def _GetWithKey(self, item, basename, key, value):
-		input = basename
-		while input in item:
-			if item[basename]['_'+key] == value:
-				return self._idMap[item[input]['_source']]
-			basename += "!"
+		if self._text is not None:
+			self._text.append(data)
@@ -2,46 +2,112 @@
 OBJ file reader.
 OBJ are wavefront object files. These are quite common and can be exported from a lot of 3D tools.
 Only vertex information is read from the OBJ file, information about textures and normals is ignored.
+The objects and groups (o and g lines) can be loaded as separate meshes, so they can be printed with different extruders.
 
 http://en.wikipedia.org/wiki/Wavefront_.obj_file
 """
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
 import os
+import re
+import itertools
+import operator
+import numpy
+
 from Cura.util import printableObject
+from Cura.util import profile
 
-def loadScene(filename):
-	obj = printableObject.printableObject(filename)
-	m = obj._addMesh()
+#The lines that are used: vertexes, faces, objects and groups, with the text after the keyword.
+_lineRegex = re.compile('^[ \t]*([vfog])[ \t]+(.*)$', re.MULTILINE)
+#The texture and normal index after the vertex index of a face, like 1/2/3 or 1//3.
+_faceIndexSuffixRegex = re.compile('/[^ \t]*')
 
-	vertexList = []
-	faceList = []
+def _parseVertexes(lines):
+	"""
+	Convert the text after the 'v' of the vertex lines to an (n, 3) array, all numbers are converted with a single numpy call.
+	If that does not give 3 numbers per line, because of W values, vertex colours or broken values, each line is converted on its own.
+	"""
+	vertexes = numpy.fromstring('\n'.join(lines), numpy.float64, sep=' ')
+	if len(vertexes) == len(lines) * 3:
+		return vertexes.reshape((len(lines), 3)).astype(numpy.float32)
+	vertexes = numpy.zeros((len(lines), 3), numpy.float32)
+	for n in xrange(0, len(lines)):
+		parts = lines[n].split()
+		vertexes[n] = [float(parts[0]), float(parts[1]), float(parts[2])]
+	return vertexes
 
-	f = open(filename, "r")
-	for line in f:
-		parts = line.split()
-		if len(parts) < 1:
-			continue
-		if parts[0] == 'v':
-			vertexList.append([float(parts[1]), float(parts[2]), float(parts[3])])
-		if parts[0] == 'f':
-			parts = map(lambda p: p.split('/')[0], parts)
-			for idx in xrange(1, len(parts)-2):
-				faceList.append([int(parts[1]), int(parts[idx+1]), int(parts[idx+2])])
+def _parseFaces(lines):
+	"""
+	Convert the text after the 'f' of the face lines to vertex indexes. The faces are separated by a NaN, so all indexes are converted with a single
+	numpy call. When that fails because of broken values, each line is converted on its own.
+	:return: The vertex indexes of all faces after each other, and the number of indexes of each face.
+	"""
+	values = numpy.fromstring(_faceIndexSuffixRegex.sub('', ' nan '.join(lines)) + ' nan', numpy.float64, sep=' ')
+	separators = numpy.isnan(values)
+	if numpy.count_nonzero(separators) == len(lines):
+		indexes = values[~separators]
+		if (numpy.floor(indexes) == indexes).all():
+			return indexes.astype(numpy.int64), numpy.diff(numpy.concatenate(([-1], numpy.nonzero(separators)[0]))) - 1
+	indexes = []
+	counts = numpy.zeros(len(lines), numpy.int64)
+	for n in xrange(0, len(lines)):
+		parts = map(lambda p: int(p.split('/')[0]), lines[n].split())
+		indexes += parts
+		counts[n] = len(parts)
+	return numpy.array(indexes, numpy.int64), counts
+
+def _triangulate(indexes, counts):
+	"""
+	Split the faces into triangles like a fan: index n of a face (n >= 2) makes a triangle with the first and the previous index of that face.
+	:return: (n, 3) array with the indexes of each triangle, and the face number of each triangle.
+	"""
+	starts = numpy.cumsum(counts) - counts
+	faceNr = numpy.repeat(numpy.arange(len(counts)), counts)
+	last = numpy.nonzero(numpy.arange(len(indexes)) - starts[faceNr] >= 2)[0]
+	return numpy.column_stack((indexes[starts[faceNr[last]]], indexes[last - 1], indexes[last])), faceNr[last]
+
+def loadScene(filename, splitGroups = None):
+	"""
+	Load an OBJ file as a single object.
+	:param splitGroups: Load each object and group as a separate mesh. None to use the obj_split_groups preference.
+	"""
+	if splitGroups is None:
+		splitGroups = profile.getPreference('obj_split_groups') == 'True'
+	obj = printableObject.printableObject(filename)
+
+	f = open(filename, "rb")
+	matches = _lineRegex.findall(f.read().replace('\r', '\n'))
 	f.close()
+	kinds = numpy.fromstring(''.join(map(operator.itemgetter(0), matches)), numpy.uint8)
+	lines = map(operator.itemgetter(1), matches)
+	del matches
+	isVertex = kinds == ord('v')
+	isFace = kinds == ord('f')
+	isGroup = (kinds == ord('o')) | (kinds == ord('g'))
+
+	vertexes = _parseVertexes(list(itertools.compress(lines, isVertex.tolist())))
+	triangles, faceNr = _triangulate(*_parseFaces(list(itertools.compress(lines, isFace.tolist()))))
+
+	#OBJ indexes start at 1, negative indexes are relative to the last vertex before the face. Invalid indexes use the first vertex.
+	vertexCountBefore = numpy.cumsum(isVertex)[isFace][faceNr]
+	triangles = numpy.where(triangles < 0, triangles + vertexCountBefore.reshape((-1, 1)), triangles - 1)
+	triangles[(triangles < 0) | (triangles >= len(vertexes))] = 0
 
-	m._prepareFaceCount(len(faceList))
-	for f in faceList:
-		i = f[0] - 1
-		j = f[1] - 1
-		k = f[2] - 1
-		if i < 0 or i >= len(vertexList):
-			i = 0
-		if j < 0 or j >= len(vertexList):
-			j = 0
-		if k < 0 or k >= len(vertexList):
-			k = 0
-		m._addFace(vertexList[i][0], vertexList[i][1], vertexList[i][2], vertexList[j][0], vertexList[j][1], vertexList[j][2], vertexList[k][0], vertexList[k][1], vertexList[k][2])
+	#The mesh of each group, groups with the same name are the same mesh. Faces before the first o or g line are in the first mesh.
+	groupMesh = numpy.zeros(numpy.count_nonzero(isGroup) + 1, numpy.int64)
+	if splitGroups:
+		meshNames = {}
+		for n, name in enumerate(itertools.compress(lines, isGroup.tolist())):
+			groupMesh[n + 1] = meshNames.setdefault(name.strip(), len(meshNames) + 1)
+	triangleMesh = groupMesh[numpy.cumsum(isGroup)[isFace][faceNr]]
+
+	for meshNr in xrange(0, groupMesh.max() + 1):
+		meshTriangles = triangles[triangleMesh == meshNr]
+		if len(meshTriangles) < 1 and (meshNr < groupMesh.max() or len(obj._meshList) > 0):
+			continue
+		m = obj._addMesh()
+		m._prepareFaceCount(len(meshTriangles))
+		m._addFaces(vertexes[meshTriangles])
 
 	obj._postProcessAfterLoad()
 	return [obj]
@@ -15,37 +15,86 @@ __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AG
 import sys
 import os
 import struct
+import re
 import time
+import numpy
 
 from Cura.util import printableObject
 
+#A binary STL face: the normal, the 3 vertexes and a 16 bit attribute, 50 bytes without padding.
+_binaryFaceType = numpy.dtype([('normal', '<f4', (3,)), ('vertexes', '<f4', (3, 3)), ('attribute', '<u2')])
+#Binary files with this many bytes of faces and up are memory mapped instead of read.
+_binaryMemoryMapSize = 64 * 1024 * 1024
+#Ascii files are read in blocks of this size.
+_asciiBlockSize = 16 * 1024 * 1024
+#Bytes per vertex of a normal ascii file (about 250 bytes per face), used to size the vertex buffer before reading.
+_asciiVertexSizeEstimate = 80
+#The text after the 'vertex' keyword up to the end of the line.
+_asciiVertexRegex = re.compile('vertex(.*)')
+
+def _parseAsciiVertexes(lines):
+	"""
+	Convert the text after the 'vertex' keyword of a list of lines to an (n, 3) array.
+	All numbers are converted with a single numpy call. If that does not give 3 numbers per line, for example because of extra or broken
+	values in an export, each line is converted like the line based reader did: the first 3 values are used, and a broken value raises an error.
+	"""
+	vertexes = numpy.fromstring('\n'.join(lines), numpy.float64, sep=' ')
+	if len(vertexes) == len(lines) * 3:
+		return vertexes.reshape((len(lines), 3))
+	vertexes = numpy.zeros((len(lines), 3), numpy.float64)
+	for n in xrange(0, len(lines)):
+		data = lines[n].split()
+		vertexes[n] = [float(data[0]), float(data[1]), float(data[2])]
+	return vertexes
+
 def _loadAscii(m, f):
-	cnt = 0
-	for lines in f:
-		for line in lines.split('\r'):
-			if 'vertex' in line:
-				cnt += 1
-	m._prepareFaceCount(int(cnt) / 3)
-	f.seek(5, os.SEEK_SET)
-	cnt = 0
-	data = [None,None,None]
-	for lines in f:
-		for line in lines.split('\r'):
-			if 'vertex' in line:
-				data[cnt] = line.split()[1:]
-				cnt += 1
-				if cnt == 3:
-					m._addFace(float(data[0][0]), float(data[0][1]), float(data[0][2]), float(data[1][0]), float(data[1][1]), float(data[1][2]), float(data[2][0]), float(data[2][1]), float(data[2][2]))
-					cnt = 0
+	#Read the file in large blocks and find all vertex lines of a block with a single regular expression.
+	# Windows, mac and unix newlines can be mixed, so all newlines are changed to \n first.
+	vertexes = numpy.zeros((max(1024, (os.fstat(f.fileno()).st_size - f.tell()) / _asciiVertexSizeEstimate), 3), numpy.float32)
+	vertexCount = 0
+	rest = ''
+	done = False
+	while not done:
+		block = f.read(_asciiBlockSize)
+		if len(block) > 0:
+			#Keep the last partial line for the next block.
+			block = rest + block.replace('\r', '\n')
+			end = block.rfind('\n') + 1
+			rest = block[end:]
+			block = block[:end]
+		else:
+			block = rest
+			done = True
+		lines = _asciiVertexRegex.findall(block)
+		if len(lines) > 0:
+			if vertexCount + len(lines) > len(vertexes):
+				#Grow the buffer by doubling it, so files with a lot of faces for their size are still read in linear time.
+				grown = numpy.zeros((max(vertexCount + len(lines), len(vertexes) * 2), 3), numpy.float32)
+				grown[0:vertexCount] = vertexes[0:vertexCount]
+				vertexes = grown
+			vertexes[vertexCount:vertexCount + len(lines)] = _parseAsciiVertexes(lines)
+			vertexCount += len(lines)
+	#An incomplete face at the end of the file is skipped.
+	m._prepareFaceCount(vertexCount / 3)
+	m._addFaces(vertexes[0:vertexCount / 3 * 3])
 
 def _loadBinary(m, f):
 	#Skip the header
 	f.read(80-5)
 	faceCount = struct.unpack('<I', f.read(4))[0]
+	#Some exporters write a wrong face count, never read past the end of the file.
+	offset = f.tell()
+	faceCount = min(faceCount, (os.fstat(f.fileno()).st_size - offset) / _binaryFaceType.itemsize)
 	m._prepareFaceCount(faceCount)
-	for idx in xrange(0, faceCount):
-		data = struct.unpack("<ffffffffffffH", f.read(50))
-		m._addFace(data[3], data[4], data[5], data[6], data[7], data[8], data[9], data[10], data[11])
+	if faceCount < 1:
+		return
+	#All faces are read at once as a structured array, large files are memory mapped so the file data is not copied into memory twice.
+	if faceCount * _binaryFaceType.itemsize >= _binaryMemoryMapSize:
+		data = numpy.memmap(f, _binaryFaceType, 'r', offset, (faceCount,))
+	else:
+		data = numpy.fromfile(f, _binaryFaceType, faceCount)
+	m._addFaces(data['vertexes'])
+	del data
 
 def loadScene(filename):
 	obj = printableObject.printableObject(filename)
@@ -127,10 +127,11 @@ def runPostProcessingPlugins(engineResult):
 		pythonFile = plugin.getFullFilename()
 
 		if tempfilename is None:
+			#The plugins work on a copy of the GCode file, so a failing plugin does not leave half processed GCode behind.
 			f = tempfile.NamedTemporaryFile(prefix='CuraPluginTemp', delete=False)
 			tempfilename = f.name
-			f.write(engineResult.getGCode())
 			f.close()
+			engineResult.saveGCode(tempfilename)
 
 		locals = {'filename': tempfilename}
 		for param in plugin.getParams():
@@ -149,10 +150,8 @@ def runPostProcessingPlugins(engineResult):
 			execfile(pythonFile, locals)
 		except:
 			locationInfo = traceback.extract_tb(sys.exc_info()[2])[-1]
+			os.unlink(tempfilename)
 			return "%s: '%s' @ %s:%s:%d" % (str(sys.exc_info()[0].__name__), str(sys.exc_info()[1]), os.path.basename(locationInfo[0]), locationInfo[2], locationInfo[1])
 	if tempfilename is not None:
-		f = open(tempfilename, "r")
-		engineResult.setGCode(f.read())
-		f.close()
-		os.unlink(tempfilename)
+		engineResult.setGCodeFile(tempfilename, True)
 	return None
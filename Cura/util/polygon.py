@@ -5,6 +5,27 @@ __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AG
 
 import numpy
 
+#Point arrays with more points than this are filtered with numpy before the convex hull is built from them.
+_hullFilterSize = 64
+
+def _removeInnerPoints(points):
+	"""
+	Remove the points that are strictly inside the polygon through the 8 extreme points (min/max X, Y, X+Y and X-Y).
+	These can never be on the convex hull, and for a model this removes almost all vertexes with a few numpy operations.
+	:param points: (n, 2) array of points.
+	:return: The points that can be on the convex hull.
+	"""
+	x = points[:,0].astype(numpy.float64)
+	y = points[:,1].astype(numpy.float64)
+	#The extreme points in counter clockwise order.
+	extremes = points[[numpy.argmin(x), numpy.argmin(x + y), numpy.argmin(y), numpy.argmax(x - y), numpy.argmax(x), numpy.argmax(x + y), numpy.argmax(y), numpy.argmin(x - y)]].astype(numpy.float64)
+	inside = numpy.ones(len(points), numpy.bool)
+	for n in xrange(0, len(extremes)):
+		p0 = extremes[n - 1]
+		p1 = extremes[n]
+		inside &= (p1[0] - p0[0]) * (y - p0[1]) - (p1[1] - p0[1]) * (x - p0[0]) > 0
+	return points[~inside]
+
 def convexHull(pointList):
 	""" Create a convex hull from a list of points. """
 	def _isRightTurn((p, q, r)):
@@ -16,6 +37,9 @@ def convexHull(pointList):
 		else:
 			return 0
 
+	if isinstance(pointList, numpy.ndarray) and len(pointList) > _hullFilterSize:
+		pointList = _removeInnerPoints(pointList)
+
 	unique = {}
 	for p in pointList:
 		unique[p[0],p[1]] = 1
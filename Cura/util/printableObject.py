@@ -322,6 +322,16 @@ class mesh(object):
 		self.vertexes[n][1] = y2
 		self.vertexes[n][2] = z2
 		self.vertexCount += 3
+
+	def _addFaces(self, vertexes):
+		"""
+		Add a block of faces at once, this is a lot faster than _addFace for each face.
+		:param vertexes: Array with the 3 vertexes of each face after each other, like an (n, 3, 3) or (n * 3, 3) array. It can be a strided view,
+			like a field of a structured array, and any float type. It is copied into the vertexes once.
+		"""
+		count = vertexes.size / 3
+		self.vertexes[self.vertexCount:self.vertexCount + count].reshape(vertexes.shape)[...] = vertexes
+		self.vertexCount += count
 	
 	def _prepareFaceCount(self, faceNumber):
 		#Set the amount of faces before loading data in them. This way we can create the numpy arrays before we fill them.
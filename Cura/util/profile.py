@@ -359,6 +359,9 @@ setting('youmagine_token', '', str, 'preference', 'hidden')
 setting('filament_physical_density', '1240', float, 'preference', 'hidden').setRange(500.0, 3000.0).setLabel(_("Density (kg/m3)"), _("Weight of the filament per m3. Around 1240 for PLA. And around 1040 for ABS. This value is used to estimate the weight if the filament used for the print."))
 setting('language', 'English', str, 'preference', 'hidden').setLabel(_('Language'), _('Change the language in which Cura runs. Switching language requires a restart of Cura'))
 setting('active_machine', '0', int, 'preference', 'hidden')
+setting('slice_cache_size', '256', float, 'preference', 'hidden').setRange(0.0).setLabel(_("Slice cache size (MB)"), _("Amount of disk space used to remember slicing results. Slicing the same models with the same settings again is instant when the result is still in the cache. Set to 0 to disable the cache."))
+setting('gcode_cache_size', '256', float, 'preference', 'hidden').setRange(0.0).setLabel(_("GCode cache size (MB)"), _("Amount of disk space used to remember the toolpaths of opened GCode files. Opening the same GCode file again is a lot faster when it is still in the cache. Set to 0 to disable the cache."))
+setting('obj_split_groups', 'False', bool, 'preference', 'hidden').setLabel(_("Load OBJ groups as meshes"), _("Load each object and group of an OBJ file as a separate mesh of the model, so they can be printed with different extruders."))
 
 setting('model_colour', '#FFC924', str, 'preference', 'hidden').setLabel(_('Model colour'), _('Display color for first extruder'))
 setting('model_colour2', '#CB3030', str, 'preference', 'hidden').setLabel(_('Model colour (2)'), _('Display color for second extruder'))
@@ -384,6 +387,8 @@ setting('machine_shape', 'Square', ['Square','Circular'], 'machine', 'hidden').s
 setting('ultimaker_extruder_upgrade', 'False', bool, 'machine', 'hidden')
 setting('has_heated_bed', 'False', bool, 'machine', 'hidden').setLabel(_("Heated bed"), _("If you have an heated bed, this enabled heated bed settings (requires restart)"))
 setting('gcode_flavor', 'RepRap (Marlin/Sprinter)', ['RepRap (Marlin/Sprinter)', 'UltiGCode', 'MakerBot'], 'machine', 'hidden').setLabel(_("GCode Flavor"), _("Flavor of generated GCode.\nRepRap is normal 5D GCode which works on Marlin/Sprinter based firmwares.\nUltiGCode is a variation of the RepRap GCode which puts more settings in the machine instead of the slicer.\nMakerBot GCode has a few changes in the way GCode is generated, but still requires MakerWare to generate to X3G."))
+setting('machine_acceleration', '3000', float, 'machine', 'hidden').setLabel(_("Acceleration (mm/s^2)"), _("Acceleration of the printer head, as configured in your firmware. Used to estimate the print time of GCode files."))
+setting('machine_jerk', '20', float, 'machine', 'hidden').setLabel(_("Jerk (mm/s)"), _("Largest instant change in speed of the printer head, as configured in your firmware. Used to estimate the print time of GCode files."))
 setting('relative_extrusion', 'False', bool, 'machine', 'hidden').setLabel(_("Relative Extrusion"), _("Use relative E values for Gcode output."))
 setting('extruder_amount', '1', ['1','2','3','4'], 'machine', 'hidden').setLabel(_("Extruder count"), _("Amount of extruders in your machine."))
 setting('extruder_offset_x1', '0.0', float, 'machine', 'hidden').setLabel(_("Offset X"), _("The offset of your secondary extruder compared to the primary."))
@@ -0,0 +1,198 @@
+"""
+The sliceBatch module slices a batch of model files from the commandline.
+Each file is sliced by a worker process with its own engine, so multiple engines run at the same time.
+A failure in one file is recorded in the summary and does not stop the rest of the batch.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import time
+import csv
+import json
+import traceback
+import itertools
+import multiprocessing
+
+from Cura.util import profile
+
+#The engine used by this worker process, created when the worker starts.
+_workerEngine = None
+
+def collectFiles(args):
+	"""
+	Expand the commandline arguments to a list of model files.
+	Arguments can be model files, directories (searched recursively for supported files) or manifests.
+	A manifest is a text file (.txt or .lst) with one model filename per line, relative filenames are relative to the manifest.
+	"""
+	from Cura.util import meshLoader
+	ret = []
+	for arg in args:
+		if os.path.isdir(arg):
+			for dirname, dirnames, filenames in os.walk(arg):
+				dirnames.sort()
+				for filename in sorted(filenames):
+					if os.path.splitext(filename)[1].lower() in meshLoader.loadSupportedExtensions():
+						ret.append(os.path.join(dirname, filename))
+		elif os.path.splitext(arg)[1].lower() in ['.txt', '.lst']:
+			with open(arg, "r") as f:
+				for line in f:
+					line = line.strip()
+					if len(line) < 1 or line.startswith('#'):
+						continue
+					ret.append(os.path.join(os.path.dirname(arg), line))
+		else:
+			ret.append(arg)
+	return ret
+
+def getOutputFilename(filename, output, batch, compressionExtension = ''):
+	"""
+	Get the GCode filename for a model file.
+	:param output: The -o commandline option. For a batch this is a directory, for a single file this is the GCode filename.
+	:param compressionExtension: Extension added after .gcode, like .gz to write gzip compressed GCode. Not used for a given GCode filename,
+		that is compressed depending on its own extension.
+	"""
+	if output is None:
+		return filename + '.gcode' + compressionExtension
+	if batch or os.path.isdir(output):
+		return os.path.join(output, os.path.splitext(os.path.basename(filename))[0] + '.gcode' + compressionExtension)
+	return output
+
+def _makeOutputFilenamesUnique(filenames, outputFilenames):
+	"""
+	Rename the GCode files that would be written by more than one job, like for a/part.stl and b/part.stl or for part.stl and part.obj
+	in a batch with an output directory. The first job keeps the filename, the other jobs get a number added, like part_2.gcode.
+	:return: The list of output filenames, without duplicates.
+	"""
+	from Cura.util import gcodeCompression
+	used = set(map(lambda outputFilename: os.path.normcase(os.path.abspath(outputFilename)), outputFilenames))
+	seen = set()
+	ret = []
+	for filename, outputFilename in zip(filenames, outputFilenames):
+		key = os.path.normcase(os.path.abspath(outputFilename))
+		if key in seen:
+			plainFilename = gcodeCompression.stripCompressionExtension(outputFilename)
+			base, ext = os.path.splitext(plainFilename)
+			n = 2
+			while True:
+				newFilename = '%s_%d%s%s' % (base, n, ext, outputFilename[len(plainFilename):])
+				key = os.path.normcase(os.path.abspath(newFilename))
+				if key not in used:
+					break
+				n += 1
+			print 'Warning: %s has the same GCode file as another model, it is saved as %s' % (filename, newFilename)
+			used.add(key)
+			outputFilename = newFilename
+		seen.add(key)
+		ret.append(outputFilename)
+	return ret
+
+def _initWorker(preferencePath, profileString):
+	global _workerEngine
+	from Cura.util import sliceEngine
+	#On platforms without fork the worker starts without any settings, so load them again.
+	profile.loadPreferences(preferencePath)
+	profile.setProfileFromString(profileString)
+	_workerEngine = sliceEngine.Engine(lambda progress: None)
+
+def sliceFile(job):
+	"""
+	Slice a single model file with the engine of this worker.
+	:param job: tuple of model filename and GCode filename.
+	:return: A dictionary with the summary of this job.
+	"""
+	from Cura.util import objectScene
+	from Cura.util import meshLoader
+	filename, outputFilename = job
+	summary = {'file': filename, 'output': outputFilename, 'success': False, 'error': None,
+		'printTimeSeconds': None, 'filamentMM': None, 'filamentGram': None, 'wallTime': 0.0, 'engineLog': [], 'timeline': []}
+	t = time.time()
+	try:
+		scene = objectScene.Scene()
+		scene.updateMachineDimensions()
+		for m in meshLoader.loadMeshes(filename):
+			scene.add(m)
+		if len(scene.objects()) < 1:
+			raise Exception('No objects loaded from %s' % (filename))
+		_workerEngine.runEngine(scene)
+		_workerEngine.wait()
+		result = _workerEngine.getResult()
+		if result is None or not result.isFinished():
+			if result is not None:
+				summary['engineLog'] = result.getLog()
+			raise Exception('Engine failed to slice %s' % (filename))
+		result.saveGCode(outputFilename)
+		extruderCount = int(profile.getMachineSetting('extruder_amount'))
+		summary['success'] = True
+		summary['printTimeSeconds'] = result._printTimeSeconds
+		summary['filamentMM'] = result._filamentMM[0:extruderCount]
+		summary['filamentGram'] = map(lambda e: result.getFilamentWeight(e) * 1000.0, xrange(0, extruderCount))
+		summary['engineLog'] = result.getLog()
+		summary['timeline'] = result.getTimeline().toJSON()
+		#Remove the temporary GCode file now, worker processes are not cleaned up when the pool stops.
+		result.cleanup()
+	except:
+		summary['error'] = traceback.format_exc().strip().split('\n')[-1]
+	summary['wallTime'] = time.time() - t
+	return summary
+
+def _sliceJob(job):
+	return job[0], sliceFile(job[1:])
+
+def writeSummary(filename, summaryList):
+	""" Write the summary of all jobs as JSON or CSV, depending on the extension of the filename. Only the JSON summary contains the slice timelines. """
+	if os.path.splitext(filename)[1].lower() == '.csv':
+		with open(filename, "wb") as f:
+			writer = csv.writer(f)
+			writer.writerow(['file', 'output', 'success', 'error', 'print_time_seconds', 'filament_mm', 'filament_gram', 'wall_time', 'engine_log'])
+			for summary in summaryList:
+				writer.writerow([summary['file'], summary['output'], summary['success'], summary['error'] or '', summary['printTimeSeconds'],
+					' '.join(map(lambda n: '%.2f' % (n), summary['filamentMM'] or [])), ' '.join(map(lambda n: '%.2f' % (n), summary['filamentGram'] or [])),
+					'%.3f' % (summary['wallTime']), '\n'.join(summary['engineLog'])])
+	else:
+		with open(filename, "w") as f:
+			json.dump(summaryList, f, indent=1)
+
+def runBatch(filenames, output, jobCount = None, summaryFilename = None, compressionExtension = ''):
+	"""
+	Slice all files, using jobCount worker processes. Uses a worker per CPU core if jobCount is None.
+	:param compressionExtension: '.gz' or '.zst' to write compressed GCode files, see getOutputFilename.
+	:return: The list of job summaries, in the same order as the filenames.
+	"""
+	batch = len(filenames) > 1
+	if batch and output is not None and not os.path.isdir(output):
+		os.makedirs(output)
+	outputFilenames = _makeOutputFilenamesUnique(filenames, map(lambda filename: getOutputFilename(filename, output, batch, compressionExtension), filenames))
+	jobs = map(lambda n: (n, filenames[n], outputFilenames[n]), xrange(0, len(filenames)))
+	if jobCount is None:
+		jobCount = multiprocessing.cpu_count()
+	jobCount = max(1, min(jobCount, len(jobs)))
+
+	initArgs = (profile.getPreferencePath(), profile.getProfileString())
+	summaryList = []
+	t = time.time()
+	if jobCount < 2:
+		_initWorker(*initArgs)
+		results = itertools.imap(_sliceJob, jobs)
+	else:
+		pool = multiprocessing.Pool(jobCount, _initWorker, initArgs)
+		results = pool.imap_unordered(_sliceJob, jobs)
+	for index, summary in results:
+		summaryList.append((index, summary))
+		if summary['success']:
+			print 'GCode file saved : %s (%.1fs)' % (summary['output'], summary['wallTime'])
+		else:
+			print 'Failed to slice : %s (%s)' % (summary['file'], summary['error'])
+		sys.stdout.flush()
+	if jobCount < 2:
+		_workerEngine.cleanup()
+	else:
+		pool.close()
+		pool.join()
+
+	summaryList = map(lambda item: item[1], sorted(summaryList))
+	failCount = len(filter(lambda summary: not summary['success'], summaryList))
+	print 'Sliced %d of %d files in %.1fs' % (len(summaryList) - failCount, len(summaryList), time.time() - t)
+	if summaryFilename is not None:
+		writeSummary(summaryFilename, summaryList)
+	return summaryList
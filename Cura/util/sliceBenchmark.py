@@ -0,0 +1,179 @@
+"""
+The sliceBenchmark module measures the Python side of slicing, with the engine stub instead of the real CuraEngine.
+For a few model sizes it measures the mesh transfer, polygon receive, GCode receive (stdout drain), post-processing plugins
+and the interpretation of the GCode. Results can be stored as a baseline, and later runs are compared against that baseline.
+
+Run it as: python -m Cura.util.sliceBenchmark [--size small|medium|large] [--save-baseline] [--baseline filename]
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import time
+import json
+import numpy
+from optparse import OptionParser
+
+from Cura.util import profile
+from Cura.util import pluginInfo
+from Cura.util import printableObject
+from Cura.util import objectScene
+from Cura.util import sliceEngine
+from Cura.util import engineStub
+
+#Model sizes: vertex count of the model, layers, polygons per layer per type, points per polygon and GCode lines.
+benchmarkSizes = {
+	'small': (30000, 100, 20, 30, 50000),
+	'medium': (300000, 300, 50, 40, 300000),
+	'large': (1500000, 600, 100, 50, 1000000),
+}
+benchmarkSizeOrder = ['small', 'medium', 'large']
+
+#Timeline events measured for each benchmark. The interpretation is timed by the benchmark itself.
+benchmarkMetrics = ['mesh transfer', 'polygon receive', 'gcode receive', 'post-processing plugins', 'gcode interpretation', 'total']
+
+def getDefaultBaselineFilename():
+	return os.path.join(profile.getBasePath(), 'slice_benchmark.json')
+
+def _createScene(vertexCount):
+	#A model with random triangles in a 40mm cube, only the amount of data matters for the engine stub.
+	obj = printableObject.printableObject(None)
+	mesh = obj._addMesh()
+	mesh._prepareFaceCount(vertexCount / 3)
+	mesh.vertexes[:] = numpy.random.rand(len(mesh.vertexes), 3) * 40.0
+	mesh.vertexCount = len(mesh.vertexes)
+	obj._postProcessAfterLoad()
+	scene = objectScene.Scene()
+	scene.updateMachineDimensions()
+	scene.add(obj)
+	return scene
+
+def runBenchmark(size):
+	"""
+	Slice a synthetic model once with the engine stub.
+	:return: Dictionary with the time in seconds for each metric.
+	"""
+	vertexCount, layerCount, polygonCount, pointCount, gcodeLineCount = benchmarkSizes[size]
+	scene = _createScene(vertexCount)
+	engine = sliceEngine.Engine(lambda progress: None)
+	engine.setEngineCommand(engineStub.getCommand(layerCount, polygonCount, pointCount, gcodeLineCount))
+	t = time.time()
+	engine.runEngine(scene)
+	engine.wait()
+	result = engine.getResult()
+	if result is None or not result.isFinished():
+		engine.cleanup()
+		raise Exception('Engine stub failed: %s' % ('\n'.join(result.getLog()) if result is not None else 'no result'))
+	result._loadGCodeLayers()
+	t = time.time() - t
+	timeline = result.getTimeline()
+	ret = {}
+	for metric in benchmarkMetrics:
+		ret[metric] = timeline.getTotalTime(metric)
+	ret['total'] = t
+	engine.cleanup()
+	return ret
+
+def runBenchmarks(sizes, repeat = 3):
+	"""
+	Run the benchmarks for the given sizes. Each benchmark is repeated, and the fastest time of each metric is used.
+	:return: Dictionary of sizes to metric dictionaries.
+	"""
+	ret = {}
+	for size in sizes:
+		best = None
+		for n in xrange(0, repeat):
+			times = runBenchmark(size)
+			if best is None:
+				best = times
+			else:
+				for metric in benchmarkMetrics:
+					best[metric] = min(best[metric], times[metric])
+		ret[size] = best
+	return ret
+
+def compareToBaseline(results, baseline, tolerance = 0.25, minimalDifference = 0.02):
+	"""
+	Find the metrics that are slower than the baseline.
+	:param tolerance: Fraction a metric can be slower than the baseline without being a regression.
+	:param minimalDifference: Differences smaller than this (in seconds) are seen as noise.
+	:return: List of (size, metric, baseline time, current time) tuples for each regression.
+	"""
+	regressions = []
+	for size in benchmarkSizeOrder:
+		if size not in results or size not in baseline:
+			continue
+		for metric in benchmarkMetrics:
+			if metric not in baseline[size]:
+				continue
+			old = baseline[size][metric]
+			new = results[size][metric]
+			if new > old * (1.0 + tolerance) and new - old > minimalDifference:
+				regressions.append((size, metric, old, new))
+	return regressions
+
+def printResults(results, baseline = None):
+	print '%-8s %-24s %10s %10s' % ('size', 'metric', 'time (s)', 'baseline')
+	for size in benchmarkSizeOrder:
+		if size not in results:
+			continue
+		for metric in benchmarkMetrics:
+			old = ''
+			if baseline is not None and size in baseline and metric in baseline[size]:
+				old = '%10.3f' % (baseline[size][metric])
+			print '%-8s %-24s %10.3f %10s' % (size, metric, results[size][metric], old)
+
+def main():
+	parser = OptionParser(usage="usage: %prog [options]")
+	parser.add_option("--size", action="append", type="choice", choices=benchmarkSizeOrder, dest="sizes",
+		help="Model size to benchmark (small, medium or large), can be given multiple times. Defaults to small and medium")
+	parser.add_option("--repeat", action="store", type="int", dest="repeat", default=3,
+		help="Number of runs per size, the fastest run is used")
+	parser.add_option("--baseline", action="store", type="string", dest="baseline", default=None,
+		help="Baseline file, defaults to slice_benchmark.json in the Cura settings directory")
+	parser.add_option("--save-baseline", action="store_true", dest="saveBaseline",
+		help="Store the results as the new baseline")
+	parser.add_option("--tolerance", action="store", type="float", dest="tolerance", default=0.25,
+		help="Fraction a metric can be slower than the baseline before it is reported as a regression")
+	(options, args) = parser.parse_args()
+
+	profile.loadPreferences(profile.getPreferencePath())
+	profile.loadProfile(profile.getDefaultProfilePath(), True)
+	#Never use the slice cache, and run a plugin to measure the post-processing.
+	# The cache is turned off with a temporary override, putPreference would store it in the preferences of the user.
+	profile.setTempOverride('slice_cache_size', '0')
+	pluginInfo.setPostProcessPluginConfig([{'filename': 'pauseAtZ.py', 'params': {'pauseLevel': 5.0}}])
+
+	sizes = options.sizes
+	if sizes is None:
+		sizes = ['small', 'medium']
+	baselineFilename = options.baseline
+	if baselineFilename is None:
+		baselineFilename = getDefaultBaselineFilename()
+	baseline = None
+	if os.path.isfile(baselineFilename):
+		with open(baselineFilename, "r") as f:
+			baseline = json.load(f)
+
+	try:
+		results = runBenchmarks(sizes, options.repeat)
+	finally:
+		profile.clearTempOverride('slice_cache_size')
+	printResults(results, baseline)
+
+	if options.saveBaseline:
+		if baseline is None:
+			baseline = {}
+		baseline.update(results)
+		with open(baselineFilename, "w") as f:
+			json.dump(baseline, f, indent=1, sort_keys=True)
+		print 'Baseline saved to %s' % (baselineFilename)
+	elif baseline is not None:
+		regressions = compareToBaseline(results, baseline, options.tolerance)
+		for size, metric, old, new in regressions:
+			print 'Regression: %s %s %.3fs -> %.3fs' % (size, metric, old, new)
+		if len(regressions) > 0:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
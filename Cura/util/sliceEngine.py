@@ -18,12 +18,21 @@ import urllib2
 import hashlib
 import socket
 import struct
+import tempfile
+import shutil
+import mmap
+import multiprocessing
+import cPickle as pickle
 import cStringIO as StringIO
 
 from Cura.util import profile
 from Cura.util import pluginInfo
 from Cura.util import version
 from Cura.util import gcodeInterpreter
+from Cura.util import gcodeCompression
+from Cura.util import diskCache
+from Cura.util import sliceTimeline
+from Cura.util import layerPolygons
 
 def getEngineFilename():
 	"""
@@ -45,15 +54,39 @@ def getEngineFilename():
 		tempPath = os.path.join(tempPath,'CuraEngine')
 	return tempPath
 
+#The GCode of a running engine is parsed in blocks of this size.
+_gcodeFeedBlockSize = 1024 * 1024
+
+_engineVersion = None
+def getEngineVersion():
+	"""
+		Get an identifier for the current engine executable. The engine has no version query, so the size and modification time of
+		the executable are used. This changes whenever the engine is updated, which is what the slice result cache needs.
+	:return: A string identifying the engine executable.
+	"""
+	global _engineVersion
+	if _engineVersion is None:
+		filename = getEngineFilename()
+		try:
+			stat = os.stat(filename)
+			_engineVersion = '%s:%d:%d' % (filename, stat.st_size, int(stat.st_mtime))
+		except OSError:
+			_engineVersion = filename
+	return _engineVersion
+
 class EngineResult(object):
 	"""
 	Result from running the CuraEngine.
 	Contains the engine log, polygons retrieved from the engine, the GCode and some meta-data.
+	The GCode is not kept in memory. It is spooled to a temporary file while the engine runs, and read trough memory maps of that file.
 	"""
 	def __init__(self):
 		self._engineLog = []
-		self._gcodeData = StringIO.StringIO()
-		self._polygons = []
+		self._gcodeFile = None
+		self._gcodeFilename = None
+		self._gcodeOwned = False
+		self._gcodeMap = None
+		self._polygons = layerPolygons.LayerPolygons()
 		self._replaceInfo = {}
 		self._success = False
 		self._printTimeSeconds = None
@@ -61,9 +94,17 @@ class EngineResult(object):
 		self._modelHash = None
 		self._profileString = profile.getProfileString()
 		self._preferencesString = profile.getPreferencesString()
-		self._gcodeInterpreter = gcodeInterpreter.gcode()
+		self._gcodeInterpreter = gcodeInterpreter.gcode(columnar = True)
+		self._gcodeInterpreter.processCount = multiprocessing.cpu_count()
+		self._gcodeInterpreter.lazyLoadSize = 64 * 1024 * 1024
 		self._gcodeLoadThread = None
+		#GCode received from the engine that is not parsed yet, None when the GCode is not parsed while the engine runs.
+		self._gcodeFeed = []
+		self._gcodeFeedSize = 0
 		self._finished = False
+		self._sliceStartTime = None
+		self._engineStartTime = None
+		self._timeline = sliceTimeline.SliceTimeline()
 
 	def getFilamentWeight(self, e=0):
 		#Calculates the weight of the filament in kg
@@ -100,18 +141,232 @@ class EngineResult(object):
 		return self._engineLog
 
 	def getGCode(self):
-		data = self._gcodeData.getvalue()
+		"""
+		:return: The GCode as a string. This copies the whole GCode into memory, use getGCodeMap or getGCodeStream where possible.
+		"""
+		if self._isGCodeCompressed():
+			stream = self.getGCodeStream()
+			data = stream.read()
+			stream.close()
+			return data
+		return self.getGCodeMap()[:]
+
+	def getGCodeMap(self):
+		"""
+		:return: A read-only memory map of the GCode file, or an empty string when there is no GCode or the GCode file is compressed.
+		"""
+		if self._gcodeMap is not None:
+			return self._gcodeMap
+		data = self._openGCodeMap()
+		if data is None:
+			return ''
+		if self._gcodeFile is None:
+			#Only keep the map when the GCode is complete, while the engine is still writing the file keeps growing.
+			self._gcodeMap = data
+		return data
+
+	def getGCodeStream(self):
+		"""
+		:return: A new file like object to read the GCode line by line. Each stream has its own position, so multiple readers can use the GCode at the same time.
+			A compressed GCode file is decompressed while it is read.
+		"""
+		if self._isGCodeCompressed():
+			return gcodeCompression.openGCodeFile(self._gcodeFilename, 'rb')
+		data = self._openGCodeMap()
+		if data is None:
+			return StringIO.StringIO('')
+		return _gcodeStream(data)
+
+	def getGCodeSize(self):
+		if self._gcodeFilename is None:
+			return 0
+		if self._gcodeFile is not None:
+			self._gcodeFile.flush()
+		try:
+			return os.stat(self._gcodeFilename).st_size
+		except OSError:
+			return 0
+
+	def getGCodeFilename(self):
+		"""
+		:return: The filename of the file that holds the GCode, or None when there is no GCode.
+		"""
+		if self._gcodeFile is not None:
+			self._gcodeFile.flush()
+		return self._gcodeFilename
+
+	def setGCode(self, gcode):
+		self._releaseGCode()
+		self._writeGCode(gcode)
+		self._finishGCode()
+		self._replaceInfo = {}
+
+	def setGCodeFile(self, filename, owned = False):
+		"""
+		Use an existing file as GCode of this result, without reading it.
+		:param filename: The GCode file.
+		:param owned: When True the file is temporary and is removed together with this result.
+		"""
+		self._releaseGCode()
+		self._gcodeFilename = filename
+		self._gcodeOwned = owned
+		if not owned:
+			#A GCode file opened by the user, reopening it uses the parsed layers from the cache.
+			self._gcodeInterpreter.cache = gcodeInterpreter.getLayerCache()
+		self._replaceInfo = {}
+
+	def saveGCode(self, targetFilename, progressCallback = None):
+		"""
+		Write the GCode to a file, copying it in blocks from the memory map or the decompressed stream. The file is compressed when its name
+		ends in .gz or .zst.
+		The GCode is written to a temporary file next to the target, which replaces the target when it is complete.
+		Saving to the file this result reads its GCode from does nothing, that file already holds the GCode.
+		:param progressCallback: Optional function called with the progress from 0.0 to 1.0.
+		"""
+		blockSize = 1024 * 1024
+		if self._gcodeFilename is not None and _isSameFile(targetFilename, self._gcodeFilename):
+			if progressCallback is not None:
+				progressCallback(1.0)
+			return
+		tempFilename = _getSaveTempFilename(targetFilename)
+		f = gcodeCompression.openGCodeFile(tempFilename, 'wb')
+		try:
+			if self._isGCodeCompressed():
+				size = os.stat(self._gcodeFilename).st_size
+				stream = self.getGCodeStream()
+				data = stream.read(blockSize)
+				while len(data) > 0:
+					f.write(data)
+					if progressCallback is not None:
+						progressCallback(float(stream.getCompressedPosition()) / float(size))
+					data = stream.read(blockSize)
+				stream.close()
+			else:
+				data = self.getGCodeMap()
+				for idx in xrange(0, len(data), blockSize):
+					f.write(data[idx:idx+blockSize])
+					if progressCallback is not None:
+						progressCallback(float(min(idx + blockSize, len(data))) / float(len(data)))
+		except:
+			f.close()
+			os.remove(tempFilename)
+			raise
+		f.close()
+		_replaceFile(tempFilename, targetFilename)
+
+	def _writeGCode(self, data):
+		#Append data to the GCode spool file, the spool file is created on the first write.
+		if self._gcodeFile is None:
+			self._releaseGCode()
+			self._gcodeFile = tempfile.NamedTemporaryFile(prefix='CuraGCode', suffix='.gcode', delete=False)
+			self._gcodeFilename = self._gcodeFile.name
+			self._gcodeOwned = True
+		self._gcodeFile.write(data)
+
+	def _feedGCode(self, data):
+		"""
+		Parse the GCode while the engine is writing it, so the finished layers can be shown before the engine is done.
+		The GCode is parsed in blocks of about 1MB. Output larger than the lazy load size of the interpreter is not parsed here, it is indexed
+		when the layers are requested after the engine is done.
+		"""
+		if self._gcodeFeed is None:
+			return
+		self._gcodeFeed.append(data)
+		self._gcodeFeedSize += len(data)
+		if self._gcodeFeedSize < _gcodeFeedBlockSize:
+			return
+		if self._gcodeInterpreter.lazyLoadSize is not None and self.getGCodeSize() >= self._gcodeInterpreter.lazyLoadSize:
+			self._gcodeFeed = None
+			self._gcodeInterpreter.layerList = None
+			return
+		self._parseGCodeFeed()
+
+	def _finishGCodeFeed(self):
+		#The engine is done, parse the rest of the GCode. The layers are complete now, unless post-processing plugins change the GCode.
+		if self._gcodeFeed is None:
+			return
+		self._parseGCodeFeed()
+		self._gcodeInterpreter.finishFeed()
+		self._gcodeFeed = None
+
+	def _parseGCodeFeed(self):
+		event = self._timeline.begin('gcode interpretation', 'stdout', {'size': self._gcodeFeedSize})
+		self._gcodeInterpreter.feed(''.join(self._gcodeFeed))
+		self._gcodeFeed = []
+		self._gcodeFeedSize = 0
+		self._timeline.end(event, {'layers': len(self._gcodeInterpreter.layerList)})
+
+	def _finishGCode(self, applyReplaceInfo = True):
+		#Close the spool file after the engine is done. The engine reports values like the print time after the GCode
+		# is written, these are patched into the start of the file. The replacement has the same length, so this is done in place.
+		if self._gcodeFile is None:
+			return
+		if applyReplaceInfo:
+			self._applyReplaceInfo(self._gcodeFile)
+		self._gcodeFile.close()
+		self._gcodeFile = None
+
+	def _applyReplaceInfo(self, f):
 		if len(self._replaceInfo) > 0:
-			block0 = data[0:2048]
+			f.seek(0)
+			block0 = f.read(2048)
 			for k, v in self._replaceInfo.items():
 				v = (v + ' ' * len(k))[:len(k)]
 				block0 = block0.replace(k, v)
-			return block0 + data[2048:]
-		return data
+			f.seek(0)
+			f.write(block0)
+			self._replaceInfo = {}
 
-	def setGCode(self, gcode):
-		self._gcodeData = StringIO.StringIO(gcode)
-		self._replaceInfo = {}
+	def _isGCodeCompressed(self):
+		#Only GCode files opened by the user can be compressed, the engine output is stored as plain GCode.
+		return self._gcodeFilename is not None and gcodeCompression.getCompression(self._gcodeFilename) is not None
+
+	def _openGCodeMap(self):
+		if self._gcodeFilename is None or self._isGCodeCompressed():
+			return None
+		if self._gcodeFile is not None:
+			self._gcodeFile.flush()
+		try:
+			with open(self._gcodeFilename, 'rb') as f:
+				if os.fstat(f.fileno()).st_size < 1:
+					return None
+				return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (IOError, OSError, mmap.error):
+			return None
+
+	def _releaseGCode(self):
+		if isinstance(self._gcodeInterpreter.layerList, gcodeInterpreter.gcodeLayerIndex):
+			#The index reads the layers from the file.
+			self._gcodeInterpreter.layerList.close()
+		#The layers of the old GCode, like the layers parsed while the engine was running, are parsed again when they are requested for new GCode.
+		self._gcodeInterpreter.layerList = None
+		self._gcodeLoadThread = None
+		self._gcodeFeed = []
+		self._gcodeFeedSize = 0
+		if self._gcodeMap is not None:
+			self._gcodeMap.close()
+			self._gcodeMap = None
+		if self._gcodeFile is not None:
+			self._gcodeFile.close()
+			self._gcodeFile = None
+		if self._gcodeOwned and self._gcodeFilename is not None:
+			try:
+				os.unlink(self._gcodeFilename)
+			except OSError:
+				pass
+		self._gcodeFilename = None
+		self._gcodeOwned = False
+		self._gcodeInterpreter.cache = None
+
+	def cleanup(self):
+		""" Remove the temporary GCode file of this result. """
+		self._releaseGCode()
+
+	def __del__(self):
+		try:
+			self._releaseGCode()
+		except:
+			pass
 
 	def addLog(self, line):
 		self._engineLog.append(line)
@@ -119,6 +374,73 @@ class EngineResult(object):
 	def setHash(self, hash):
 		self._modelHash = hash
 
+	def getTimeline(self):
+		"""
+		:return: The SliceTimeline with the timing of the steps that created this result.
+		"""
+		return self._timeline
+
+	def getStartLatency(self):
+		"""
+		:return: The time in seconds between the request to slice and the engine requesting the model data, or None if the engine did not start (yet).
+		"""
+		if self._sliceStartTime is None or self._engineStartTime is None:
+			return None
+		return self._engineStartTime - self._sliceStartTime
+
+	def saveToCache(self, cache, key):
+		"""
+		Store this result in a diskCache, so the same slice does not need to run the engine again.
+		The GCode is stored as-is, all other results are pickled into a separate info file.
+		"""
+		info = {
+			'polygons': self._polygons,
+			'replaceInfo': self._replaceInfo,
+			'printTimeSeconds': self._printTimeSeconds,
+			'filamentMM': self._filamentMM,
+			'engineLog': self._engineLog,
+		}
+		filename = self.getGCodeFilename()
+		if filename is None:
+			cache.store(key, '.gcode', '')
+		else:
+			cache.storeFile(key, '.gcode', filename)
+		cache.store(key, '.info', pickle.dumps(info, pickle.HIGHEST_PROTOCOL))
+		cache.finishEntry()
+
+	def loadFromCache(self, cache, key, applyReplaceInfo = True):
+		"""
+		Fill this result from a diskCache entry.
+		:param applyReplaceInfo: When False replace info stored in the entry is kept in the result and not applied to the GCode.
+		:return: True when the entry was found and loaded, False otherwise.
+		"""
+		filenames = cache.lookup(key, ['.gcode', '.info'])
+		if filenames is None:
+			return False
+		try:
+			with open(filenames[1], 'rb') as f:
+				info = pickle.load(f)
+		except:
+			traceback.print_exc()
+			cache.remove(key)
+			return False
+		#Use a copy of the cache file, so the GCode stays valid when the cache entry is evicted or the GCode is modified by plugins.
+		tempFile = tempfile.NamedTemporaryFile(prefix='CuraGCode', suffix='.gcode', delete=False)
+		tempFile.close()
+		shutil.copyfile(filenames[0], tempFile.name)
+		self.setGCodeFile(tempFile.name, True)
+		self._replaceInfo = info['replaceInfo']
+		if applyReplaceInfo and len(self._replaceInfo) > 0:
+			with open(tempFile.name, 'r+b') as f:
+				self._applyReplaceInfo(f)
+		self._polygons = info['polygons']
+		if type(self._polygons) is list:
+			self._polygons = layerPolygons.fromLayerList(self._polygons)
+		self._printTimeSeconds = info['printTimeSeconds']
+		self._filamentMM = info['filamentMM']
+		self._engineLog = info['engineLog']
+		return True
+
 	def setFinished(self, result):
 		self._finished = result
 
@@ -126,19 +448,37 @@ class EngineResult(object):
 		return self._finished
 
 	def getGCodeLayers(self, loadCallback):
+		"""
+		:return: The parsed GCode layers. While the engine runs, these are the layers it finished so far (or None when its GCode is not parsed
+			while it runs). When the engine is done and the layers are not parsed yet, they are loaded on a thread.
+		"""
 		if not self._finished:
-			return None
+			return self._gcodeInterpreter.layerList
 		if self._gcodeInterpreter.layerList is None and self._gcodeLoadThread is None:
 			self._gcodeInterpreter.progressCallback = self._gcodeInterpreterCallback
-			self._gcodeLoadThread = threading.Thread(target=lambda : self._gcodeInterpreter.load(self._gcodeData))
+			self._gcodeLoadThread = threading.Thread(target=self._loadGCodeLayers)
 			self._gcodeLoadCallback = loadCallback
+			self._gcodeYieldTime = time.time()
 			self._gcodeLoadThread.daemon = True
 			self._gcodeLoadThread.start()
 		return self._gcodeInterpreter.layerList
 
+	def _loadGCodeLayers(self):
+		if self._gcodeInterpreter.layerList is not None:
+			return
+		event = self._timeline.begin('gcode interpretation', 'gui')
+		if self.getGCodeFilename() is not None:
+			self._gcodeInterpreter.load(self.getGCodeFilename())
+		else:
+			self._gcodeInterpreter.load(self.getGCodeStream())
+		self._timeline.end(event, {'layers': len(self._gcodeInterpreter.layerList)})
+
 	def _gcodeInterpreterCallback(self, progress):
-		if len(self._gcodeInterpreter.layerList) % 5 == 0:
-			time.sleep(0.1)
+		#Small, compressed and re-parsed GCode is parsed on this thread in the GUI process, which holds the GIL most of the time.
+		# Release it now and then, so the GUI keeps handling events while the layers load.
+		if time.time() - self._gcodeYieldTime > 0.1:
+			time.sleep(0.001)
+			self._gcodeYieldTime = time.time()
 		return self._gcodeLoadCallback(self, progress)
 
 	def submitInfoOnline(self):
@@ -162,6 +502,156 @@ class EngineResult(object):
 		except:
 			pass
 
+def _isSameFile(filename1, filename2):
+	""" :return: True when both filenames are the same existing file. """
+	if not os.path.exists(filename1) or not os.path.exists(filename2):
+		return False
+	if hasattr(os.path, 'samefile'):
+		return os.path.samefile(filename1, filename2)
+	#Python 2 has no samefile on Windows, where links are rare, so compare the full paths.
+	return os.path.normcase(os.path.realpath(filename1)) == os.path.normcase(os.path.realpath(filename2))
+
+def _getSaveTempFilename(targetFilename):
+	#The temporary file is in the directory of the target, so it can be renamed, and keeps the extension, so it gets the same compression.
+	return os.path.join(os.path.dirname(os.path.abspath(targetFilename)), '.~' + os.path.basename(targetFilename))
+
+def _replaceFile(sourceFilename, targetFilename):
+	#On Windows rename can not replace an existing file.
+	if sys.platform.startswith('win') and os.path.exists(targetFilename):
+		os.remove(targetFilename)
+	os.rename(sourceFilename, targetFilename)
+
+class _gcodeStream(object):
+	"""
+	Read-only file like object on a memory map of a GCode file. Iterating over it gives the lines, like a normal file.
+	The memory map is owned by the stream and released by close().
+	"""
+	def __init__(self, data):
+		self._data = data
+
+	def __iter__(self):
+		return iter(self._data.readline, '')
+
+	def readline(self):
+		return self._data.readline()
+
+	def read(self, size = -1):
+		if size < 0:
+			size = len(self._data) - self._data.tell()
+		return self._data.read(size)
+
+	def seek(self, offset, whence = 0):
+		self._data.seek(offset, whence)
+
+	def tell(self):
+		return self._data.tell()
+
+	def close(self):
+		self._data.close()
+
+class _objectJob(object):
+	"""
+	Engine run for a single object of a one-at-a-time print.
+	"""
+	def __init__(self, commandList, modelData, height, extruderCount):
+		self.commandList = commandList
+		self.modelData = modelData
+		self.height = height
+		self.extruderCount = extruderCount
+		self.cacheKey = None
+
+class _socketReader(object):
+	"""
+	Buffered reader for the engine socket.
+	Data is received with recv_into in a preallocated buffer that is reused, so reading the small headers of the polygon
+	stream does not require a system call and a string allocation for each value.
+	"""
+	def __init__(self, sock, bufferSize = 256 * 1024):
+		self._sock = sock
+		self._buffer = bytearray(bufferSize)
+		self._view = memoryview(self._buffer)
+		self._start = 0
+		self._end = 0
+
+	def _fill(self, size):
+		#Make sure there are at least size bytes in the buffer, returns False when the connection is closed before that.
+		if self._end - self._start >= size:
+			return True
+		remaining = self._end - self._start
+		if self._start + size > len(self._buffer):
+			if size > len(self._buffer):
+				newBuffer = bytearray(max(size, len(self._buffer) * 2))
+				newBuffer[0:remaining] = self._view[self._start:self._end]
+				self._buffer = newBuffer
+				self._view = memoryview(self._buffer)
+			else:
+				self._buffer[0:remaining] = self._buffer[self._start:self._end]
+			self._start = 0
+			self._end = remaining
+		while self._end - self._start < size:
+			try:
+				recvSize = self._sock.recv_into(self._view[self._end:])
+			except:
+				recvSize = 0
+			if recvSize < 1:
+				return False
+			self._end += recvSize
+		return True
+
+	def readInt(self):
+		if not self._fill(4):
+			return None
+		value = struct.unpack_from('@i', self._buffer, self._start)[0]
+		self._start += 4
+		return value
+
+	def readInts(self, count):
+		if not self._fill(count * 4):
+			return None
+		values = struct.unpack_from('@%di' % (count), self._buffer, self._start)
+		self._start += count * 4
+		return values
+
+	def readString(self, size):
+		if not self._fill(size):
+			return None
+		data = str(self._buffer[self._start:self._start + size])
+		self._start += size
+		return data
+
+	def readPolygons(self, count):
+		"""
+		Read count polygons, each an int with the point count followed by the 64bit X/Y pairs.
+		:return: A list of point counts and a bytearray with all point data, or None when the connection is closed.
+		"""
+		lengths = [0] * count
+		pointData = bytearray()
+		unpack_from = struct.unpack_from
+		for n in xrange(0, count):
+			if self._end - self._start < 4 and not self._fill(4):
+				return None
+			length = unpack_from('@i', self._buffer, self._start)[0]
+			self._start += 4
+			size = length * 16
+			if self._end - self._start >= size:
+				pointData += self._view[self._start:self._start + size]
+				self._start += size
+			elif not self.readInto(pointData, size):
+				return None
+			lengths[n] = length
+		return lengths, pointData
+
+	def readInto(self, target, size):
+		#Append size bytes to the target bytearray. Large blocks are copied trough the buffer in parts.
+		while size > 0:
+			if not self._fill(min(size, len(self._buffer))):
+				return False
+			n = min(size, self._end - self._start)
+			target += self._view[self._start:self._start + n]
+			self._start += n
+			size -= n
+		return True
+
 class Engine(object):
 	"""
 	Class used to communicate with the CuraEngine.
@@ -172,28 +662,50 @@ class Engine(object):
 	GUI_CMD_SEND_POLYGONS = 0x02
 	GUI_CMD_FINISH_OBJECT = 0x03
 
-	def __init__(self, progressCallback):
+	#Start and end code given to the engine when objects are sliced separately, these mark where the objects are stitched together.
+	_objectStartMarker = ';CURA_OBJECT_START'
+	_objectEndMarker = ';CURA_OBJECT_END'
+
+	def __init__(self, progressCallback, useUnixSocket = False):
+		"""
+		:param progressCallback: Called with the slicing progress, -1.0 when slicing is not running, 1.0 when it is finished.
+		:param useUnixSocket: Communicate with the engine trough a unix domain socket instead of TCP on localhost.
+			The path of the socket is passed to the engine with the -g option instead of a port number, this requires an engine that supports this.
+		"""
 		self._process = None
+		self._processExited = None
 		self._thread = None
 		self._callback = progressCallback
 		self._progressSteps = ['inset', 'skin', 'export']
 		self._objCount = 0
 		self._result = None
+		self._modelData = []
+		self._engineCommand = None
+		self._resultCache = diskCache.DiskCache('slicecache', int(profile.getPreferenceFloat('slice_cache_size') * 1024 * 1024))
 
-		self._serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self._serverPortNr = 0xC20A
-		while True:
-			try:
-				self._serversocket.bind(('127.0.0.1', self._serverPortNr))
-			except:
-				print "Failed to listen on port: %d" % (self._serverPortNr)
-				self._serverPortNr += 1
-				if self._serverPortNr > 0xFFFF:
-					print "Failed to listen on any port..."
+		self._serverSocketPath = None
+		if useUnixSocket and hasattr(socket, 'AF_UNIX'):
+			self._serversocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self._serverSocketPath = os.path.join(tempfile.mkdtemp(prefix='CuraEngine'), 'socket')
+			self._serversocket.bind(self._serverSocketPath)
+			self._serverAddress = self._serverSocketPath
+			print 'Listening for engine communications on %s' % (self._serverSocketPath)
+		else:
+			self._serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self._serverPortNr = 0xC20A
+			while True:
+				try:
+					self._serversocket.bind(('127.0.0.1', self._serverPortNr))
+				except:
+					print "Failed to listen on port: %d" % (self._serverPortNr)
+					self._serverPortNr += 1
+					if self._serverPortNr > 0xFFFF:
+						print "Failed to listen on any port..."
+						break
+				else:
 					break
-			else:
-				break
-		print 'Listening for engine communications on %d' % (self._serverPortNr)
+			self._serverAddress = '%d' % (self._serverPortNr)
+			print 'Listening for engine communications on %d' % (self._serverPortNr)
 		self._serversocket.listen(1)
 		thread = threading.Thread(target=self._socketListenThread)
 		thread.daemon = True
@@ -207,65 +719,88 @@ class Engine(object):
 			thread.start()
 
 	def _socketConnectionThread(self, sock):
+		#The connection belongs to the engine process of the current slice, a new slice starts a new process with a new connection.
+		result = self._result
+		modelData = self._modelData
 		layerNrOffset = 0
+		polygonEvent = None
+		reader = _socketReader(sock)
 		while True:
-			try:
-				data = sock.recv(4)
-			except:
-				data = ''
-			if len(data) == 0:
+			cmd = reader.readInt()
+			if cmd is None:
+				result.getTimeline().end(polygonEvent)
 				sock.close()
 				return
-			cmd = struct.unpack('@i', data)[0]
 			if cmd == self.GUI_CMD_REQUEST_MESH:
-				meshInfo = self._modelData[0]
-				self._modelData = self._modelData[1:]
+				if result._engineStartTime is None:
+					result._engineStartTime = time.time()
+				meshInfo = modelData.pop(0)
+				event = result.getTimeline().begin('mesh transfer', 'socket', {'vertexCount': meshInfo[0]})
 				sock.sendall(struct.pack('@i', meshInfo[0]))
-				sock.sendall(meshInfo[1].tostring())
+				#Send the vertexes straight from the numpy array, without making a string copy first.
+				sock.sendall(buffer(meshInfo[1]))
+				result.getTimeline().end(event)
 			elif cmd == self.GUI_CMD_SEND_POLYGONS:
-				cnt = struct.unpack('@i', sock.recv(4))[0]
-				layerNr = struct.unpack('@i', sock.recv(4))[0]
+				header = reader.readInts(4)
+				if header is None:
+					return
+				cnt, layerNr, z, typeNameLen = header
+				if polygonEvent is None:
+					polygonEvent = result.getTimeline().begin('polygon receive', 'socket')
 				layerNr += layerNrOffset
-				z = struct.unpack('@i', sock.recv(4))[0]
 				z = float(z) / 1000.0
-				typeNameLen = struct.unpack('@i', sock.recv(4))[0]
-				typeName = sock.recv(typeNameLen)
-				while len(self._result._polygons) < layerNr + 1:
-					self._result._polygons.append({})
-				polygons = self._result._polygons[layerNr]
-				if typeName not in polygons:
-					polygons[typeName] = []
-				for n in xrange(0, cnt):
-					length = struct.unpack('@i', sock.recv(4))[0]
-					data = ''
-					while len(data) < length * 8 * 2:
-						recvData = sock.recv(length * 8 * 2 - len(data))
-						if len(recvData) < 1:
-							return
-						data += recvData
-					polygon2d = numpy.array(numpy.fromstring(data, numpy.int64), numpy.float32) / 1000.0
-					polygon2d = polygon2d.reshape((len(polygon2d) / 2, 2))
-					polygon = numpy.empty((len(polygon2d), 3), numpy.float32)
-					polygon[:,:-1] = polygon2d
-					polygon[:,2] = z
-					polygons[typeName].append(polygon)
+				typeName = reader.readString(typeNameLen)
+				if typeName is None:
+					return
+				#Collect the points of all polygons in one buffer, so they can be converted with a single numpy operation.
+				polygonData = reader.readPolygons(cnt)
+				if polygonData is None:
+					return
+				lengths, pointData = polygonData
+				points = numpy.frombuffer(pointData, numpy.int64).reshape((len(pointData) / 16, 2)).astype(numpy.float32)
+				points /= 1000.0
+				result._polygons.addPolygons(layerNr, z, typeName, points, lengths)
 			elif cmd == self.GUI_CMD_FINISH_OBJECT:
-				layerNrOffset = len(self._result._polygons)
+				result.getTimeline().end(polygonEvent, {'layers': len(result._polygons) - layerNrOffset})
+				polygonEvent = None
+				layerNrOffset = len(result._polygons)
 			else:
 				print "Unknown command on socket: %x" % (cmd)
 
 	def cleanup(self):
 		self.abortEngine()
+		if self._result is not None:
+			self._result.cleanup()
 		self._serversocket.close()
+		if self._serverSocketPath is not None:
+			try:
+				os.unlink(self._serverSocketPath)
+				os.rmdir(os.path.dirname(self._serverSocketPath))
+			except OSError:
+				pass
+
+	def setEngineCommand(self, command):
+		"""
+		Run a different engine executable, like the engine stub used for benchmarks.
+		:param command: List with the executable and its first arguments, the normal engine arguments are added after it. None for the normal engine.
+		"""
+		self._engineCommand = command
+
+	def _getEngineCommand(self):
+		if self._engineCommand is None:
+			return [getEngineFilename()]
+		return self._engineCommand
 
 	def abortEngine(self):
+		"""
+		Abort the current slice. The engine process is terminated but not waited for, the thread of the aborted slice
+		reaps the process in the background. This keeps the GUI responsive when the scene changes during slicing.
+		"""
 		if self._process is not None:
 			try:
 				self._process.terminate()
 			except:
 				pass
-		if self._thread is not None:
-			self._thread.join()
 		self._thread = None
 
 	def wait(self):
@@ -275,7 +810,11 @@ class Engine(object):
 	def getResult(self):
 		return self._result
 
+	def getResultCache(self):
+		return self._resultCache
+
 	def runEngine(self, scene):
+		sliceStartTime = time.time()
 		if len(scene.objects()) < 1:
 			return
 		extruderCount = 1
@@ -285,14 +824,32 @@ class Engine(object):
 
 		extruderCount = max(extruderCount, profile.minimalExtruderCount())
 
-		commandList = [getEngineFilename(), '-v', '-p']
-		for k, v in self._engineSettings(extruderCount).iteritems():
+		engineCommand = self._getEngineCommand()
+		if self._engineCommand is None:
+			engineVersion = getEngineVersion()
+		else:
+			engineVersion = ' '.join(engineCommand)
+		commandList = engineCommand + ['-v', '-p']
+		settings = self._engineSettings(extruderCount)
+		for k, v in settings.iteritems():
 			commandList += ['-s', '%s=%s' % (k, str(v))]
-		commandList += ['-g', '%d' % (self._serverPortNr)]
+		commandList += ['-g', self._serverAddress]
 		self._objCount = 0
 		engineModelData = []
 		hash = hashlib.sha512()
+		cacheKey = hashlib.sha512()
+		machineKey = '%d:%s:%s' % (extruderCount, profile.getMachineSetting('steps_per_e'), profile.getMachineSetting('has_heated_bed'))
 		order = scene.printOrder()
+		objectJobs = None
+		if order is not None and len(order) > 1 and self._resultCache.isEnabled():
+			#With one object at a time, each object is sliced on its own. So when an object changes, only that object needs to be sliced again.
+			settings['startCode'] = self._objectStartMarker
+			settings['endCode'] = self._objectEndMarker
+			objectCommandList = engineCommand + ['-v', '-p']
+			for k, v in settings.iteritems():
+				objectCommandList += ['-s', '%s=%s' % (k, str(v))]
+			objectCommandList += ['-g', self._serverAddress]
+			objectJobs = []
 		if order is None:
 			pos = numpy.array(profile.getMachineCenterCoords()) * 1000
 			objMin = None
@@ -323,15 +880,20 @@ class Engine(object):
 						vertexTotal[n] += obj._meshList[n].vertexCount
 
 			for n in xrange(0, meshMax):
-				verts = numpy.zeros((0, 3), numpy.float32)
+				#Transform the vertexes of all objects directly into a single preallocated array, which is send to the engine as-is.
+				verts = numpy.empty((vertexTotal[n], 3), numpy.float32)
+				idx = 0
 				for obj in scene.objects():
 					if scene.checkPlatform(obj):
 						if n < len(obj._meshList):
-							vertexes = (numpy.matrix(obj._meshList[n].vertexes, copy = False) * numpy.matrix(obj._matrix, numpy.float32)).getA()
-							vertexes -= obj._drawOffset
-							vertexes += numpy.array([obj.getPosition()[0], obj.getPosition()[1], 0.0])
-							verts = numpy.concatenate((verts, vertexes))
-							hash.update(obj._meshList[n].vertexes.tostring())
+							mesh = obj._meshList[n]
+							vertexes = verts[idx:idx+mesh.vertexCount]
+							numpy.dot(mesh.vertexes, numpy.asarray(obj._matrix, numpy.float32), out = vertexes)
+							vertexes += numpy.array([obj.getPosition()[0], obj.getPosition()[1], 0.0], numpy.float32) - obj._drawOffset
+							idx += mesh.vertexCount
+							hash.update(numpy.ascontiguousarray(mesh.vertexes))
+							cacheKey.update(obj._matrix.tostring())
+							cacheKey.update(obj.getPosition().tostring())
 				engineModelData.append((vertexTotal[n], verts))
 
 			commandList += ['$' * meshMax]
@@ -339,74 +901,320 @@ class Engine(object):
 		else:
 			for n in order:
 				obj = scene.objects()[n]
+				objectModelData = []
 				for mesh in obj._meshList:
-					engineModelData.append((mesh.vertexCount, mesh.vertexes))
-					hash.update(mesh.vertexes.tostring())
+					objectModelData.append((mesh.vertexCount, numpy.ascontiguousarray(mesh.vertexes, numpy.float32)))
+					hash.update(objectModelData[-1][1])
+				engineModelData += objectModelData
 				pos = obj.getPosition() * 1000
 				pos += numpy.array(profile.getMachineCenterCoords()) * 1000
-				commandList += ['-m', ','.join(map(str, obj._matrix.getA().flatten()))]
-				commandList += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
-				commandList += ['$' * len(obj._meshList)]
+				objectArgs = ['-m', ','.join(map(str, obj._matrix.getA().flatten()))]
+				objectArgs += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
+				objectArgs += ['$' * len(obj._meshList)]
+				commandList += objectArgs
 				self._objCount += 1
+				if objectJobs is not None:
+					job = _objectJob(objectCommandList + objectArgs, objectModelData, obj.getSize()[2], extruderCount)
+					objectKey = hashlib.sha512()
+					for vertexCount, vertexes in objectModelData:
+						objectKey.update(vertexes)
+					objectKey.update(engineVersion)
+					objectKey.update(profile.getProfileString())
+					objectKey.update(machineKey)
+					for arg in job.commandList[1:]:
+						if arg != self._serverAddress:
+							objectKey.update(arg + '\0')
+					job.cacheKey = objectKey.hexdigest()
+					objectJobs.append(job)
 		modelHash = hash.hexdigest()
+		#The cache key contains everything that influences the engine result. The start/end code is left out, as it contains
+		# the current time and date, the settings it is build from are part of the profile string and the other engine settings.
+		cacheKey.update(modelHash)
+		cacheKey.update(engineVersion)
+		cacheKey.update(profile.getProfileString())
+		cacheKey.update(machineKey)
+		for arg in commandList[1:]:
+			if not arg.startswith('startCode=') and not arg.startswith('endCode=') and arg != self._serverAddress:
+				cacheKey.update(arg + '\0')
+		cacheSize = int(profile.getPreferenceFloat('slice_cache_size') * 1024 * 1024)
+		if cacheSize != self._resultCache.getMaxSize():
+			self._resultCache.setMaxSize(cacheSize)
 		if self._objCount > 0:
-			self._modelData = engineModelData
-			self._thread = threading.Thread(target=self._watchProcess, args=(commandList, self._thread, modelHash))
+			oldProcessExited = self._processExited
+			self._processExited = threading.Event()
+			self._thread = threading.Thread(target=self._watchProcess, args=(commandList, engineModelData, oldProcessExited, self._processExited, modelHash, cacheKey.hexdigest(), sliceStartTime, objectJobs))
 			self._thread.daemon = True
 			self._thread.start()
 
-	def _watchProcess(self, commandList, oldThread, modelHash):
-		if oldThread is not None:
+	def _watchProcess(self, commandList, modelData, oldProcessExited, processExited, modelHash, cacheKey, sliceStartTime, objectJobs):
+		timeline = sliceTimeline.SliceTimeline(sliceStartTime)
+		timeline.addEvent('prepare model data', 'slice', sliceStartTime, time.time())
+		if oldProcessExited is not None:
+			#Only wait for the previous engine process to stop, not for the cleanup of its slice.
+			event = timeline.begin('wait for previous engine', 'slice')
 			if self._process is not None:
-				self._process.terminate()
-			oldThread.join()
+				try:
+					self._process.terminate()
+				except:
+					pass
+			oldProcessExited.wait()
+			timeline.end(event)
+		if self._thread != threading.currentThread():
+			processExited.set()
+			return
 		self._callback(-1.0)
+
+		result = EngineResult()
+		result.setHash(modelHash)
+		result._sliceStartTime = sliceStartTime
+		result._timeline = timeline
+		if objectJobs is None:
+			event = timeline.begin('cache lookup', 'slice')
+			cacheHit = result.loadFromCache(self._resultCache, cacheKey)
+			timeline.end(event, {'hit': cacheHit})
+		else:
+			cacheHit = False
+		if cacheHit:
+			processExited.set()
+			self._result = result
+			self._result.setFinished(True)
+			self._callback(1.0)
+			return
+
+		self._callback(0.0)
+		if objectJobs is None:
+			returnCode = self._runEngineProcessForResult(commandList, modelData, result)
+		else:
+			returnCode = self._runObjectJobs(objectJobs, result)
+		processExited.set()
+		if returnCode is None:
+			return
+		if self._thread != threading.currentThread():
+			#This slice was aborted, the result is no longer needed. Only report this when no newer slice is running.
+			result.cleanup()
+			if self._thread is None:
+				self._callback(-1.0)
+			return
+		if returnCode == 0:
+			result._polygons.compact()
+			event = timeline.begin('post-processing plugins', 'slice')
+			pluginError = pluginInfo.runPostProcessingPlugins(result)
+			timeline.end(event)
+			if pluginError is not None:
+				print pluginError
+				result.addLog(pluginError)
+			elif objectJobs is None:
+				event = timeline.begin('save to cache', 'slice')
+				try:
+					result.saveToCache(self._resultCache, cacheKey)
+				except:
+					traceback.print_exc()
+				timeline.end(event)
+			result.setFinished(True)
+			self._callback(1.0)
+		else:
+			for line in result.getLog():
+				print line
+			self._callback(-1.0)
+
+	def _runEngineProcessForResult(self, commandList, modelData, result, objectNr = 0, applyReplaceInfo = True):
+		"""
+		Run a single engine process and collect its output in the result.
+		:param objectNr: Number of objects sliced before this process in the same slice, used for the progress.
+		:param applyReplaceInfo: When False the replace info of the engine is kept in the result and not applied to the GCode.
+		:return: The return code of the engine, or None if the engine could not be started.
+		"""
+		timeline = result.getTimeline()
+		self._result = result
+		self._modelData = modelData
+		event = timeline.begin('engine process start', 'slice')
 		try:
-			self._process = self._runEngineProcess(commandList)
+			process = self._runEngineProcess(commandList)
 		except OSError:
 			traceback.print_exc()
-			return
+			return None
+		timeline.end(event)
+		self._process = process
 		if self._thread != threading.currentThread():
-			self._process.terminate()
+			process.terminate()
 
-		self._result = EngineResult()
-		self._result.setHash(modelHash)
-		self._callback(0.0)
-
-		logThread = threading.Thread(target=self._watchStderr, args=(self._process.stderr,))
+		logThread = threading.Thread(target=self._watchStderr, args=(process.stderr, result, objectNr))
 		logThread.daemon = True
 		logThread.start()
 
-		data = self._process.stdout.read(4096)
+		event = timeline.begin('gcode receive', 'stdout')
+		data = process.stdout.read(4096)
 		while len(data) > 0:
-			self._result._gcodeData.write(data)
-			data = self._process.stdout.read(4096)
+			result._writeGCode(data)
+			result._feedGCode(data)
+			data = process.stdout.read(4096)
+		result._finishGCodeFeed()
+		timeline.end(event, {'size': result.getGCodeSize()})
 
-		returnCode = self._process.wait()
+		event = timeline.begin('engine process exit', 'slice')
+		returnCode = process.wait()
+		if self._process is process:
+			self._process = None
 		logThread.join()
-		if returnCode == 0:
-			pluginError = pluginInfo.runPostProcessingPlugins(self._result)
-			if pluginError is not None:
-				print pluginError
-				self._result.addLog(pluginError)
-			self._result.setFinished(True)
-			self._callback(1.0)
-		else:
-			for line in self._result.getLog():
-				print line
-			self._callback(-1.0)
-		self._process = None
+		timeline.end(event, {'returnCode': returnCode})
+		result._finishGCode(applyReplaceInfo)
+		return returnCode
 
-	def _watchStderr(self, stderr):
+	def _runObjectJobs(self, objectJobs, result):
+		"""
+		Slice the objects of a one-at-a-time print separately and stitch the GCode together.
+		The GCode of each object is cached on its own, so only objects that changed since an earlier slice need the engine.
+		:return: The return code of the failing engine, 0 if all objects are sliced, or None if the engine could not be started.
+		"""
+		timeline = result.getTimeline()
+		segments = []
+		event = timeline.begin('cache lookup', 'slice')
+		for job in objectJobs:
+			segment = EngineResult()
+			if not segment.loadFromCache(self._resultCache, job.cacheKey, False):
+				segment = None
+			segments.append(segment)
+		timeline.end(event, {'objects': len(objectJobs), 'hits': len(objectJobs) - segments.count(None)})
+		self._objCount = max(1, segments.count(None))
 		objectNr = 0
+		returnCode = 0
+		for n in xrange(0, len(objectJobs)):
+			if segments[n] is not None:
+				continue
+			if self._thread != threading.currentThread():
+				break
+			segments[n] = EngineResult()
+			segments[n]._timeline = timeline
+			returnCode = self._runEngineProcessForResult(objectJobs[n].commandList, objectJobs[n].modelData, segments[n], objectNr, False)
+			objectNr += 1
+			if returnCode != 0:
+				if returnCode is not None:
+					for line in segments[n].getLog():
+						result.addLog(line)
+				break
+			if self._thread == threading.currentThread():
+				event = timeline.begin('save to cache', 'slice', {'object': n})
+				try:
+					segments[n].saveToCache(self._resultCache, objectJobs[n].cacheKey)
+				except:
+					traceback.print_exc()
+				timeline.end(event)
+		self._result = result
+		if returnCode == 0 and self._thread == threading.currentThread():
+			event = timeline.begin('stitch objects', 'slice')
+			self._stitchObjects(objectJobs, segments, result)
+			timeline.end(event)
+		for segment in segments:
+			if segment is not None:
+				segment.cleanup()
+		return returnCode
+
+	def _stitchObjects(self, objectJobs, segments, result):
+		"""
+		Combine the GCode and the other results of separately sliced objects into a single result.
+		The objects are sliced with marker comments as start and end code. The start code of the first object and the end code of the last
+		object are replaced by the real start and end code. Between objects the marked parts are replaced by a travel move above the printed objects.
+		"""
+		extruderCount = objectJobs[0].extruderCount
+		startCode = profile.getAlterationFileContents('start.gcode', extruderCount)
+		endCode = profile.getAlterationFileContents('end.gcode', extruderCount)
+		maxHeight = 0.0
+		result._printTimeSeconds = 0
+		for n in xrange(0, len(segments)):
+			segment = segments[n]
+			data = segment.getGCodeMap()
+			start = 0
+			end = len(data)
+			startIdx = data.find(self._objectStartMarker)
+			endIdx = data.rfind(self._objectEndMarker)
+			if startIdx >= 0:
+				if n == 0:
+					result._writeGCode(data[0:startIdx])
+					result._writeGCode(startCode)
+				start = startIdx + len(self._objectStartMarker)
+			if endIdx >= start:
+				end = endIdx
+			if n > 0:
+				result._writeGCode(self._objectTravelCode(data, start, end, maxHeight))
+			for idx in xrange(start, end, 1024 * 1024):
+				result._writeGCode(data[idx:min(idx + 1024 * 1024, end)])
+			if n == len(segments) - 1:
+				if endIdx >= start:
+					result._writeGCode(endCode)
+				result._writeGCode(data[end + len(self._objectEndMarker):])
+			maxHeight = max(maxHeight, objectJobs[n].height)
+
+			#The print time and filament used are the sum of all objects, the same holds for the values replaced in the GCode.
+			result._polygons.extend(segment._polygons)
+			if segment._printTimeSeconds is not None:
+				result._printTimeSeconds += segment._printTimeSeconds
+			for e in xrange(0, len(result._filamentMM)):
+				result._filamentMM[e] += segment._filamentMM[e]
+			for k, v in segment._replaceInfo.items():
+				try:
+					result._replaceInfo[k] = str(int(result._replaceInfo.get(k, 0)) + int(v))
+				except ValueError:
+					result._replaceInfo[k] = v
+			for line in segment.getLog():
+				result.addLog(line)
+		result._finishGCode()
+
+	def _objectTravelCode(self, data, start, end, maxHeight):
+		#Find the first position of the next object, so the head moves there above the objects that are already printed.
+		nextPosition = None
+		idx = start
+		while idx < end and idx - start < 64 * 1024:
+			lineEnd = data.find('\n', idx, end)
+			if lineEnd < 0:
+				lineEnd = end
+			line = data[idx:lineEnd].split(';')[0].split()
+			idx = lineEnd + 1
+			if len(line) > 0 and line[0] in ['G0', 'G1']:
+				x = filter(lambda p: p.startswith('X'), line)
+				y = filter(lambda p: p.startswith('Y'), line)
+				if len(x) > 0 and len(y) > 0:
+					nextPosition = (float(x[0][1:]), float(y[0][1:]))
+					break
+		#The GCode of each object starts with the extruder position at 0, and the filament not retracted.
+		code = [';Travel to next object', 'G92 E0']
+		retract = []
+		prime = []
+		if profile.getProfileSetting('retraction_enable') == 'True':
+			if profile.getMachineSetting('gcode_flavor') == 'UltiGCode':
+				retract = ['G10']
+				prime = ['G11']
+			else:
+				retractionSpeed = profile.getProfileSettingFloat('retraction_speed') * 60
+				retractionAmount = profile.getProfileSettingFloat('retraction_amount')
+				retract = ['G1 F%d E%0.5f' % (retractionSpeed, -retractionAmount)]
+				if profile.getMachineSetting('relative_extrusion') == 'True':
+					prime = ['G1 F%d E%0.5f' % (retractionSpeed, retractionAmount)]
+				else:
+					prime = ['G1 F%d E0' % (retractionSpeed)]
+		code += retract
+		code.append('G0 F%d Z%0.2f' % (profile.getProfileSettingFloat('travel_speed') * 60, maxHeight + 5.0))
+		if nextPosition is not None:
+			code.append('G0 X%0.2f Y%0.2f' % nextPosition)
+		code += prime
+		return '\n'.join(code) + '\n'
+
+	def _watchStderr(self, stderr, result, objectNr = 0):
+		#Each engine stage is recorded on the timeline, from its first progress report until the next stage starts.
+		timeline = result.getTimeline()
+		stageEvent = None
 		line = stderr.readline()
 		while len(line) > 0:
 			line = line.strip()
 			if line.startswith('Progress:'):
 				line = line.split(':')
+				if stageEvent is not None and (stageEvent['name'] != line[1] or stageEvent['args']['object'] != objectNr):
+					timeline.end(stageEvent)
+					stageEvent = None
 				if line[1] == 'process':
 					objectNr += 1
-				elif line[1] in self._progressSteps:
+				elif stageEvent is None:
+					stageEvent = timeline.begin(line[1], 'engine', {'object': objectNr})
+				if line[1] in self._progressSteps:
 					progressValue = float(line[2]) / float(line[3])
 					progressValue /= len(self._progressSteps)
 					progressValue += 1.0 / len(self._progressSteps) * self._progressSteps.index(line[1])
@@ -418,22 +1226,23 @@ class Engine(object):
 					except:
 						pass
 			elif line.startswith('Print time:'):
-				self._result._printTimeSeconds = int(line.split(':')[1].strip())
+				result._printTimeSeconds = int(line.split(':')[1].strip())
 			elif line.startswith('Filament:'):
-				self._result._filamentMM[0] = int(line.split(':')[1].strip())
+				result._filamentMM[0] = int(line.split(':')[1].strip())
 				if profile.getMachineSetting('gcode_flavor') == 'UltiGCode':
 					radius = profile.getProfileSettingFloat('filament_diameter') / 2.0
-					self._result._filamentMM[0] /= (math.pi * radius * radius)
+					result._filamentMM[0] /= (math.pi * radius * radius)
 			elif line.startswith('Filament2:'):
-				self._result._filamentMM[1] = int(line.split(':')[1].strip())
+				result._filamentMM[1] = int(line.split(':')[1].strip())
 				if profile.getMachineSetting('gcode_flavor') == 'UltiGCode':
 					radius = profile.getProfileSettingFloat('filament_diameter') / 2.0
-					self._result._filamentMM[1] /= (math.pi * radius * radius)
+					result._filamentMM[1] /= (math.pi * radius * radius)
 			elif line.startswith('Replace:'):
-				self._result._replaceInfo[line.split(':')[1].strip()] = line.split(':')[2].strip()
+				result._replaceInfo[line.split(':')[1].strip()] = line.split(':')[2].strip()
 			else:
-				self._result.addLog(line)
+				result.addLog(line)
 			line = stderr.readline()
+		timeline.end(stageEvent)
 
 	def _engineSettings(self, extruderCount):
 		settings = {
@@ -552,3 +1361,61 @@ class Engine(object):
 			kwargs['startupinfo'] = su
 			kwargs['creationflags'] = 0x00004000 #BELOW_NORMAL_PRIORITY_CLASS
 		return subprocess.Popen(cmdList, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+
+def _benchmarkPolygonStream(useUnixSocket, layerCount = 200, polygonsPerLayer = 400, pointsPerPolygon = 30):
+	"""
+	Measure how fast polygons from the engine are received. A thread acts as the engine and sends synthetic layers,
+	which are received by the normal socket connection code of the Engine class.
+	"""
+	engine = Engine(lambda progress: None)
+	engine._result = EngineResult()
+
+	polygon = numpy.arange(0, pointsPerPolygon * 2, dtype=numpy.int64) * 1000
+	packets = []
+	for layerNr in xrange(0, layerCount):
+		packet = [struct.pack('@iiiii', Engine.GUI_CMD_SEND_POLYGONS, polygonsPerLayer, layerNr, layerNr * 100, len('inset0')), 'inset0']
+		for n in xrange(0, polygonsPerLayer):
+			packet.append(struct.pack('@i', pointsPerPolygon))
+			packet.append(polygon.tostring())
+		packets.append(''.join(packet))
+	totalSize = sum(map(len, packets))
+
+	if useUnixSocket:
+		engineSock, guiSock = socket.socketpair()
+	else:
+		listenSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		listenSock.bind(('127.0.0.1', 0))
+		listenSock.listen(1)
+		engineSock = socket.create_connection(listenSock.getsockname())
+		guiSock, _ = listenSock.accept()
+		listenSock.close()
+
+	def sendThread():
+		for packet in packets:
+			engineSock.sendall(packet)
+		engineSock.close()
+	thread = threading.Thread(target=sendThread)
+	thread.daemon = True
+
+	t = time.time()
+	thread.start()
+	engine._socketConnectionThread(guiSock)
+	t = time.time() - t
+	thread.join()
+	engine.cleanup()
+
+	polygonCount = layerCount * polygonsPerLayer
+	polygons = engine._result._polygons
+	received = polygons.getPolygonCount()
+	if received != polygonCount:
+		print 'Only received %d of %d polygons' % (received, polygonCount)
+	print '%s: %.1f MB/s, %d polygons/s' % ('Unix socket' if useUnixSocket else 'TCP', totalSize / t / 1024 / 1024, polygonCount / t)
+	#Compare with storing each polygon as a separate (n, 3) float32 array, with the Z height for every point.
+	polygons.compact()
+	arraySize = polygons.getPointCount() * 12 + received * (sys.getsizeof(numpy.zeros((2, 3), numpy.float32)[0:1]) + 8)
+	print 'Polygon memory: %.1f MB, %.1f MB as separate arrays' % (polygons.getMemoryUsage() / 1024.0 / 1024.0, arraySize / 1024.0 / 1024.0)
+
+if __name__ == '__main__':
+	_benchmarkPolygonStream(False)
+	if hasattr(socket, 'socketpair'):
+		_benchmarkPolygonStream(True)
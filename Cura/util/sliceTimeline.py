@@ -0,0 +1,101 @@
+"""
+The sliceTimeline module records where the time of a slice goes.
+A timeline holds timed events, like the engine process start, the mesh transfer and each engine stage.
+It can be exported as JSON, or in the Chrome trace format which can be viewed with chrome://tracing.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import time
+import json
+
+class SliceTimeline(object):
+	"""
+	A list of timed events of a single slice.
+	Each event has a name, a category, a start time, an end time (None for events that did not end yet) and optional arguments.
+	Events can be added from multiple threads.
+	"""
+	def __init__(self, startTime = None):
+		if startTime is None:
+			startTime = time.time()
+		self._startTime = startTime
+		self._events = []
+
+	def getStartTime(self):
+		return self._startTime
+
+	def begin(self, name, category, args = None):
+		"""
+		Start a new event at the current time.
+		:return: The event, pass this to end() when the event is done.
+		"""
+		return self.addEvent(name, category, time.time(), None, args)
+
+	def end(self, event, args = None):
+		if event is None:
+			return
+		event['end'] = time.time()
+		if args is not None:
+			event['args'].update(args)
+
+	def addEvent(self, name, category, start, end = None, args = None):
+		"""
+		Add an event with a known start and end time.
+		:return: The event.
+		"""
+		if args is None:
+			args = {}
+		event = {'name': name, 'category': category, 'start': start, 'end': end, 'args': args}
+		self._events.append(event)
+		return event
+
+	def getEvents(self):
+		return sorted(self._events, key=lambda e: e['start'])
+
+	def getTotalTime(self, name):
+		""" :return: The total time in seconds of all finished events with the given name. """
+		total = 0.0
+		for event in self._events:
+			if event['name'] == name and event['end'] is not None:
+				total += event['end'] - event['start']
+		return total
+
+	def toJSON(self):
+		"""
+		:return: The events as a list of dictionaries, with the start and duration in seconds relative to the start of the slice.
+		"""
+		ret = []
+		for event in self.getEvents():
+			duration = None
+			if event['end'] is not None:
+				duration = event['end'] - event['start']
+			ret.append({'name': event['name'], 'category': event['category'], 'start': event['start'] - self._startTime, 'duration': duration, 'args': event['args']})
+		return ret
+
+	def toChromeTrace(self):
+		"""
+		:return: The events in the Chrome trace event format. Each category is shown as a separate thread.
+		"""
+		categories = []
+		traceEvents = []
+		for event in self.getEvents():
+			if event['category'] not in categories:
+				categories.append(event['category'])
+				traceEvents.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': len(categories), 'args': {'name': event['category']}})
+			traceEvent = {'name': event['name'], 'cat': event['category'], 'pid': 1, 'tid': categories.index(event['category']) + 1,
+				'ts': int((event['start'] - self._startTime) * 1000000), 'args': event['args']}
+			if event['end'] is None:
+				traceEvent['ph'] = 'i'
+				traceEvent['s'] = 't'
+			else:
+				traceEvent['ph'] = 'X'
+				traceEvent['dur'] = int((event['end'] - event['start']) * 1000000)
+			traceEvents.append(traceEvent)
+		return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+	def saveJSON(self, filename):
+		with open(filename, "w") as f:
+			json.dump(self.toJSON(), f, indent=1)
+
+	def saveChromeTrace(self, filename):
+		with open(filename, "w") as f:
+			json.dump(self.toChromeTrace(), f)